@@ -0,0 +1,186 @@
+# backend/log_handlers.py
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.utils.log import AdminEmailHandler
+
+
+def _handler_by_name(name):
+    get_handler = getattr(logging, 'getHandlerByName', None)  # Python 3.12+
+    if get_handler is not None:
+        return get_handler(name)
+    return logging._handlers.get(name)
+
+
+class BackgroundHandler(logging.Handler):
+    """
+    Hand records to a bounded in-memory queue and let a listener thread
+    write them to the named handlers (files, admin mail), so slow I/O never
+    runs on the request thread. When the queue is full, records are dropped
+    and counted instead of blocking the request.
+
+    The listener is started on first use in each process, so it survives
+    forking servers: a worker forked from the master gets its own queue and
+    thread instead of a copy of the master's stopped one.
+
+        'security_queue': {
+            'class': 'backend.log_handlers.BackgroundHandler',
+            'targets': ['security_file', 'mail_admins'],
+        }
+
+    Targets are looked up when the handler is built, and dictConfig builds
+    handlers in name order, so their names must sort before this handler's.
+    (Not a QueueHandler subclass: Python 3.12+ dictConfig rewrites the
+    configuration of those.)
+    """
+
+    def __init__(self, targets, maxsize=10000):
+        super().__init__()
+        self.targets = []
+        for name in targets:
+            handler = name if isinstance(name, logging.Handler) else _handler_by_name(name)
+            if handler is None:
+                raise ValueError(f'Log handler {name!r} is not configured (its name must sort before this one)')
+            # Only referenced from here: keeps them alive once dictConfig is done
+            self.targets.append(handler)
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.queue = None
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._start_lock:
+            if self._pid == pid:
+                return
+            self.queue = queue.Queue(self.maxsize)
+            self._listener = logging.handlers.QueueListener(
+                self.queue, *self.targets, respect_handler_level=True,
+            )
+            self._listener.start()
+            self._pid = pid
+
+    def prepare(self, record):
+        # Same process, so the record keeps its exc_info and request for the
+        # target handlers; only the message is rendered now, while its
+        # arguments still hold their current values
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def emit(self, record):
+        try:
+            self._ensure_listener()
+            self.queue.put_nowait(self.prepare(record))
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        # Drains the queue into the targets before logging shuts them down
+        with self._start_lock:
+            if self._listener is not None and self._pid == os.getpid():
+                self._listener.stop()
+            self._listener = None
+            self._pid = None
+        super().close()
+
+
+# Attributes every LogRecord has; anything else was passed with extra=
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'request'}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: timestamp, level, logger, message, any
+    extra= fields, the request's method and path when Django attached the
+    request, and the formatted traceback for exceptions.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+
+        request = getattr(record, 'request', None)
+        if request is not None and hasattr(request, 'path'):
+            entry['method'] = request.method
+            entry['path'] = request.path
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SampleFilter(logging.Filter):
+    """
+    Keep every WARNING and above but only a `rate` fraction (0-1) of
+    records at or below `level`, for high-volume INFO logs. Sampled-out
+    records are never formatted.
+    """
+
+    def __init__(self, rate=1.0, level='INFO'):
+        super().__init__()
+        self.rate = float(rate)
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+
+    def filter(self, record):
+        if record.levelno > self.level or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+class ThrottledAdminEmailHandler(AdminEmailHandler):
+    """
+    AdminEmailHandler that sends at most `max_emails` per `interval`
+    seconds from each process. Records over the budget are counted and the
+    count is reported in the subject of the next email that goes out.
+    """
+
+    def __init__(self, max_emails=5, interval=300, **kwargs):
+        super().__init__(**kwargs)
+        self.max_emails = max_emails
+        self.interval = interval
+        self._window_started = 0.0
+        self._sent = 0
+        self.suppressed = 0
+        self._budget_lock = threading.Lock()
+
+    def emit(self, record):
+        with self._budget_lock:
+            now = time.monotonic()
+            if now - self._window_started >= self.interval:
+                self._window_started = now
+                self._sent = 0
+            if self._sent >= self.max_emails:
+                self.suppressed += 1
+                return
+            self._sent += 1
+            suppressed, self.suppressed = self.suppressed, 0
+
+        if suppressed:
+            record = copy.copy(record)
+            record.msg = f'{record.getMessage()} ({suppressed} earlier messages not emailed)'
+            record.args = None
+        super().emit(record)
@@ -0,0 +1,15 @@
+# backend/redis_client.py
+from django.conf import settings
+
+
+def get_redis_connection():
+    """
+    Raw Redis client behind the default cache, for operations the Django
+    cache API cannot express (hashes, Lua scripts, pipelines).
+    Returns None when running on the local-memory cache fallback.
+    """
+    if not settings.REDIS_URL:
+        return None
+
+    from django_redis import get_redis_connection as django_redis_connection
+    return django_redis_connection('default')
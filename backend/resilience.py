@@ -0,0 +1,172 @@
+# backend/resilience.py
+import threading
+import time
+from collections import deque
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency while its circuit is open"""
+
+    def __init__(self, name, retry_after):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f'{name} is unavailable, retry in {retry_after:.0f}s')
+
+
+class CircuitBreaker:
+    """
+    Per-process circuit breaker for an outbound dependency.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    calls fail fast with CircuitOpenError for `reset_timeout` seconds. Then
+    a single trial call is let through (half-open); its outcome closes the
+    circuit again or re-opens it for another `reset_timeout`.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and self._remaining() <= 0:
+                return self.HALF_OPEN
+            return self._state
+
+    def _remaining(self):
+        return self._opened_at + self.reset_timeout - time.monotonic()
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go out now"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            remaining = self._remaining()
+            if remaining > 0 or self._trial_running:
+                raise CircuitOpenError(self.name, max(remaining, 1))
+            self._state = self.HALF_OPEN
+            self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def snapshot(self):
+        state = self.state
+        with self._lock:
+            return {
+                'state': state,
+                'consecutive_failures': self._failures,
+                'retry_in': round(max(self._remaining(), 0), 1) if state == self.OPEN else 0,
+            }
+
+
+class CallStats:
+    """
+    Thread-safe call counters and recent latencies per operation, for
+    health endpoints. Keeps the last `window` latencies of each operation.
+    """
+
+    def __init__(self, window=500):
+        self.window = window
+        self._operations = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation, seconds, error=None):
+        with self._lock:
+            stats = self._operations.get(operation)
+            if stats is None:
+                stats = self._operations[operation] = {
+                    'calls': 0, 'errors': {}, 'latencies': deque(maxlen=self.window),
+                }
+            stats['calls'] += 1
+            stats['latencies'].append(seconds)
+            if error:
+                stats['errors'][error] = stats['errors'].get(error, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            operations = {
+                name: (stats['calls'], dict(stats['errors']), sorted(stats['latencies']))
+                for name, stats in self._operations.items()
+            }
+
+        result = {}
+        for name, (calls, errors, latencies) in operations.items():
+            result[name] = {
+                'calls': calls,
+                'errors': errors,
+                'p50_ms': _percentile_ms(latencies, 0.50),
+                'p95_ms': _percentile_ms(latencies, 0.95),
+                'max_ms': _percentile_ms(latencies, 1.0),
+            }
+        return result
+
+
+def _percentile_ms(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(int(len(sorted_values) * fraction), len(sorted_values) - 1)
+    return round(sorted_values[index] * 1000, 1)
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls with the same key inside one process: the
+    first caller runs the function, the others wait and share its result
+    (or its exception).
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
@@ -1,5 +1,6 @@
 # backend/settings.py
 import os
+from decimal import Decimal
 from pathlib import Path
 from decouple import config
 import dj_database_url
@@ -69,6 +70,7 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'users.User'
 
 MIDDLEWARE = [
+    'health.middleware.MetricsMiddleware',  # first, so it times the whole stack
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -78,6 +80,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'users.middleware.RequestLoggingMiddleware',  # before rate limiting, so refused probes are logged too
     'users.middleware.RateLimitMiddleware',
 ]
 
@@ -122,6 +125,37 @@ DATABASES = {
 
 
 
+# ============================================================================
+# CACHE CONFIGURATION - REDIS IN PRODUCTION, LOCAL MEMORY FALLBACK
+# ============================================================================
+# Idempotency keys, rate limits and token caches must be shared by all
+# workers, so production should always set REDIS_URL.
+REDIS_URL = config('REDIS_URL', default='')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'health.cache.InstrumentedRedisCache',  # django-redis plus hit/miss metrics
+            'LOCATION': REDIS_URL,
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            },
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'health.cache.InstrumentedLocMemCache',
+        }
+    }
+
+# Each worker publishes its metrics to Redis this often for /health/metrics/
+METRICS_PUBLISH_INTERVAL = config('METRICS_PUBLISH_INTERVAL', default=15, cast=int)  # seconds
+# /health/metrics/ answers scrapers that send "Authorization: Bearer <METRICS_TOKEN>"
+# or connect from METRICS_ALLOWED_IPS (comma separated); with neither set it is closed
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+METRICS_ALLOWED_IPS = [ip for ip in config('METRICS_ALLOWED_IPS', default='').split(',') if ip]
+
 # Password Hashing - Use Argon2 for better security
 PASSWORD_HASHERS = [
     'django.contrib.auth.hashers.Argon2PasswordHasher',
@@ -152,8 +186,8 @@ REST_FRAMEWORK = {
         'rest_framework.renderers.JSONRenderer',
     ],
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle',
+        'users.throttling.AnonRateThrottle',
+        'users.throttling.UserRateThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': config('THROTTLE_ANON', default='100/hour'),
@@ -162,6 +196,12 @@ REST_FRAMEWORK = {
     'EXCEPTION_HANDLER': 'users.exceptions.custom_exception_handler',
 }
 
+# Rate limits are counted in Redis; each worker leases up to this many
+# requests per client at once and spends them locally (1 = every request
+# goes to Redis, exact but one round-trip each)
+RATE_LIMIT_LOCAL_BATCH = config('RATE_LIMIT_LOCAL_BATCH', default=10, cast=int)
+RATE_LIMIT_LOCAL_MAX_AGE = config('RATE_LIMIT_LOCAL_MAX_AGE', default=1.0, cast=float)  # seconds a lease may be held
+
 # Internationalization
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = config('TIME_ZONE', default='UTC')
@@ -216,12 +256,57 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CLERK_SECRET_KEY = config('CLERK_SECRET_KEY')
 CLERK_PUBLISHABLE_KEY = config('CLERK_PUBLISHABLE_KEY')
 CLERK_API_URL = 'https://api.clerk.com/v1'
+# Session tokens are verified locally against Clerk's JWKS; /tokens/verify is only a fallback
+CLERK_JWKS_URL = config('CLERK_JWKS_URL', default=f'{CLERK_API_URL}/jwks')
+CLERK_JWT_KEY = config('CLERK_JWT_KEY', default='').replace('\\n', '\n')  # optional PEM public key, skips the JWKS fetch
+CLERK_JWKS_TTL = config('CLERK_JWKS_TTL', default=3600, cast=int)
+CLERK_JWKS_MIN_REFRESH = config('CLERK_JWKS_MIN_REFRESH', default=30, cast=int)  # rate limit refetches for unknown kids
+CLERK_JWT_LEEWAY = config('CLERK_JWT_LEEWAY', default=5, cast=int)  # seconds of clock skew
+CLERK_TOKEN_CACHE_MAX_TTL = config('CLERK_TOKEN_CACHE_MAX_TTL', default=300, cast=int)  # verified tokens, never past exp
+CLERK_TOKEN_REJECT_TTL = config('CLERK_TOKEN_REJECT_TTL', default=30, cast=int)  # negative cache for bad tokens
+CLERK_VERIFY_LOCK_TIMEOUT = config('CLERK_VERIFY_LOCK_TIMEOUT', default=5, cast=int)  # cross-worker single-flight wait
+CLERK_STALE_IDENTITY_TTL = config('CLERK_STALE_IDENTITY_TTL', default=900, cast=int)  # served while Clerk is down
+CLERK_TIMEOUT = config('CLERK_TIMEOUT', default=5.0, cast=float)
+CLERK_POOL_SIZE = config('CLERK_POOL_SIZE', default=10, cast=int)
+CLERK_BREAKER_FAILURES = config('CLERK_BREAKER_FAILURES', default=5, cast=int)
+CLERK_BREAKER_RESET = config('CLERK_BREAKER_RESET', default=30, cast=int)  # seconds
+CLERK_PROFILE_SYNC_INTERVAL = config('CLERK_PROFILE_SYNC_INTERVAL', default=6 * 3600, cast=int)  # seconds, 0 disables
+CLERK_WEBHOOK_COALESCE_WINDOW = config('CLERK_WEBHOOK_COALESCE_WINDOW', default=2.0, cast=float)  # seconds, 0 applies user.updated inline
+CLERK_WEBHOOK_LOG_MAX_CHARS = config('CLERK_WEBHOOK_LOG_MAX_CHARS', default=1000, cast=int)  # redacted payload in logs
+USER_IDENTITY_CACHE_TTL = config('USER_IDENTITY_CACHE_TTL', default=900, cast=int)  # clerk_id -> user identity
+CLERK_AUTHORIZED_PARTIES = [party for party in config('CLERK_AUTHORIZED_PARTIES', default='').split(',') if party]
 
 # Stripe Configuration
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY')
 STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY')
 STRIPE_WEBHOOK_SECRET = config('STRIPE_WEBHOOK_SECRET')
 STRIPE_API_VERSION = '2023-10-16'
+STRIPE_API_BASE = config('STRIPE_API_BASE', default='')  # e.g. http://localhost:12111 for stripe-mock
+STRIPE_CONNECT_TIMEOUT = config('STRIPE_CONNECT_TIMEOUT', default=3.0, cast=float)
+STRIPE_TIMEOUT = config('STRIPE_TIMEOUT', default=10.0, cast=float)
+STRIPE_MAX_NETWORK_RETRIES = config('STRIPE_MAX_NETWORK_RETRIES', default=2, cast=int)
+STRIPE_POOL_SIZE = config('STRIPE_POOL_SIZE', default=10, cast=int)
+STRIPE_BREAKER_FAILURES = config('STRIPE_BREAKER_FAILURES', default=5, cast=int)
+STRIPE_BREAKER_RESET = config('STRIPE_BREAKER_RESET', default=30, cast=int)  # seconds
+STRIPE_INBOX_MAX_LAG = config('STRIPE_INBOX_MAX_LAG', default=300, cast=int)  # seconds before /health/stripe/ fails
+PAYMENT_INTENT_CACHE_TTL = config('PAYMENT_INTENT_CACHE_TTL', default=3600, cast=int)  # client secrets per order
+
+# Idempotency-Key support for order creation and payment intents
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', default=86400, cast=int)  # 24 hours
+IDEMPOTENCY_LOCK_TIMEOUT = config('IDEMPOTENCY_LOCK_TIMEOUT', default=30, cast=int)
+
+# Unpaid orders hold their stock for this long before the sweeper releases it
+ORDER_RESERVATION_TTL_MINUTES = config('ORDER_RESERVATION_TTL_MINUTES', default=30, cast=int)
+
+# Pricing fallbacks when no ShippingRate/TaxRate row matches the destination
+DEFAULT_SHIPPING_COST = config('DEFAULT_SHIPPING_COST', default='10.00', cast=Decimal)
+DEFAULT_TAX_RATE = config('DEFAULT_TAX_RATE', default='0.08', cast=Decimal)
+QUOTE_TTL = config('QUOTE_TTL', default=900, cast=int)  # 15 minutes
+CART_TTL = config('CART_TTL', default=60 * 60 * 24 * 30, cast=int)  # 30 days since last change
+
+# Order number generator worker id (0-1023). Leave unset to allocate one per
+# process from the shared cache.
+ORDER_NUMBER_WORKER_ID = config('ORDER_NUMBER_WORKER_ID', default='', cast=lambda v: int(v) if v else None)
 
 # Google API Configuration
 GOOGLE_DEVELOPER_KEY = config('GOOGLE_DEVELOPER_KEY', default='')
@@ -245,6 +330,13 @@ ADMINS = [
 MANAGERS = ADMINS
 
 # Logging Configuration
+# Every logger writes through a queue: the request thread only enqueues a
+# record and a per-worker listener thread formats and writes it (see
+# backend/log_handlers.py). Files are JSON lines; LOG_FORMAT picks the
+# console format.
+LOG_FORMAT = config('LOG_FORMAT', default='verbose' if DEBUG else 'json')  # verbose | json
+LOG_INFO_SAMPLE_RATE = config('LOG_INFO_SAMPLE_RATE', default=1.0, cast=float)  # fraction of INFO logs kept
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -258,6 +350,9 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'backend.log_handlers.JsonFormatter',
+        },
     },
     'filters': {
         'require_debug_false': {
@@ -266,12 +361,16 @@ LOGGING = {
         'require_debug_true': {
             '()': 'django.utils.log.RequireDebugTrue',
         },
+        'sample_info': {
+            '()': 'backend.log_handlers.SampleFilter',
+            'rate': LOG_INFO_SAMPLE_RATE,
+        },
     },
     'handlers': {
         'console': {
             'level': 'INFO',
             'class': 'logging.StreamHandler',
-            'formatter': 'verbose',
+            'formatter': LOG_FORMAT,
         },
         'file': {
             'level': 'ERROR',
@@ -279,7 +378,7 @@ LOGGING = {
             'filename': BASE_DIR / 'logs' / 'django.log',
             'maxBytes': 1024 * 1024 * 10,  # 10MB
             'backupCount': 10,
-            'formatter': 'verbose',
+            'formatter': 'json',
             'filters': ['require_debug_false'],
         },
         'security_file': {
@@ -288,49 +387,61 @@ LOGGING = {
             'filename': BASE_DIR / 'logs' / 'security.log',
             'maxBytes': 1024 * 1024 * 10,
             'backupCount': 10,
-            'formatter': 'verbose',
+            'formatter': 'json',
         },
         'mail_admins': {
             'level': 'ERROR',
-            'class': 'django.utils.log.AdminEmailHandler',
+            'class': 'backend.log_handlers.ThrottledAdminEmailHandler',
+            'max_emails': 5,  # per process per interval; the rest are counted
+            'interval': 300,
             'filters': ['require_debug_false'],
             'formatter': 'verbose',
         },
+        # Queues in front of the handlers above; loggers only use these
+        'queue': {
+            'class': 'backend.log_handlers.BackgroundHandler',
+            'targets': ['console', 'file'],
+            'filters': ['sample_info'],
+        },
+        'security_queue': {
+            'class': 'backend.log_handlers.BackgroundHandler',
+            'targets': ['security_file', 'mail_admins'],
+        },
     },
     'loggers': {
         'django': {
-            'handlers': ['console', 'file'],
+            'handlers': ['queue'],
             'level': 'INFO',
             'propagate': False,
         },
         'django.security': {
-            'handlers': ['security_file', 'mail_admins'],
+            'handlers': ['security_queue'],
             'level': 'WARNING',
             'propagate': False,
         },
         'django.db.backends': {
-            'handlers': ['console'],
+            'handlers': ['queue'],
             'level': 'ERROR' if not DEBUG else 'DEBUG',
             'propagate': False,
         },
         'users': {
-            'handlers': ['console', 'file'],
+            'handlers': ['queue'],
             'level': 'INFO',
             'propagate': False,
         },
         'orders': {
-            'handlers': ['console', 'file'],
+            'handlers': ['queue'],
             'level': 'INFO',
             'propagate': False,
         },
         'payments': {
-            'handlers': ['console', 'file'],
+            'handlers': ['queue'],
             'level': 'INFO',
             'propagate': False,
         },
     },
     'root': {
-        'handlers': ['console', 'file'],
+        'handlers': ['queue'],
         'level': 'INFO',
     },
 }
@@ -0,0 +1,180 @@
+# backend/tests.py
+import logging
+import random
+import threading
+import time
+from unittest import mock
+
+from django.core import mail
+from django.test import SimpleTestCase, override_settings
+
+from .log_handlers import BackgroundHandler, SampleFilter, ThrottledAdminEmailHandler
+from .resilience import CircuitBreaker, CircuitOpenError, SingleFlight
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('backend.resilience.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker('clerk', failure_threshold=2, reset_timeout=30)
+
+    def open_circuit(self):
+        for _ in range(2):
+            self.breaker.before_call()
+            self.breaker.record_failure()
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.before_call()
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+        self.open_circuit()
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.clock.now += 10
+        with self.assertRaises(CircuitOpenError) as raised:
+            self.breaker.before_call()
+        self.assertEqual(raised.exception.retry_after, 20)
+
+    def test_half_open_lets_one_trial_through_and_recovers(self):
+        self.open_circuit()
+        self.clock.now += 30
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.breaker.before_call()
+
+    def test_failed_trial_reopens(self):
+        self.open_circuit()
+        self.clock.now += 30
+
+        self.breaker.before_call()
+        self.breaker.record_failure()
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(self.breaker.snapshot()['retry_in'], 30)
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        calls = []
+        results = []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'user_1'
+
+        threads = [threading.Thread(target=lambda: results.append(flight.do('key', slow))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        started.wait(5)
+        time.sleep(0.1)  # let the other callers join the flight
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ['user_1'] * 5)
+        self.assertEqual(len(calls), 1)
+
+
+class CollectingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def log_record(message='event %s', args=(1,), level=logging.INFO):
+    return logging.makeLogRecord({'msg': message, 'args': args, 'levelno': level,
+                                  'levelname': logging.getLevelName(level)})
+
+
+class BackgroundHandlerTests(SimpleTestCase):
+    def test_close_flushes_queued_records(self):
+        target = CollectingHandler()
+        handler = BackgroundHandler([target])
+
+        for number in range(100):
+            handler.emit(log_record(args=(number,)))
+        handler.close()
+
+        self.assertEqual([record.getMessage() for record in target.records],
+                         [f'event {number}' for number in range(100)])
+
+    def test_message_is_rendered_when_logged(self):
+        target = CollectingHandler()
+        handler = BackgroundHandler([target])
+        state = ['before']
+
+        handler.emit(log_record('state %s', (state,)))
+        state[0] = 'after'
+        handler.close()
+
+        self.assertEqual(target.records[0].getMessage(), "state ['before']")
+
+    def test_unknown_target_is_rejected(self):
+        with self.assertRaises(ValueError):
+            BackgroundHandler(['no_such_handler'])
+
+
+class SampleFilterTests(SimpleTestCase):
+    @mock.patch('backend.log_handlers.random', random.Random(0))
+    def test_keeps_about_rate_of_info_records(self):
+        sample = SampleFilter(rate=0.25)
+
+        kept = sum(sample.filter(log_record()) for _ in range(10000))
+
+        self.assertAlmostEqual(kept / 10000, 0.25, delta=0.02)
+
+    def test_warnings_are_always_kept(self):
+        sample = SampleFilter(rate=0)
+
+        self.assertFalse(sample.filter(log_record()))
+        self.assertTrue(sample.filter(log_record(level=logging.WARNING)))
+        self.assertTrue(sample.filter(log_record(level=logging.ERROR)))
+
+
+@override_settings(ADMINS=[('Admin', 'admin@example.com')])
+class ThrottledAdminEmailHandlerTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('backend.log_handlers.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.handler = ThrottledAdminEmailHandler(max_emails=2, interval=300)
+
+    def test_emails_over_budget_are_counted_not_sent(self):
+        for _ in range(5):
+            self.handler.emit(log_record('failure', (), logging.ERROR))
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(self.handler.suppressed, 3)
+
+        self.clock.now += 300
+        self.handler.emit(log_record('failure', (), logging.ERROR))
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertIn('3 earlier messages not emailed', mail.outbox[-1].subject)
+        self.assertEqual(self.handler.suppressed, 0)
@@ -7,8 +7,8 @@ from django.views.generic import RedirectView
 from rest_framework.routers import DefaultRouter
 from products.views import CategoryViewSet, ProductViewSet
 from users.views import UserViewSet, AddressViewSet
-from orders.views import OrderViewSet
-from payments.views import stripe_webhook
+from orders.views import OrderViewSet, CartViewSet
+from payments.views import stripe_webhook, create_payment_intent
 from users.webhooks import clerk_webhook
 
 # API Router
@@ -18,6 +18,7 @@ router.register(r'products', ProductViewSet, basename='product')
 router.register(r'users', UserViewSet, basename='user')
 router.register(r'addresses', AddressViewSet, basename='address')
 router.register(r'orders', OrderViewSet, basename='order')
+router.register(r'cart', CartViewSet, basename='cart')
 
 # URL Patterns
 urlpatterns = [
@@ -26,6 +27,7 @@ urlpatterns = [
     
     # API endpoints
     path('api/', include(router.urls)),
+    path('api/payments/intent/', create_payment_intent, name='payment-intent'),
     
     # Webhooks
     path('api/webhooks/stripe/', stripe_webhook, name='stripe-webhook'),
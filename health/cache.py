@@ -0,0 +1,39 @@
+# health/cache.py
+from django.core.cache.backends.locmem import LocMemCache
+
+from .metrics import registry
+
+_MISSING = object()
+
+
+class InstrumentedCacheMixin:
+    """Count cache hits and misses of get() in the metrics registry"""
+
+    def get(self, key, default=None, version=None, **kwargs):
+        value = super().get(key, _MISSING, version=version, **kwargs)
+        if value is _MISSING:
+            registry.inc('cache_requests_total', {'result': 'miss'})
+            return default
+        registry.inc('cache_requests_total', {'result': 'hit'})
+        return value
+
+
+class InstrumentedLocMemCache(InstrumentedCacheMixin, LocMemCache):
+    # BaseCache.get_many() goes through get(), so it is counted already
+    pass
+
+
+try:
+    from django_redis.cache import RedisCache
+except ImportError:  # only needed when REDIS_URL is set
+    RedisCache = None
+else:
+    class InstrumentedRedisCache(InstrumentedCacheMixin, RedisCache):
+        def get_many(self, keys, *args, **kwargs):
+            keys = list(keys)
+            found = super().get_many(keys, *args, **kwargs)
+            if found:
+                registry.inc('cache_requests_total', {'result': 'hit'}, len(found))
+            if len(found) < len(keys):
+                registry.inc('cache_requests_total', {'result': 'miss'}, len(keys) - len(found))
+            return found
@@ -0,0 +1,316 @@
+# health/metrics.py
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from backend.redis_client import get_redis_connection
+from backend.resilience import CallStats
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'http_requests_total': ('counter', 'HTTP requests by route, method and status class', None),
+    'http_request_duration_seconds': ('histogram', 'HTTP request latency by route and method', LATENCY_BUCKETS),
+    'http_request_db_queries': ('histogram', 'Database queries per HTTP request', QUERY_COUNT_BUCKETS),
+    'db_queries_total': ('counter', 'Database queries run while serving requests', None),
+    'db_query_seconds_total': ('counter', 'Time spent in database queries while serving requests', None),
+    'cache_requests_total': ('counter', 'Cache lookups by result (hit or miss)', None),
+    'outbound_request_duration_seconds': ('histogram', 'Clerk and Stripe API call latency', LATENCY_BUCKETS),
+    'outbound_request_errors_total': ('counter', 'Failed Clerk and Stripe API calls by error', None),
+}
+
+HTTP_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+class Registry:
+    """
+    In-process counters and histograms keyed by metric name and labels.
+    Each update is a dict lookup and an add under one lock; rendering and
+    merging with other workers happens only when /health/metrics/ is read.
+    """
+
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, labels, amount=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        # Per-bucket (not cumulative) counts, then sum and count
+        index = bisect_left(buckets, value)
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [0] * (len(buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self):
+        """JSON-serializable copy: {'counters': [...], 'histograms': [...]}"""
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, list(labels), list(series)] for (name, labels), series in self._histograms.items()],
+            }
+
+
+registry = Registry()
+
+
+class MeteredCallStats(CallStats):
+    """CallStats for an outbound service that also feeds the metrics registry"""
+
+    def __init__(self, service, window=500):
+        super().__init__(window)
+        self.service = service
+
+    def record(self, operation, seconds, error=None):
+        super().record(operation, seconds, error)
+        labels = {'service': self.service, 'operation': operation}
+        registry.observe('outbound_request_duration_seconds', labels, seconds)
+        if error:
+            registry.inc('outbound_request_errors_total', {**labels, 'error': error})
+
+
+def record_request(route, method, status, seconds, queries, query_seconds):
+    labels = {'route': route, 'method': method if method in HTTP_METHODS else 'other'}
+    registry.inc('http_requests_total', {**labels, 'status': f'{status // 100}xx'})
+    registry.observe('http_request_duration_seconds', labels, seconds)
+    registry.observe('http_request_db_queries', labels, queries)
+    if queries:
+        registry.inc('db_queries_total', labels, queries)
+        registry.inc('db_query_seconds_total', labels, query_seconds)
+
+
+# --- merging across workers --------------------------------------------------
+
+WORKERS_KEY = 'metrics:workers'
+# Merged final snapshots of workers that have gone away
+RETIRED_KEY = 'metrics:retired'
+RETIRE_LOCK_KEY = 'metrics:retiring'
+
+_publisher_pid = None
+_publisher_lock = threading.Lock()
+_published_pid = None
+
+
+def current_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def worker_key(worker_id):
+    return f'metrics:worker:{worker_id}'
+
+
+def alive_key(worker_id):
+    return f'metrics:alive:{worker_id}'
+
+
+def publish(redis=None):
+    """
+    Store this worker's snapshot in Redis for the other workers to merge.
+    The snapshot itself never expires; a separate liveness key does, and a
+    worker whose liveness key is gone is folded into the retired totals.
+    """
+    global _published_pid
+
+    redis = redis or get_redis_connection()
+    if redis is None:
+        return
+    pid = os.getpid()
+    worker_id = current_worker_id()
+    key = worker_key(worker_id)
+
+    pipe = redis.pipeline()
+    # After the first publish the key must still exist (XX): if it is gone
+    # the worker stalled long enough to be retired
+    pipe.set(key, json.dumps(registry.snapshot()), xx=_published_pid == pid)
+    pipe.set(alive_key(worker_id), 1, ex=settings.METRICS_PUBLISH_INTERVAL * 6)
+    pipe.sadd(WORKERS_KEY, worker_id)
+    stored = pipe.execute()[0]
+    _published_pid = pid
+
+    if not stored:
+        # Those totals are already counted as retired; start over instead of
+        # publishing them a second time
+        logger.warning('Metrics of worker %s were retired while it was alive; resetting them', worker_id)
+        registry.reset()
+        redis.set(key, json.dumps(registry.snapshot()))
+
+
+def retire(redis, worker_ids):
+    """
+    Fold the last snapshots of dead workers into RETIRED_KEY, like
+    prometheus_client's multiprocess mode keeps the files of dead processes,
+    so counters don't step down when a worker is recycled. The merge and the
+    removal of the worker keys are one MULTI, so readers see either.
+    """
+    if not redis.set(RETIRE_LOCK_KEY, 1, nx=True, ex=30):
+        return
+    try:
+        keys = [worker_key(worker_id) for worker_id in worker_ids]
+        payloads = redis.mget([RETIRED_KEY] + keys)
+        snapshots = [json.loads(payload) for payload in payloads if payload is not None]
+        pipe = redis.pipeline(transaction=True)
+        pipe.set(RETIRED_KEY, json.dumps(unmerge(*merge(snapshots))))
+        pipe.delete(*keys)
+        pipe.srem(WORKERS_KEY, *worker_ids)
+        pipe.execute()
+    finally:
+        redis.delete(RETIRE_LOCK_KEY)
+
+
+def _worker_ids(redis):
+    return sorted(member.decode() if isinstance(member, bytes) else member
+                  for member in redis.smembers(WORKERS_KEY))
+
+
+def retire_dead_workers(redis=None):
+    """Retire every published worker whose liveness key has expired"""
+    redis = redis or get_redis_connection()
+    if redis is None:
+        return
+    worker_ids = _worker_ids(redis)
+    alive = redis.mget([alive_key(worker_id) for worker_id in worker_ids]) if worker_ids else []
+    dead = [worker_id for worker_id, flag in zip(worker_ids, alive) if flag is None]
+    if dead:
+        retire(redis, dead)
+
+
+def _publish_forever():
+    while True:
+        time.sleep(settings.METRICS_PUBLISH_INTERVAL)
+        try:
+            publish()
+            retire_dead_workers()
+        except Exception as e:
+            logger.warning('Publishing metrics failed: %s', e)
+
+
+def start_publisher():
+    """
+    Start this worker's publisher thread (once per process, so forked
+    gunicorn workers each get one). No-op without Redis.
+    """
+    global _publisher_pid
+
+    pid = os.getpid()
+    if _publisher_pid == pid:
+        return
+    with _publisher_lock:
+        if _publisher_pid == pid:
+            return
+        _publisher_pid = pid
+        if get_redis_connection() is not None:
+            threading.Thread(target=_publish_forever, name='metrics-publisher', daemon=True).start()
+
+
+def collect():
+    """
+    Snapshots of every worker (this one fresh, the others as of their last
+    publish), plus the retired totals of workers that have gone away, so
+    totals only grow across worker restarts. Read-only: publishing and
+    retiring happen in the publisher threads, never on a scrape.
+    """
+    redis = get_redis_connection()
+    if redis is None:
+        return [registry.snapshot()]
+
+    keys = [RETIRED_KEY] + [worker_key(worker_id) for worker_id in _worker_ids(redis)]
+    # One read, so a concurrent retire is seen either entirely or not at all
+    payloads = redis.mget(keys)
+    own = worker_key(current_worker_id())
+    snapshots = []
+    for key, payload in zip(keys, payloads):
+        if payload is None:
+            continue
+        # This worker's published copy is stale; a missing one means it is
+        # not published yet or already retired, and is not counted
+        snapshots.append(registry.snapshot() if key == own else json.loads(payload))
+    return snapshots
+
+
+def merge(snapshots):
+    counters = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, series in snapshot['histograms']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            merged = histograms.get(key)
+            histograms[key] = series if merged is None else [a + b for a, b in zip(merged, series)]
+    return counters, histograms
+
+
+def unmerge(counters, histograms):
+    """merge() output back in snapshot form"""
+    return {
+        'counters': [[name, [list(pair) for pair in labels], value] for (name, labels), value in counters.items()],
+        'histograms': [[name, [list(pair) for pair in labels], series] for (name, labels), series in histograms.items()],
+    }
+
+
+# --- Prometheus text format ----------------------------------------------------
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(snapshots):
+    """Prometheus text exposition (version 0.0.4) of the merged snapshots"""
+    counters, histograms = merge(snapshots)
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+            continue
+
+        for (metric, labels), series in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, series):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels + (("le", _number(float(bound))),))} {cumulative}')
+            lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {series[-1]}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(series[-2])}')
+            lines.append(f'{name}_count{_labels(labels)} {series[-1]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,89 @@
+# health/middleware.py
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+from .metrics import record_request, start_publisher
+
+
+class QueryTimer:
+    """execute_wrapper that counts queries and the time spent in them"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+class MetricsMiddleware:
+    """
+    Record latency, status and database queries of every request, labelled
+    with the matched URL route (not the raw path, so ids don't create new
+    series). Served in Prometheus format by /health/metrics/.
+
+    Streaming responses (e.g. the order export) do most of their work while
+    the body is sent, so they are recorded once the body is exhausted or
+    the client goes away, including the queries run while streaming.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start_publisher()
+        queries = QueryTimer()
+        started = time.perf_counter()
+        with self.timing(queries):
+            response = self.get_response(request)
+
+        if response.streaming and response.is_async:
+            response.streaming_content = self.measure_async_stream(
+                response.streaming_content, request, response, queries, started
+            )
+        elif response.streaming:
+            response.streaming_content = self.measure_stream(
+                response.streaming_content, request, response, queries, started
+            )
+        else:
+            self.record(request, response, queries, started)
+        return response
+
+    def timing(self, queries):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(queries))
+        return stack
+
+    def measure_stream(self, content, request, response, queries, started):
+        try:
+            with self.timing(queries):
+                yield from content
+        finally:
+            self.record(request, response, queries, started)
+
+    async def measure_async_stream(self, content, request, response, queries, started):
+        # Queries of an async body run on other threads; only its time is measured
+        try:
+            async for chunk in content:
+                yield chunk
+        finally:
+            self.record(request, response, queries, started)
+
+    def record(self, request, response, queries, started):
+        match = request.resolver_match
+        record_request(
+            match.route if match is not None else 'unmatched',
+            request.method,
+            response.status_code,
+            time.perf_counter() - started,
+            queries.count,
+            queries.seconds,
+        )
@@ -0,0 +1,142 @@
+# health/tests.py
+import json
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+import fakeredis
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from orders.models import Order
+from payments.models import StripeEvent
+from users.models import User
+
+from . import metrics
+
+
+@override_settings(STRIPE_INBOX_MAX_LAG=300)
+class StripeInboxHealthTests(TestCase):
+    def add_event(self, age, status='pending'):
+        event = StripeEvent.objects.create(
+            event_id=f'evt_{StripeEvent.objects.count()}', type='payment_intent.succeeded',
+            payload={}, created=timezone.now(), status=status,
+        )
+        StripeEvent.objects.filter(pk=event.pk).update(received_at=timezone.now() - timedelta(seconds=age))
+
+    def test_recent_backlog_is_healthy(self):
+        self.add_event(age=10)
+        self.add_event(age=3600, status='processed')
+
+        response = self.client.get('/health/stripe/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['inbox']['pending'], 1)
+
+    def test_stalled_worker_is_unhealthy(self):
+        self.add_event(age=3600)
+
+        response = self.client.get('/health/stripe/')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['inbox']['status'], 'unhealthy')
+
+
+class StreamingMetricsTests(TestCase):
+    def test_export_is_recorded_once_streamed(self):
+        staff = User.objects.create(username='staff', clerk_id='user_staff', is_staff=True)
+        for n in range(3):
+            Order.objects.create(
+                user=staff, order_number=f'ORD-{n}', shipping_method='standard',
+                subtotal=Decimal('10.00'), total=Decimal('10.00'), payment_method='stripe',
+            )
+        client = APIClient()
+        client.force_authenticate(staff)
+
+        with mock.patch('health.middleware.record_request') as record_request:
+            response = client.get('/api/orders/export/')
+            self.assertFalse(record_request.called)
+            body = b''.join(response.streaming_content)
+
+        self.assertIn(b'ORD-2', body)
+        route, method, status, seconds, queries, query_seconds = record_request.call_args.args
+        self.assertEqual((method, status), ('GET', 200))
+        self.assertGreater(queries, 0)
+
+
+@override_settings(METRICS_PUBLISH_INTERVAL=15)
+class MetricsRetentionTests(TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        patcher = mock.patch('health.metrics.get_redis_connection', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+        mock.patch.object(metrics, '_published_pid', None).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def add_worker(self, worker_id, requests, alive):
+        snapshot = {'counters': [['http_requests_total', [['route', 'x']], requests]], 'histograms': []}
+        self.redis.set(metrics.worker_key(worker_id), json.dumps(snapshot))
+        self.redis.sadd(metrics.WORKERS_KEY, worker_id)
+        if alive:
+            self.redis.set(metrics.alive_key(worker_id), 1)
+
+    def total(self):
+        counters, _ = metrics.merge(metrics.collect())
+        return counters.get(('http_requests_total', (('route', 'x'),)), 0)
+
+    def test_dead_workers_keep_counting(self):
+        self.add_worker('host:1', 5, alive=True)
+        self.add_worker('host:2', 7, alive=False)
+        self.add_worker('host:3', 11, alive=False)
+
+        self.assertEqual(self.total(), 23)
+        metrics.retire_dead_workers()
+        self.assertEqual(self.total(), 23)
+        self.assertFalse({b'host:2', b'host:3'} & self.redis.smembers(metrics.WORKERS_KEY))
+        self.assertIsNone(self.redis.get(metrics.worker_key('host:2')))
+        # Retiring again is a no-op
+        metrics.retire_dead_workers()
+        self.assertEqual(self.total(), 23)
+
+    def test_worker_retired_while_alive_is_not_counted_twice(self):
+        metrics.registry.inc('http_requests_total', {'route': 'x'}, 4)
+        metrics.publish()
+        # Stalled past its liveness TTL: another worker retires it
+        metrics.retire(self.redis, [member.decode() for member in self.redis.smembers(metrics.WORKERS_KEY)])
+        self.assertEqual(self.total(), 4)
+
+        metrics.publish()
+        self.assertEqual(metrics.registry.snapshot()['counters'], [])
+        self.assertEqual(self.total(), 4)
+
+    def test_scrape_reads_fresh_local_counts_without_writing(self):
+        metrics.registry.inc('http_requests_total', {'route': 'x'}, 1)
+        metrics.publish()
+        metrics.registry.inc('http_requests_total', {'route': 'x'}, 2)
+        self.add_worker('host:dead', 7, alive=False)
+        before = {key: self.redis.dump(key) for key in self.redis.keys()}
+
+        self.assertEqual(self.total(), 10)
+        self.assertEqual({key: self.redis.dump(key) for key in self.redis.keys()}, before)
+
+
+@override_settings(METRICS_TOKEN='s3cret', METRICS_ALLOWED_IPS=['10.0.0.5'])
+class MetricsAccessTests(TestCase):
+    def test_token_or_allowed_ip_is_required(self):
+        self.assertEqual(self.client.get('/health/metrics/').status_code, 403)
+        self.assertEqual(self.client.get('/health/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(
+            self.client.get('/health/metrics/', REMOTE_ADDR='203.0.113.7', HTTP_X_FORWARDED_FOR='10.0.0.5').status_code,
+            403,
+        )
+
+        self.assertEqual(self.client.get('/health/metrics/', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+        self.assertEqual(self.client.get('/health/metrics/', REMOTE_ADDR='10.0.0.5').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='', METRICS_ALLOWED_IPS=[])
+    def test_closed_when_unconfigured(self):
+        self.assertEqual(self.client.get('/health/metrics/', HTTP_AUTHORIZATION='Bearer ').status_code, 403)
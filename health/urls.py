@@ -6,4 +6,7 @@ urlpatterns = [
     path('', views.health_check, name='health-check'),
     path('db/', views.database_check, name='database-check'),
     path('cache/', views.cache_check, name='cache-check'),
+    path('stripe/', views.stripe_check, name='stripe-check'),
+    path('clerk/', views.clerk_check, name='clerk-check'),
+    path('metrics/', views.metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -1,9 +1,17 @@
 # health/views.py
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
 from django.db import connection
+from django.db.models import Count, Min
 from django.core.cache import cache
+from django.utils import timezone
 from django.views.decorators.http import require_GET
 from django.views.decorators.csrf import csrf_exempt
+from payments.client import health as stripe_health
+from payments.models import StripeEvent
+from .metrics import collect, render
+from users.clerk_client import health as clerk_health
+import hmac
 import time
 
 @csrf_exempt
@@ -75,3 +83,66 @@ def cache_check(request):
             'error': str(e),
             'timestamp': time.time()
         }, status=503)
+
+@csrf_exempt
+@require_GET
+def stripe_check(request):
+    """
+    Stripe client circuit state and call latency (does not call Stripe),
+    plus the webhook inbox backlog: a pending event older than
+    STRIPE_INBOX_MAX_LAG means process_stripe_events is not keeping up
+    (or not running) and orders are not being marked paid
+    """
+    stripe_status = stripe_health()
+    backlog = StripeEvent.objects.filter(status='pending').aggregate(pending=Count('id'), oldest=Min('received_at'))
+    lag = (timezone.now() - backlog['oldest']).total_seconds() if backlog['oldest'] else 0.0
+    inbox_healthy = lag <= settings.STRIPE_INBOX_MAX_LAG
+    healthy = stripe_status['circuit']['state'] != 'open' and inbox_healthy
+    
+    return JsonResponse({
+        'status': 'healthy' if healthy else 'unhealthy',
+        'stripe': stripe_status,
+        'inbox': {
+            'status': 'healthy' if inbox_healthy else 'unhealthy',
+            'pending': backlog['pending'],
+            'oldest_pending_seconds': round(lag, 1),
+        },
+        'timestamp': time.time()
+    }, status=200 if healthy else 503)
+
+@csrf_exempt
+@require_GET
+def clerk_check(request):
+    """
+    Clerk client circuit state and call latency (does not call Clerk)
+    """
+    clerk_status = clerk_health()
+    healthy = clerk_status['circuit']['state'] != 'open'
+    
+    return JsonResponse({
+        'status': 'healthy' if healthy else 'unhealthy',
+        'clerk': clerk_status,
+        'timestamp': time.time()
+    }, status=200 if healthy else 503)
+
+def scraper_allowed(request):
+    """
+    Bearer METRICS_TOKEN or a REMOTE_ADDR in METRICS_ALLOWED_IPS (the
+    forwarded-for header is not trusted here)
+    """
+    auth = request.META.get('HTTP_AUTHORIZATION', '')
+    if settings.METRICS_TOKEN and auth.startswith('Bearer '):
+        if hmac.compare_digest(auth[len('Bearer '):].encode(), settings.METRICS_TOKEN.encode()):
+            return True
+    return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+
+@require_GET
+def metrics(request):
+    """
+    Prometheus metrics merged across all workers: per-route latency and
+    query counts, cache hit rate, Clerk and Stripe call latency.
+    Only for scrapers allowed by METRICS_TOKEN / METRICS_ALLOWED_IPS.
+    """
+    if not scraper_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
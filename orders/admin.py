@@ -1,11 +1,17 @@
+from datetime import timedelta
 from django.contrib import admin
-from .models import Order, OrderItem
+from django.db.models import Sum
+from django.template.response import TemplateResponse
+from django.utils import timezone
+from .models import (
+    Order, OrderItem, ShippingRate, TaxRate, DailySales, DailyProductSales, DailyCategorySales,
+)
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
     readonly_fields = ['subtotal']
-    fields = ['product', 'product_name', 'product_sku', 'quantity', 'price', 'subtotal']
+    fields = ['product', 'product_name', 'product_sku', 'category_name', 'quantity', 'price', 'subtotal']
 
 
 @admin.register(Order)
@@ -24,7 +30,7 @@ class OrderAdmin(admin.ModelAdmin):
             'fields': ('shipping_address', 'shipping_method', 'shipping_cost', 'tracking_number', 'estimated_delivery')
         }),
         ('Payment', {
-            'fields': ('payment_method', 'payment_status', 'stripe_payment_intent')
+            'fields': ('payment_method', 'payment_status', 'stripe_payment_intent', 'reservation_expires_at')
         }),
         ('Totals', {
             'fields': ('subtotal', 'tax', 'total')
@@ -42,4 +48,90 @@ class OrderAdmin(admin.ModelAdmin):
 class OrderItemAdmin(admin.ModelAdmin):
     list_display = ['order', 'product_name', 'quantity', 'price', 'subtotal']
     search_fields = ['order__order_number', 'product__name', 'product_name']
-    readonly_fields = ['subtotal']
\ No newline at end of file
+    readonly_fields = ['subtotal']
+
+
+@admin.register(ShippingRate)
+class ShippingRateAdmin(admin.ModelAdmin):
+    list_display = ['method', 'country', 'base_cost', 'cost_per_kg', 'free_shipping_threshold']
+    list_filter = ['method']
+    search_fields = ['method', 'country']
+
+
+@admin.register(TaxRate)
+class TaxRateAdmin(admin.ModelAdmin):
+    list_display = ['country', 'state', 'rate']
+    search_fields = ['country', 'state']
+
+
+
+@admin.register(DailySales)
+class SalesDashboardAdmin(admin.ModelAdmin):
+    """
+    Revenue dashboard. Reads only the daily rollup tables, never Order/OrderItem.
+    """
+    RANGES = [7, 30, 90, 365]
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+    
+    def changelist_view(self, request, extra_context=None):
+        try:
+            days = int(request.GET.get('days', 30))
+        except ValueError:
+            days = 30
+        days = days if days in self.RANGES else 30
+        
+        until = timezone.localdate()
+        since = until - timedelta(days=days - 1)
+        
+        daily = DailySales.objects.filter(day__gte=since, day__lte=until).order_by('day')
+        totals = daily.aggregate(
+            orders=Sum('orders'), units=Sum('units'), revenue=Sum('revenue'), total=Sum('total'),
+            refunded_orders=Sum('refunded_orders'), refunded_total=Sum('refunded_total'),
+        )
+        totals['net'] = (totals['total'] or 0) - (totals['refunded_total'] or 0)
+        
+        top_products = DailyProductSales.objects.filter(day__gte=since, day__lte=until).values(
+            'product_sku'
+        ).annotate(
+            units=Sum('units'), revenue=Sum('revenue'),
+            refunded_units=Sum('refunded_units'), refunded_revenue=Sum('refunded_revenue'),
+        ).order_by('-revenue')[:10]
+        
+        categories = DailyCategorySales.objects.filter(day__gte=since, day__lte=until).values(
+            'category_name'
+        ).annotate(
+            units=Sum('units'), revenue=Sum('revenue'), refunded_revenue=Sum('refunded_revenue'),
+        ).order_by('-revenue')
+        
+        product_names = dict(
+            DailyProductSales.objects.filter(
+                day__gte=since, day__lte=until,
+                product_sku__in=[row['product_sku'] for row in top_products]
+            ).order_by('day').values_list('product_sku', 'product_name')
+        )
+        for row in top_products:
+            row['product_name'] = product_names.get(row['product_sku'], '')
+        
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Sales dashboard',
+            'ranges': self.RANGES,
+            'days': days,
+            'since': since,
+            'until': until,
+            'totals': totals,
+            'daily': daily,
+            'top_products': top_products,
+            'categories': categories,
+            **(extra_context or {}),
+        }
+        return TemplateResponse(request, 'admin/orders/sales_dashboard.html', context)
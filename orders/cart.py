@@ -0,0 +1,142 @@
+# orders/cart.py
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+
+from backend.redis_client import get_redis_connection
+from products.models import Product, ProductImage
+from products.serializers import ProductImageSerializer
+
+MAX_LINE_QUANTITY = 999
+
+
+class Cart:
+    """
+    Server-side cart kept entirely in the cache, never in Postgres.
+
+    On Redis each cart is a hash of product_id -> quantity, so adding,
+    updating or removing a line is a single O(1) hash command (plus the
+    TTL refresh, pipelined into the same round-trip). Without Redis the
+    whole cart is stored as one dict in the local-memory cache.
+    """
+
+    def __init__(self, user_id):
+        self.key = f'cart:{user_id}'
+        self.ttl = settings.CART_TTL
+        self.redis = get_redis_connection()
+
+    # --- line operations -------------------------------------------------
+
+    def lines(self):
+        """{product_id: quantity} for every line in the cart"""
+        if self.redis is not None:
+            raw = self.redis.hgetall(self.key)
+            return {int(product_id): int(quantity) for product_id, quantity in raw.items()}
+        return dict(cache.get(self.key) or {})
+
+    def add(self, product_id, quantity):
+        """
+        Add quantity to a line (creating it if needed), capped at
+        MAX_LINE_QUANTITY; returns the new quantity
+        """
+        if self.redis is not None:
+            pipe = self.redis.pipeline()
+            pipe.hincrby(self.key, product_id, quantity)
+            pipe.expire(self.key, self.ttl)
+            total = int(pipe.execute()[0])
+            if total > MAX_LINE_QUANTITY:
+                self.redis.hset(self.key, product_id, MAX_LINE_QUANTITY)
+                total = MAX_LINE_QUANTITY
+            return total
+
+        lines = self.lines()
+        lines[product_id] = min(lines.get(product_id, 0) + quantity, MAX_LINE_QUANTITY)
+        cache.set(self.key, lines, self.ttl)
+        return lines[product_id]
+
+    def set(self, product_id, quantity):
+        """Set a line's quantity; zero removes the line"""
+        if quantity <= 0:
+            return self.remove(product_id)
+
+        if self.redis is not None:
+            pipe = self.redis.pipeline()
+            pipe.hset(self.key, product_id, quantity)
+            pipe.expire(self.key, self.ttl)
+            pipe.execute()
+            return
+
+        lines = self.lines()
+        lines[product_id] = quantity
+        cache.set(self.key, lines, self.ttl)
+
+    def remove(self, product_id):
+        if self.redis is not None:
+            self.redis.hdel(self.key, product_id)
+            return
+
+        lines = self.lines()
+        if lines.pop(product_id, None) is not None:
+            cache.set(self.key, lines, self.ttl)
+
+    def clear(self):
+        if self.redis is not None:
+            self.redis.delete(self.key)
+        else:
+            cache.delete(self.key)
+
+    # --- reads ------------------------------------------------------------
+
+    def order_lines(self):
+        """Cart lines in the shape OrderViewSet.create and pricing expect"""
+        return [
+            {'product_id': product_id, 'quantity': quantity}
+            for product_id, quantity in sorted(self.lines().items())
+        ]
+
+    def hydrate(self):
+        """
+        Cart contents with product details, loaded with one product query
+        (plus one image prefetch). Lines for products that no longer exist
+        or are inactive are dropped from the cart.
+        """
+        lines = self.lines()
+        if not lines:
+            return {'items': [], 'count': 0, 'subtotal': '0.00'}
+
+        products = Product.objects.filter(id__in=lines, is_active=True).prefetch_related(
+            Prefetch('images', queryset=ProductImage.objects.order_by('order', 'id'))
+        ).in_bulk()
+
+        items = []
+        subtotal = Decimal('0')
+        for product_id, quantity in sorted(lines.items()):
+            product = products.get(product_id)
+            if product is None:
+                self.remove(product_id)
+                continue
+
+            images = list(product.images.all())
+            primary = next((image for image in images if image.is_primary), images[0] if images else None)
+            line_total = product.price * quantity
+            subtotal += line_total
+
+            items.append({
+                'product_id': product.id,
+                'name': product.name,
+                'slug': product.slug,
+                'sku': product.sku,
+                'price': str(product.price),
+                'primary_image': ProductImageSerializer(primary).data['image'] if primary else None,
+                'in_stock': product.stock >= quantity,
+                'quantity': quantity,
+                'line_total': str(line_total),
+            })
+
+        return {
+            'items': items,
+            'count': sum(item['quantity'] for item in items),
+            'subtotal': str(subtotal),
+        }
@@ -0,0 +1,125 @@
+# orders/export.py
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import Order, OrderItem
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+DEFAULT_CHUNK_SIZE = 2000
+
+ORDER_FIELDS = [
+    'order_number', 'created_at', 'status', 'payment_status', 'customer_email',
+    'shipping_method', 'subtotal', 'shipping_cost', 'tax', 'total', 'stripe_payment_intent',
+]
+ITEM_FIELDS = ['product_sku', 'product_name', 'category_name', 'quantity', 'price', 'line_total']
+CSV_HEADER = ORDER_FIELDS + [f'item_{field}' for field in ITEM_FIELDS]
+
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def export_queryset(since=None, until=None, statuses=None):
+    """
+    Orders to export, oldest first. ``since``/``until`` are inclusive dates.
+    """
+    queryset = Order.objects.only(
+        'id', 'order_number', 'created_at', 'status', 'payment_status', 'user__email',
+        'shipping_method', 'subtotal', 'shipping_cost', 'tax', 'total', 'stripe_payment_intent',
+    ).select_related('user').order_by('id')
+
+    if since:
+        queryset = queryset.filter(created_at__gte=_start_of_day(since))
+    if until:
+        queryset = queryset.filter(created_at__lt=_start_of_day(until + timedelta(days=1)))
+    if statuses:
+        queryset = queryset.filter(status__in=statuses)
+
+    return queryset
+
+
+def iter_orders(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Stream orders through a server-side cursor, fetching their items one
+    chunk at a time, so memory stays flat no matter how many rows match.
+    """
+    items = OrderItem.objects.only(
+        'order_id', 'product_sku', 'product_name', 'category_name', 'quantity', 'price',
+    ).order_by('id')
+    return queryset.prefetch_related(Prefetch('items', queryset=items)).iterator(chunk_size=chunk_size)
+
+
+def order_row(order):
+    return {
+        'order_number': order.order_number,
+        'created_at': order.created_at.isoformat(),
+        'status': order.status,
+        'payment_status': order.payment_status,
+        'customer_email': order.user.email if order.user_id else '',
+        'shipping_method': order.shipping_method,
+        'subtotal': str(order.subtotal),
+        'shipping_cost': str(order.shipping_cost),
+        'tax': str(order.tax),
+        'total': str(order.total),
+        'stripe_payment_intent': order.stripe_payment_intent,
+    }
+
+
+def item_row(item):
+    return {
+        'product_sku': item.product_sku,
+        'product_name': item.product_name,
+        'category_name': item.category_name,
+        'quantity': item.quantity,
+        'price': str(item.price),
+        'line_total': str(item.subtotal),
+    }
+
+
+class _Echo:
+    """File-like object whose write() hands the CSV line straight back"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    One CSV line per order item (orders without items still get one line)
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+
+    for order in iter_orders(queryset, chunk_size):
+        order_values = list(order_row(order).values())
+        items = order.items.all()
+        if not items:
+            yield writer.writerow(order_values + [''] * len(ITEM_FIELDS))
+        for item in items:
+            yield writer.writerow(order_values + list(item_row(item).values()))
+
+
+def iter_ndjson(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    One JSON object per line per order, with its items nested
+    """
+    for order in iter_orders(queryset, chunk_size):
+        row = order_row(order)
+        row['items'] = [item_row(item) for item in order.items.all()]
+        yield json.dumps(row) + '\n'
+
+
+def iter_export(queryset, export_format, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Export lines in the given format. A streaming response is consumed after
+    the request's transaction has ended, so the server-side cursor gets a
+    transaction of its own for as long as the export runs.
+    """
+    rows = iter_ndjson if export_format == 'ndjson' else iter_csv
+    with transaction.atomic():
+        yield from rows(queryset, chunk_size)
@@ -0,0 +1,152 @@
+# orders/idempotency.py
+import hashlib
+import json
+import logging
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+MAX_KEY_LENGTH = 255
+
+
+def _get_request(args):
+    """
+    Find the request among view arguments (works for plain views and viewset methods)
+    """
+    for arg in args:
+        if hasattr(arg, 'META'):
+            return arg
+    raise TypeError('idempotent views must receive a request argument')
+
+
+def _request_fingerprint(request):
+    """
+    Hash the request body so a reused key with a different payload can be rejected
+    """
+    try:
+        body = request.body
+    except Exception:
+        # Body stream already consumed (e.g. by a DRF parser); fall back to parsed data
+        body = json.dumps(getattr(request, 'data', {}), sort_keys=True, default=str).encode()
+    return hashlib.sha256(body).hexdigest()
+
+
+def _error(message, status_code):
+    return JsonResponse({'error': message}, status=status_code)
+
+
+def _replay(record):
+    """
+    Rebuild the stored response for a repeated key
+    """
+    if 'data' in record:
+        response = Response(record['data'], status=record['status'])
+    else:
+        response = HttpResponse(
+            record['content'],
+            status=record['status'],
+            content_type=record['content_type'],
+        )
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _serialize(response):
+    if hasattr(response, 'data'):
+        return {'status': response.status_code, 'data': response.data}
+    return {
+        'status': response.status_code,
+        'content': response.content,
+        'content_type': response.get('Content-Type', 'application/json'),
+    }
+
+
+def idempotent(scope):
+    """
+    Honour the Idempotency-Key header on a view.
+
+    The first request for a key runs the view and, if it succeeded (2xx),
+    stores its response for IDEMPOTENCY_KEY_TTL seconds; repeats get the
+    stored response back. Failed requests are not recorded, so a client can
+    retry them with the same key.
+    Concurrent requests with the same key wait for the first one to finish
+    instead of running the view again. The key is exposed to the view as
+    ``request.idempotency_key`` so it can be forwarded to Stripe. Keys are
+    only accepted from authenticated users.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(*args, **kwargs):
+            request = _get_request(args)
+            key = request.META.get(IDEMPOTENCY_HEADER, '').strip()
+
+            if not key:
+                return view_func(*args, **kwargs)
+
+            if len(key) > MAX_KEY_LENGTH:
+                return _error('Idempotency-Key is too long', 400)
+
+            user = getattr(request, 'user', None)
+            if user is None or not user.is_authenticated:
+                # Keys are scoped per user; anonymous callers would share (and could replay) each other's
+                return _error('Idempotency-Key requires an authenticated request', 400)
+
+            key_hash = hashlib.sha256(key.encode()).hexdigest()
+            cache_key = f'idempotency:{scope}:{user.pk}:{key_hash}'
+            lock_key = f'{cache_key}:lock'
+            fingerprint = _request_fingerprint(request)
+
+            ttl = settings.IDEMPOTENCY_KEY_TTL
+            lock_timeout = settings.IDEMPOTENCY_LOCK_TIMEOUT
+
+            record = cache.get(cache_key)
+            if record is None and not cache.add(lock_key, fingerprint, timeout=lock_timeout):
+                # Another request with this key is in flight; wait for its result
+                deadline = time.monotonic() + lock_timeout
+                while record is None and time.monotonic() < deadline:
+                    time.sleep(0.1)
+                    record = cache.get(cache_key)
+                    if record is None and cache.get(lock_key) is None:
+                        break
+
+                if record is None:
+                    return _error('A request with this Idempotency-Key is still being processed', 409)
+
+            if record is not None:
+                if record['fingerprint'] != fingerprint:
+                    return _error('Idempotency-Key was already used with a different request body', 422)
+                logger.info('Replaying %s response for idempotency key %s', scope, key_hash[:12])
+                return _replay(record['response'])
+
+            request.idempotency_key = key
+            try:
+                response = view_func(*args, **kwargs)
+            except Exception:
+                cache.delete(lock_key)
+                raise
+
+            if not 200 <= response.status_code < 300:
+                # Errors (out of stock, Stripe down, ...) are not final; let the client retry with the same key
+                cache.delete(lock_key)
+                return response
+
+            record = {'fingerprint': fingerprint, 'response': _serialize(response)}
+
+            def store():
+                cache.set(cache_key, record, timeout=ttl)
+                cache.delete(lock_key)
+
+            # Only publish the response once the order/stock writes are committed
+            transaction.on_commit(store)
+            return response
+
+        return wrapper
+    return decorator
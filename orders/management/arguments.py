@@ -0,0 +1,10 @@
+# orders/management/arguments.py
+from django.utils.dateparse import parse_date
+
+
+def date_argument(value):
+    """argparse type for YYYY-MM-DD options"""
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(f'Invalid date: {value}')
+    return day
@@ -0,0 +1,55 @@
+# orders/management/commands/release_expired_reservations.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.reservations import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = 'Cancel unpaid orders whose stock reservation has expired and restock their items'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Orders released per transaction (default: 500)',
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.05,
+            help='Seconds to sleep between batches so other writers get the row locks (default: 0.05)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running as a background sweeper instead of exiting once the backlog is drained',
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=60,
+            help='Seconds between sweeps in --loop mode (default: 60)',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            released = self.sweep(options['batch_size'], options['pause'])
+            if released or options['verbosity'] > 1:
+                self.stdout.write(self.style.SUCCESS(f'✅ Released {released} expired reservations'))
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def sweep(self, batch_size, pause):
+        """Drain the backlog one short transaction at a time"""
+        total = 0
+        while True:
+            released = release_expired_reservations(batch_size=batch_size)
+            total += released
+            if released < batch_size:
+                return total
+            time.sleep(pause)
@@ -0,0 +1,38 @@
+# Generated by Django 6.0 on 2026-10-19 04:39
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_reservation_expiry(apps, schema_editor):
+    # Existing unpaid orders get the same hold window as new ones, so the
+    # sweeper can release stock that has been stuck since before this change
+    Order = apps.get_model('orders', 'Order')
+    Order.objects.filter(status='pending').exclude(payment_status='paid').update(
+        reservation_expires_at=F('created_at') + timedelta(minutes=settings.ORDER_RESERVATION_TTL_MINUTES)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_initial'),
+        ('users', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='reservation_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['reservation_expires_at'], name='order_pending_expiry_idx'),
+        ),
+        migrations.RunPython(backfill_reservation_expiry, migrations.RunPython.noop),
+    ]
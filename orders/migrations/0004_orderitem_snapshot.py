@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-19 04:39
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_snapshots(apps, schema_editor):
+    # Slug and category come straight from the catalogue; historical items
+    # keep an empty image since Cloudinary URLs are resolved at runtime
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    Product = apps.get_model('products', 'Product')
+    product = Product.objects.filter(id=OuterRef('product_id'))
+    OrderItem.objects.filter(product__isnull=False).update(
+        product_slug=Subquery(product.values('slug')[:1]),
+        category_name=Subquery(product.values('category__name')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_order_reservation_expires_at'),
+        ('products', '0003_alter_category_image_alter_productimage_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='category_name',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_image',
+            field=models.URLField(blank=True, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_slug',
+            field=models.SlugField(blank=True, max_length=255),
+        ),
+        migrations.RunPython(backfill_snapshots, migrations.RunPython.noop),
+    ]
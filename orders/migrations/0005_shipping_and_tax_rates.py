@@ -0,0 +1,41 @@
+# Generated by Django 6.0 on 2026-10-19 04:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_orderitem_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShippingRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('method', models.CharField(max_length=100)),
+                ('country', models.CharField(blank=True, max_length=100)),
+                ('base_cost', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('cost_per_kg', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('free_shipping_threshold', models.DecimalField(blank=True, decimal_places=2, help_text='Orders with a subtotal at or above this ship free', max_digits=10, null=True)),
+            ],
+            options={
+                'ordering': ['method', 'country'],
+                'unique_together': {('method', 'country')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TaxRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('country', models.CharField(max_length=100)),
+                ('state', models.CharField(blank=True, max_length=100)),
+                ('rate', models.DecimalField(decimal_places=4, help_text='e.g. 0.0825 for 8.25%', max_digits=6)),
+            ],
+            options={
+                'ordering': ['country', 'state'],
+                'unique_together': {('country', 'state')},
+            },
+        ),
+    ]
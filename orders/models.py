@@ -1,5 +1,8 @@
 # orders/models.py
-from django.db import models
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from users.models import User, Address
 from products.models import Product
 
@@ -35,12 +38,23 @@ class Order(models.Model):
     tracking_number = models.CharField(max_length=100, blank=True)
     estimated_delivery = models.DateField(null=True, blank=True)
     
+    # Stock reservation: unpaid orders past this time are cancelled and their
+    # stock released by the release_expired_reservations sweeper
+    reservation_expires_at = models.DateTimeField(null=True, blank=True)
+    
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(
+                fields=['reservation_expires_at'],
+                condition=models.Q(status='pending'),
+                name='order_pending_expiry_idx',
+            ),
+        ]
     
     def __str__(self):
         return self.order_number
@@ -50,6 +64,11 @@ class OrderItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True)
     product_name = models.CharField(max_length=255)
     product_sku = models.CharField(max_length=100)
+    # Display data captured at purchase time so order history never has to
+    # reach back into the live catalogue
+    product_slug = models.SlugField(max_length=255, blank=True)
+    product_image = models.URLField(max_length=500, blank=True)
+    category_name = models.CharField(max_length=100, blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     quantity = models.PositiveIntegerField()
     
@@ -58,4 +77,131 @@ class OrderItem(models.Model):
         return self.price * self.quantity
     
     def __str__(self):
-        return f"{self.product_name} x {self.quantity}"
\ No newline at end of file
+        return f"{self.product_name} x {self.quantity}"
+
+
+class ShippingRate(models.Model):
+    """
+    Shipping price per method, optionally specific to a destination country.
+    A blank country is the fallback for every other destination.
+    """
+    CACHE_KEY = 'pricing:shipping_rates'
+    
+    method = models.CharField(max_length=100)
+    country = models.CharField(max_length=100, blank=True)
+    base_cost = models.DecimalField(max_digits=10, decimal_places=2)
+    cost_per_kg = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    free_shipping_threshold = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True,
+        help_text='Orders with a subtotal at or above this ship free'
+    )
+    
+    class Meta:
+        unique_together = ['method', 'country']
+        ordering = ['method', 'country']
+    
+    def save(self, *args, **kwargs):
+        self.country = self.country.strip().upper()
+        super().save(*args, **kwargs)
+    
+    def __str__(self):
+        return f"{self.method} ({self.country or 'all countries'})"
+
+
+class TaxRate(models.Model):
+    """
+    Sales tax rate for a country, optionally narrowed to a state/region.
+    A blank state applies to the whole country.
+    """
+    CACHE_KEY = 'pricing:tax_rates'
+    
+    country = models.CharField(max_length=100)
+    state = models.CharField(max_length=100, blank=True)
+    rate = models.DecimalField(max_digits=6, decimal_places=4, help_text='e.g. 0.0825 for 8.25%')
+    
+    class Meta:
+        unique_together = ['country', 'state']
+        ordering = ['country', 'state']
+    
+    def save(self, *args, **kwargs):
+        self.country = self.country.strip().upper()
+        self.state = self.state.strip().upper()
+        super().save(*args, **kwargs)
+    
+    def __str__(self):
+        return f"{self.country}{'/' + self.state if self.state else ''}: {self.rate}"
+
+
+@receiver([post_save, post_delete], sender=ShippingRate)
+@receiver([post_save, post_delete], sender=TaxRate)
+def invalidate_rate_table(sender, **kwargs):
+    # After commit, so a reader can't re-cache the old table from a row that
+    # is not committed yet. Covers queryset deletes (they send post_delete
+    # per row); queryset update() must delete the key itself.
+    transaction.on_commit(lambda: cache.delete(sender.CACHE_KEY))
+
+
+class DailySales(models.Model):
+    """
+    Per-day sales rollup, maintained incrementally by orders.rollups when an
+    order is paid or refunded. Days are the order's creation date.
+    """
+    day = models.DateField(unique=True)
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    shipping = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    tax = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    refunded_orders = models.PositiveIntegerField(default=0)
+    refunded_units = models.PositiveIntegerField(default=0)
+    refunded_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        verbose_name_plural = 'Daily sales'
+        ordering = ['-day']
+    
+    def __str__(self):
+        return f"{self.day}: {self.total}"
+
+
+class DailyProductSales(models.Model):
+    """
+    Per-day, per-product rollup keyed by the SKU snapshotted on order items,
+    so history survives product edits and deletions
+    """
+    day = models.DateField()
+    product_sku = models.CharField(max_length=100)
+    product_name = models.CharField(max_length=255)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    refunded_units = models.PositiveIntegerField(default=0)
+    refunded_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        verbose_name_plural = 'Daily product sales'
+        unique_together = ['day', 'product_sku']
+        ordering = ['-day', 'product_sku']
+    
+    def __str__(self):
+        return f"{self.day} {self.product_sku}: {self.units}"
+
+
+class DailyCategorySales(models.Model):
+    """
+    Per-day, per-category rollup keyed by the category name snapshotted on order items
+    """
+    day = models.DateField()
+    category_name = models.CharField(max_length=100)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    refunded_units = models.PositiveIntegerField(default=0)
+    refunded_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        verbose_name_plural = 'Daily category sales'
+        unique_together = ['day', 'category_name']
+        ordering = ['-day', 'category_name']
+    
+    def __str__(self):
+        return f"{self.day} {self.category_name or 'Uncategorized'}: {self.units}"
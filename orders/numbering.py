@@ -0,0 +1,238 @@
+# orders/numbering.py
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Snowflake layout: 41 bits of milliseconds since EPOCH_MS, 10 bits of worker
+# id and 12 bits of per-millisecond sequence (4096 numbers/ms per worker)
+EPOCH_MS = 1735689600000  # 2025-01-01T00:00:00Z
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+# Crockford base32: no I, L, O or U, so codes survive being read over the phone
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+CODE_LENGTH = 13  # 13 * 5 bits covers the full 63-bit id
+
+PREFIX = 'ORD-'
+
+# Worker id leases in the shared cache: renewed every HEARTBEAT seconds, so
+# the id of a process that died is free again after at most LEASE_TIMEOUT.
+# A lease not renewed for LEASE_TIMEOUT - LEASE_MARGIN seconds is not used
+# for new ids until it has been renewed (or replaced) again.
+LEASE_TIMEOUT = 60
+LEASE_MARGIN = 10
+HEARTBEAT = 20
+
+logger = logging.getLogger(__name__)
+
+
+def encode_base32(value, length=CODE_LENGTH):
+    """
+    Fixed-width Crockford base32, so codes sort in the same order as the ids
+    """
+    chars = []
+    for _ in range(length):
+        value, remainder = divmod(value, 32)
+        chars.append(ALPHABET[remainder])
+    return ''.join(reversed(chars))
+
+
+def decode_base32(code):
+    value = 0
+    for char in code.upper():
+        value = value * 32 + ALPHABET.index(char)
+    return value
+
+
+class OrderNumberGenerator:
+    """
+    Time-ordered, collision-free order numbers.
+
+    Each process holds a distinct worker id, so two workers can never produce
+    the same id and no insert ever has to retry on the unique constraint.
+    Consecutive ids are increasing, which keeps inserts at the right-hand edge
+    of the order_number index instead of scattering them across it.
+    """
+
+    def __init__(self, worker_id, lease=None):
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f'worker_id must be between 0 and {MAX_WORKER_ID}')
+        self.worker_id = worker_id
+        self.lease = lease
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._sequence = 0
+
+    def next_id(self):
+        if self.lease is not None:
+            # Never issue ids under a worker id another process may hold by now
+            self.lease.refresh(self)
+        with self._lock:
+            now_ms = self._current_ms()
+
+            if now_ms < self._last_ms:
+                # Clock stepped backwards; never reuse a timestamp we have issued
+                now_ms = self._wait_until(self._last_ms)
+
+            if now_ms == self._last_ms:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    # Sequence exhausted for this millisecond
+                    now_ms = self._wait_until(self._last_ms + 1)
+            else:
+                self._sequence = 0
+
+            self._last_ms = now_ms
+            return (
+                ((now_ms - EPOCH_MS) << (WORKER_BITS + SEQUENCE_BITS))
+                | (self.worker_id << SEQUENCE_BITS)
+                | self._sequence
+            )
+
+    def set_worker_id(self, worker_id):
+        with self._lock:
+            self.worker_id = worker_id
+
+    def next_order_number(self):
+        return f'{PREFIX}{encode_base32(self.next_id())}'
+
+    def _current_ms(self):
+        return time.time_ns() // 1_000_000
+
+    def _wait_until(self, target_ms):
+        now_ms = self._current_ms()
+        while now_ms < target_ms:
+            time.sleep((target_ms - now_ms) / 1000)
+            now_ms = self._current_ms()
+        return now_ms
+
+
+def lease_key(worker_id):
+    return f'order_number:worker:{worker_id}'
+
+
+class WorkerIdLease:
+    """
+    A worker id held by this process for as long as it keeps renewing it.
+
+    Ids are taken with an atomic add (SET NX with a TTL) on
+    order_number:worker:{id} in the shared cache and renewed by a heartbeat
+    thread, so at most 1024 workers hold ids at once, however many have come
+    and gone before. If the heartbeat has not renewed the lease for
+    LEASE_TIMEOUT - LEASE_MARGIN seconds (the process stalled, or the cache
+    was unreachable), the generator renews it itself before issuing another
+    id, and leases a new id if another worker has taken this one meanwhile.
+    """
+
+    def __init__(self):
+        self.token = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.renewed_at = None
+        self._lock = threading.Lock()
+        self.worker_id = self.acquire()
+
+    def acquire(self):
+        # Start at a random id so workers booting together don't race for the same keys
+        start = random.randrange(MAX_WORKER_ID + 1)
+        for offset in range(MAX_WORKER_ID + 1):
+            worker_id = (start + offset) & MAX_WORKER_ID
+            if cache.add(lease_key(worker_id), self.token, timeout=LEASE_TIMEOUT):
+                self.renewed_at = time.monotonic()
+                return worker_id
+        raise RuntimeError(f'All {MAX_WORKER_ID + 1} order number worker ids are leased')
+
+    def renew(self):
+        """Extend the lease; False if it has expired or belongs to someone else"""
+        key = lease_key(self.worker_id)
+        renewed = cache.get(key) == self.token and cache.touch(key, LEASE_TIMEOUT)
+        if renewed:
+            self.renewed_at = time.monotonic()
+        return renewed
+
+    def is_fresh(self):
+        return time.monotonic() - self.renewed_at < LEASE_TIMEOUT - LEASE_MARGIN
+
+    def refresh(self, generator, force=False):
+        """
+        Renew the lease if it is due (always with force), or lease a new id
+        for the generator if this one was lost. Errors reaching the cache
+        propagate: without a live lease no id may be issued.
+        """
+        if not force and self.is_fresh():
+            return
+        with self._lock:
+            if not force and self.is_fresh():
+                return
+            if not self.renew():
+                lost = self.worker_id
+                self.worker_id = self.acquire()
+                generator.set_worker_id(self.worker_id)
+                logger.warning('Order number worker id %s was lost, leased %s', lost, self.worker_id)
+
+    def keep_alive(self, generator):
+        threading.Thread(
+            target=self._heartbeat, args=(generator,), name='order-number-lease', daemon=True
+        ).start()
+
+    def _heartbeat(self, generator):
+        while True:
+            time.sleep(HEARTBEAT)
+            try:
+                self.refresh(generator, force=True)
+            except Exception as e:
+                logger.warning('Renewing order number worker id %s failed: %s', self.worker_id, e)
+
+
+def create_generator():
+    """
+    Generator for this process.
+
+    ORDER_NUMBER_WORKER_ID pins the worker id explicitly. Otherwise one is
+    leased from the shared cache. Without Redis the cache is local to the
+    process, so the lease cannot keep workers apart: run a single worker or
+    pin the id.
+    """
+    if settings.ORDER_NUMBER_WORKER_ID is not None:
+        return OrderNumberGenerator(settings.ORDER_NUMBER_WORKER_ID)
+
+    if not settings.REDIS_URL:
+        logger.warning(
+            'Order number worker ids are leased from a process-local cache; '
+            'set REDIS_URL or ORDER_NUMBER_WORKER_ID when running several workers'
+        )
+    lease = WorkerIdLease()
+    generator = OrderNumberGenerator(lease.worker_id, lease)
+    lease.keep_alive(generator)
+    return generator
+
+
+_generator = None
+_generator_pid = None
+_generator_lock = threading.Lock()
+
+
+def get_generator():
+    """
+    Per-process generator; a forked worker leases its own worker id
+    """
+    global _generator, _generator_pid
+
+    pid = os.getpid()
+    if _generator is None or _generator_pid != pid:
+        with _generator_lock:
+            if _generator is None or _generator_pid != pid:
+                _generator = create_generator()
+                _generator_pid = pid
+    return _generator
+
+
+def generate_order_number():
+    return get_generator().next_order_number()
@@ -0,0 +1,183 @@
+# orders/pricing.py
+import uuid
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import ShippingRate, TaxRate
+
+CENT = Decimal('0.01')
+RATE_TABLE_TIMEOUT = 3600  # Tables are also invalidated whenever a rate is saved
+
+
+class PricingError(Exception):
+    """Raised when a cart cannot be priced (unknown product, bad quantity...)"""
+    pass
+
+
+def money(value):
+    return Decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def normalize_region(value):
+    return (value or '').strip().upper()
+
+
+def get_shipping_rates():
+    """
+    {(method, country): rate} for every shipping rate, cached as one table
+    """
+    rates = cache.get(ShippingRate.CACHE_KEY)
+    if rates is None:
+        rates = {
+            (rate.method, rate.country): {
+                'base_cost': rate.base_cost,
+                'cost_per_kg': rate.cost_per_kg,
+                'free_shipping_threshold': rate.free_shipping_threshold,
+            }
+            for rate in ShippingRate.objects.all()
+        }
+        cache.set(ShippingRate.CACHE_KEY, rates, RATE_TABLE_TIMEOUT)
+    return rates
+
+
+def get_tax_rates():
+    """
+    {(country, state): rate} for every tax rate, cached as one table
+    """
+    rates = cache.get(TaxRate.CACHE_KEY)
+    if rates is None:
+        rates = {(rate.country, rate.state): rate.rate for rate in TaxRate.objects.all()}
+        cache.set(TaxRate.CACHE_KEY, rates, RATE_TABLE_TIMEOUT)
+    return rates
+
+
+def shipping_cost_for(method, country, weight, subtotal):
+    rates = get_shipping_rates()
+    rate = rates.get((method, country)) or rates.get((method, ''))
+
+    if rate is None:
+        return money(settings.DEFAULT_SHIPPING_COST)
+
+    threshold = rate['free_shipping_threshold']
+    if threshold is not None and subtotal >= threshold:
+        return money(0)
+
+    return money(rate['base_cost'] + rate['cost_per_kg'] * weight)
+
+
+def tax_rate_for(country, state):
+    rates = get_tax_rates()
+    rate = rates.get((country, state))
+    if rate is None:
+        rate = rates.get((country, ''))
+    if rate is None:
+        rate = settings.DEFAULT_TAX_RATE
+    return Decimal(rate)
+
+
+def price_cart(lines, products, address, shipping_method):
+    """
+    Price a whole cart in one pass.
+
+    ``lines`` is a list of {'product_id', 'quantity'} and ``products`` maps
+    product id to an already-loaded Product. Returns a quote dict holding
+    every figure order creation needs, all as exact Decimals.
+    """
+    country = normalize_region(address.country)
+    state = normalize_region(address.state)
+
+    priced_lines = []
+    subtotal = Decimal('0')
+    weight = Decimal('0')
+
+    for line in lines:
+        product = products.get(line['product_id'])
+        if product is None or not product.is_active:
+            raise PricingError(f"Product {line['product_id']} not found")
+
+        quantity = line['quantity']
+        if quantity < 1:
+            raise PricingError(f'Invalid quantity for {product.name}')
+
+        line_total = money(product.price * quantity)
+        subtotal += line_total
+        weight += product.shipping_weight * quantity
+        priced_lines.append({
+            'product_id': product.id,
+            'name': product.name,
+            'sku': product.sku,
+            'price': product.price,
+            'quantity': quantity,
+            'line_total': line_total,
+        })
+
+    shipping_cost = shipping_cost_for(shipping_method, country, weight, subtotal)
+    tax_rate = tax_rate_for(country, state)
+    tax = money(subtotal * tax_rate)
+
+    return {
+        'lines': priced_lines,
+        'shipping_address_id': address.id,
+        'shipping_method': shipping_method,
+        'weight': weight,
+        'subtotal': money(subtotal),
+        'shipping_cost': shipping_cost,
+        'tax_rate': tax_rate,
+        'tax': tax,
+        'total': money(subtotal + shipping_cost + tax),
+        'currency': 'usd',
+    }
+
+
+def _quote_cache_key(quote_id):
+    return f'quote:{quote_id}'
+
+
+def save_quote(quote, user):
+    """
+    Keep a quote for QUOTE_TTL seconds so order creation can reuse it as-is
+    """
+    quote_id = uuid.uuid4().hex
+    cache.set(_quote_cache_key(quote_id), {**quote, 'user_id': user.pk}, settings.QUOTE_TTL)
+    return quote_id
+
+
+def load_quote(quote_id, user):
+    quote = cache.get(_quote_cache_key(quote_id))
+    if quote is None or quote['user_id'] != user.pk:
+        return None
+    return quote
+
+
+def discard_quote(quote_id):
+    cache.delete(_quote_cache_key(quote_id))
+
+
+def serialize_quote(quote, quote_id=None):
+    """
+    JSON-friendly quote with money rendered as strings (like DecimalField)
+    """
+    data = {
+        'subtotal': str(quote['subtotal']),
+        'shipping_cost': str(quote['shipping_cost']),
+        'tax_rate': str(quote['tax_rate']),
+        'tax': str(quote['tax']),
+        'total': str(quote['total']),
+        'currency': quote['currency'],
+        'shipping_method': quote['shipping_method'],
+        'shipping_address_id': quote['shipping_address_id'],
+        'items': [
+            {
+                **line,
+                'price': str(line['price']),
+                'line_total': str(line['line_total']),
+            }
+            for line in quote['lines']
+        ],
+    }
+    if quote_id:
+        data['quote_id'] = quote_id
+        data['expires_in'] = settings.QUOTE_TTL
+    return data
@@ -0,0 +1,89 @@
+# orders/reservations.py
+import logging
+
+import stripe
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.utils import timezone
+
+from backend.resilience import CircuitOpenError
+from payments import client as stripe_client
+from payments.intents import intent_cache_key
+from products.models import Product
+from .models import Order, OrderItem
+
+logger = logging.getLogger(__name__)
+
+
+def release_expired_reservations(batch_size=500, now=None):
+    """
+    Cancel one batch of unpaid orders whose reservation has expired and put
+    their stock back.
+
+    Everything happens in a single short transaction with set-based UPDATEs:
+    one to claim the orders, one to restock every affected product, one to
+    cancel the orders. Rows locked by another sweeper are skipped, so several
+    sweepers can run side by side. Once committed, the orders' PaymentIntents
+    are cancelled so the customer can no longer pay for released stock.
+    Returns the number of orders released.
+    """
+    now = now or timezone.now()
+
+    with transaction.atomic():
+        intents = dict(
+            Order.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', reservation_expires_at__lte=now)
+            .exclude(payment_status='paid')
+            .order_by('reservation_expires_at')
+            .values_list('id', 'stripe_payment_intent')[:batch_size]
+        )
+        order_ids = list(intents)
+
+        if not order_ids:
+            return 0
+
+        quantities = dict(
+            OrderItem.objects.filter(order_id__in=order_ids, product__isnull=False)
+            .values_list('product_id')
+            .annotate(total=Sum('quantity'))
+            .order_by('product_id')
+        )
+
+        if quantities:
+            Product.objects.filter(id__in=quantities).update(
+                stock=F('stock') + Case(
+                    *[When(id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                )
+            )
+
+        Order.objects.filter(id__in=order_ids).update(
+            status='cancelled',
+            reservation_expires_at=None,
+            updated_at=now,
+        )
+
+    logger.info(
+        'Released %s expired reservations (%s units across %s products)',
+        len(order_ids), sum(quantities.values()), len(quantities),
+    )
+    cache.delete_many([intent_cache_key(order_id) for order_id in order_ids])
+    cancel_payment_intents(intents)
+    return len(order_ids)
+
+
+def cancel_payment_intents(intents):
+    """
+    Cancel the PaymentIntents of released orders ({order_id: intent_id}).
+    A failure is only logged: an intent that still gets paid is caught by
+    the Stripe event inbox, which never reopens a cancelled order.
+    """
+    for order_id, intent_id in intents.items():
+        if not intent_id:
+            continue
+        try:
+            stripe_client.cancel_payment_intent(intent_id, idempotency_key=f'release-order:{order_id}')
+        except (stripe.StripeError, CircuitOpenError) as e:
+            logger.warning('Could not cancel payment intent %s of expired order %s: %s', intent_id, order_id, e)
@@ -0,0 +1,118 @@
+# orders/rollups.py
+from collections import defaultdict
+
+from django.db import connection
+from django.utils import timezone
+
+from .models import DailyCategorySales, DailyProductSales, DailySales, Order, OrderItem
+
+UPSERT_BATCH_SIZE = 500
+
+DAY_COUNTERS = [
+    'orders', 'units', 'revenue', 'shipping', 'tax', 'total',
+    'refunded_orders', 'refunded_units', 'refunded_total',
+]
+LINE_COUNTERS = ['units', 'revenue', 'refunded_units', 'refunded_revenue']
+
+
+def record_sales(order_ids):
+    """
+    Add newly paid orders to the daily rollups
+    """
+    _apply(order_ids, refund=False)
+
+
+def record_refunds(order_ids):
+    """
+    Add refunded orders (already counted as sales) to the refund columns
+    """
+    _apply(order_ids, refund=True)
+
+
+def _counters(fields):
+    return defaultdict(lambda: dict.fromkeys(fields, 0))
+
+
+def _apply(order_ids, refund):
+    """
+    Aggregate the given orders in memory, then add the deltas to each rollup
+    table with one INSERT ... ON CONFLICT DO UPDATE per batch. Two queries to
+    read, a handful to write, however many orders are in the batch.
+    """
+    if not order_ids:
+        return
+
+    days = _counters(DAY_COUNTERS)
+    products = _counters(LINE_COUNTERS)
+    categories = _counters(LINE_COUNTERS)
+    product_names = {}
+    order_days = {}
+
+    orders = Order.objects.filter(id__in=order_ids).values_list(
+        'id', 'created_at', 'subtotal', 'shipping_cost', 'tax', 'total'
+    )
+    for order_id, created_at, subtotal, shipping_cost, tax, total in orders:
+        day = timezone.localdate(created_at)
+        order_days[order_id] = day
+        if refund:
+            days[day]['refunded_orders'] += 1
+            days[day]['refunded_total'] += total
+        else:
+            days[day]['orders'] += 1
+            days[day]['revenue'] += subtotal
+            days[day]['shipping'] += shipping_cost
+            days[day]['tax'] += tax
+            days[day]['total'] += total
+
+    items = OrderItem.objects.filter(order_id__in=order_days).values_list(
+        'order_id', 'product_sku', 'product_name', 'category_name', 'quantity', 'price'
+    )
+    units_field, revenue_field = ('refunded_units', 'refunded_revenue') if refund else ('units', 'revenue')
+    for order_id, sku, name, category_name, quantity, price in items:
+        day = order_days[order_id]
+        line_total = price * quantity
+        days[day]['refunded_units' if refund else 'units'] += quantity
+        for bucket in (products[(day, sku)], categories[(day, category_name)]):
+            bucket[units_field] += quantity
+            bucket[revenue_field] += line_total
+        product_names[sku] = name
+
+    _increment(DailySales, ['day'], [], DAY_COUNTERS, [
+        {'day': day, **counters} for day, counters in days.items()
+    ])
+    _increment(DailyProductSales, ['day', 'product_sku'], ['product_name'], LINE_COUNTERS, [
+        {'day': day, 'product_sku': sku, 'product_name': product_names[sku], **counters}
+        for (day, sku), counters in products.items()
+    ])
+    _increment(DailyCategorySales, ['day', 'category_name'], [], LINE_COUNTERS, [
+        {'day': day, 'category_name': category_name, **counters}
+        for (day, category_name), counters in categories.items()
+    ])
+
+
+def _increment(model, key_fields, label_fields, counter_fields, rows):
+    """
+    Upsert rows, adding counter values onto any existing row for the same key
+    """
+    if not rows:
+        return
+
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    columns = key_fields + label_fields + counter_fields
+    assignments = [f'{quote(field)} = EXCLUDED.{quote(field)}' for field in label_fields] + [
+        f'{quote(field)} = {table}.{quote(field)} + EXCLUDED.{quote(field)}' for field in counter_fields
+    ]
+    placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            params = [row[column] for row in batch for column in columns]
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(quote(column) for column in columns)}) "
+                f"VALUES {', '.join([placeholders] * len(batch))} "
+                f"ON CONFLICT ({', '.join(quote(field) for field in key_fields)}) "
+                f"DO UPDATE SET {', '.join(assignments)}",
+                params,
+            )
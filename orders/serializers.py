@@ -1,16 +1,51 @@
 # orders/serializers.py
 from rest_framework import serializers
+from .cart import MAX_LINE_QUANTITY
 from .models import Order, OrderItem
-from products.serializers import ProductListSerializer
+from products.models import Product
+from products.serializers import ProductImageSerializer
+
+
+def snapshot_product(product):
+    """
+    Display fields frozen onto an OrderItem at purchase time.
+    Expects product.category and product.images to be preloaded.
+    """
+    images = list(product.images.all())
+    primary = next((image for image in images if image.is_primary), images[0] if images else None)
+    image_url = ProductImageSerializer(primary).data['image'] if primary else None
+    
+    return {
+        'product_name': product.name,
+        'product_sku': product.sku,
+        'product_slug': product.slug,
+        'product_image': image_url or '',
+        'category_name': product.category.name if product.category_id else '',
+    }
+
 
 class OrderItemSerializer(serializers.ModelSerializer):
-    product_details = ProductListSerializer(source='product', read_only=True)
+    product_details = serializers.SerializerMethodField()
     subtotal = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     
     class Meta:
         model = OrderItem
-        fields = ['id', 'product', 'product_details', 'product_name', 'product_sku', 
+        fields = ['id', 'product', 'product_details', 'product_name', 'product_sku',
+                  'product_slug', 'product_image', 'category_name',
                   'price', 'quantity', 'subtotal']
+    
+    def get_product_details(self, obj):
+        """
+        Product card built from the purchase-time snapshot (no catalogue queries)
+        """
+        return {
+            'id': obj.product_id,
+            'name': obj.product_name,
+            'slug': obj.product_slug,
+            'price': str(obj.price),
+            'primary_image': obj.product_image or None,
+            'category': {'name': obj.category_name},
+        }
 
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
@@ -20,7 +55,53 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ['user', 'order_number', 'status', 'payment_status']
 
-class CreateOrderSerializer(serializers.Serializer):
-    items = serializers.ListField(child=serializers.DictField())
+class OrderLineSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+class CartLineSerializer(serializers.Serializer):
+    """
+    A cart line as set by PATCH: quantity 0 removes the line, any other
+    quantity must be for an active product
+    """
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0, max_value=MAX_LINE_QUANTITY)
+    
+    def validate(self, attrs):
+        if attrs['quantity'] and not Product.objects.filter(id=attrs['product_id'], is_active=True).exists():
+            raise serializers.ValidationError({'product_id': 'Product not found.'})
+        return attrs
+
+class CartAddSerializer(CartLineSerializer):
+    """A line added by POST: at least one of an active product"""
+    quantity = serializers.IntegerField(min_value=1, max_value=MAX_LINE_QUANTITY)
+
+class QuoteSerializer(serializers.Serializer):
+    items = OrderLineSerializer(many=True, required=False, allow_empty=False)
+    from_cart = serializers.BooleanField(default=False)
     shipping_address_id = serializers.IntegerField()
-    shipping_method = serializers.CharField()
\ No newline at end of file
+    shipping_method = serializers.CharField()
+    
+    def validate(self, attrs):
+        if not attrs['from_cart'] and 'items' not in attrs:
+            raise serializers.ValidationError({'items': 'This field is required unless from_cart is set.'})
+        return attrs
+
+class CreateOrderSerializer(serializers.Serializer):
+    quote_id = serializers.CharField(required=False)
+    items = OrderLineSerializer(many=True, required=False, allow_empty=False)
+    from_cart = serializers.BooleanField(default=False)
+    shipping_address_id = serializers.IntegerField(required=False)
+    shipping_method = serializers.CharField(required=False)
+    
+    def validate(self, attrs):
+        if attrs.get('quote_id'):
+            return attrs
+        required = ('shipping_address_id', 'shipping_method') if attrs['from_cart'] else \
+            ('items', 'shipping_address_id', 'shipping_method')
+        missing = [field for field in required if field not in attrs]
+        if missing:
+            raise serializers.ValidationError(
+                {field: 'This field is required without a quote_id.' for field in missing}
+            )
+        return attrs
\ No newline at end of file
@@ -0,0 +1,526 @@
+# orders/tests.py
+import csv
+import hashlib
+import json
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+
+import stripe
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from backend.resilience import CircuitOpenError
+from payments.inbox import CHARGE_REFUNDED, PAYMENT_SUCCEEDED, apply_stripe_events
+from products.models import Category, Product
+from users.models import Address, User
+
+from .export import export_queryset, iter_export
+from .idempotency import idempotent
+from .models import DailyCategorySales, DailyProductSales, DailySales, Order, OrderItem, ShippingRate, TaxRate
+from .numbering import LEASE_TIMEOUT, MAX_WORKER_ID, SEQUENCE_BITS, OrderNumberGenerator, WorkerIdLease, lease_key
+from .pricing import get_shipping_rates, get_tax_rates
+from .reservations import release_expired_reservations
+
+
+class OrderTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='buyer', clerk_id='user_buyer', email='buyer@example.com')
+        self.address = Address.objects.create(
+            user=self.user, full_name='Buyer', phone='555', address_line1='1 Main St',
+            city='Springfield', state='IL', postal_code='62701', country='US',
+        )
+        category = Category.objects.create(name='Phones')
+        self.product = Product.objects.create(
+            category=category, name='Phone', price=Decimal('100.00'), stock=5,
+            sku='PHONE-1', shipping_weight=Decimal('0.50'),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def place_order(self, quantity=2, **headers):
+        return self.client.post('/api/orders/', {
+            'items': [{'product_id': self.product.id, 'quantity': quantity}],
+            'shipping_address_id': self.address.id,
+            'shipping_method': 'standard',
+        }, format='json', **headers)
+
+
+def payment_intent(intent_id='pi_1'):
+    return mock.Mock(id=intent_id, client_secret=f'{intent_id}_secret', amount=20000)
+
+
+class CreateOrderPaymentFailureTests(OrderTestCase):
+
+    def assert_nothing_kept(self):
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+        self.assertFalse(Order.objects.exists())
+
+    @mock.patch('orders.views.stripe_client.create_payment_intent')
+    def test_open_circuit_keeps_stock(self, create_payment_intent):
+        create_payment_intent.side_effect = CircuitOpenError('stripe', 30)
+
+        response = self.place_order()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assert_nothing_kept()
+
+    @mock.patch('orders.views.stripe_client.create_payment_intent')
+    def test_stripe_error_keeps_stock(self, create_payment_intent):
+        create_payment_intent.side_effect = stripe.StripeError('card declined')
+
+        response = self.place_order()
+
+        self.assertEqual(response.status_code, 400)
+        self.assert_nothing_kept()
+
+
+class StockReservationTests(OrderTestCase):
+    @mock.patch('orders.views.stripe_client.create_payment_intent', return_value=payment_intent())
+    def test_order_decrements_stock(self, create_payment_intent):
+        response = self.place_order(quantity=2)
+
+        self.assertEqual(response.status_code, 201)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 3)
+
+    @mock.patch('orders.views.stripe_client.create_payment_intent', return_value=payment_intent())
+    def test_stale_stock_read_cannot_oversell(self, create_payment_intent):
+        # Another order took the stock after this request read the product
+        stale = Product.objects.in_bulk([self.product.id])
+        Product.objects.filter(pk=self.product.pk).update(stock=1)
+
+        with mock.patch('orders.views.OrderViewSet.load_products', return_value=stale):
+            response = self.place_order(quantity=2)
+
+        self.assertEqual(response.status_code, 400)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 1)
+        self.assertFalse(Order.objects.exists())
+        create_payment_intent.assert_not_called()
+
+
+class IdempotencyKeyTests(OrderTestCase):
+    def place_order_with_key(self, quantity=2, key='key-1'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.place_order(quantity=quantity, HTTP_IDEMPOTENCY_KEY=key)
+
+    @mock.patch('orders.views.stripe_client.create_payment_intent', return_value=payment_intent())
+    def test_replayed_key_returns_stored_response(self, create_payment_intent):
+        first = self.place_order_with_key()
+        second = self.place_order_with_key()
+
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(Order.objects.count(), 1)
+        create_payment_intent.assert_called_once()
+
+    @mock.patch('orders.views.stripe_client.create_payment_intent', return_value=payment_intent())
+    def test_same_key_with_different_body_is_rejected(self, create_payment_intent):
+        self.place_order_with_key(quantity=2)
+
+        response = self.place_order_with_key(quantity=1)
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    @override_settings(IDEMPOTENCY_LOCK_TIMEOUT=0.2)
+    @mock.patch('orders.views.stripe_client.create_payment_intent', return_value=payment_intent())
+    def test_key_in_flight_gets_conflict(self, create_payment_intent):
+        key_hash = hashlib.sha256(b'key-1').hexdigest()
+        cache.add(f'idempotency:order-create:{self.user.pk}:{key_hash}:lock', 'other', timeout=0.2)
+
+        response = self.place_order_with_key()
+
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Order.objects.exists())
+
+    @mock.patch('orders.views.stripe_client.create_payment_intent')
+    def test_failed_response_is_not_stored(self, create_payment_intent):
+        create_payment_intent.side_effect = CircuitOpenError('stripe', 30)
+        self.assertEqual(self.place_order_with_key().status_code, 503)
+
+        create_payment_intent.side_effect = None
+        create_payment_intent.return_value = payment_intent()
+        response = self.place_order_with_key()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(Order.objects.count(), 1)
+
+    @mock.patch('orders.views.stripe_client.create_payment_intent', return_value=payment_intent())
+    def test_out_of_stock_is_not_replayed_after_restock(self, create_payment_intent):
+        self.assertEqual(self.place_order_with_key(quantity=6).status_code, 400)
+
+        Product.objects.filter(pk=self.product.pk).update(stock=10)
+        response = self.place_order_with_key(quantity=6)
+
+        self.assertEqual(response.status_code, 201)
+
+    def test_anonymous_key_is_refused(self):
+        view = mock.Mock()
+        request = RequestFactory().post('/', HTTP_IDEMPOTENCY_KEY='key-1')
+        request.user = AnonymousUser()
+
+        response = idempotent('test')(view)(request)
+
+        self.assertEqual(response.status_code, 400)
+        view.assert_not_called()
+
+
+class OrderQueryCountTests(OrderTestCase):
+    def setUp(self):
+        super().setUp()
+        for number in range(3):
+            order = Order.objects.create(
+                user=self.user, order_number=f'ORD-{number}', shipping_address=self.address,
+                shipping_method='standard', subtotal=Decimal('300.00'), total=Decimal('300.00'), payment_method='card',
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=self.product, product_name='Phone', product_sku=f'PHONE-{line}',
+                          price=Decimal('100.00'), quantity=1)
+                for line in range(3)
+            ])
+
+    def test_list_does_not_query_per_order_or_item(self):
+        # count, orders, items
+        with self.assertNumQueries(3 + 2):  # plus the request's savepoint and its release
+            response = self.client.get('/api/orders/')
+
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(len(response.data['results'][0]['items']), 3)
+
+    def test_detail_does_not_query_per_item(self):
+        order = Order.objects.first()
+        # order, items
+        with self.assertNumQueries(2 + 2):  # plus the request's savepoint and its release
+            response = self.client.get(f'/api/orders/{order.id}/')
+
+        self.assertEqual(len(response.data['items']), 3)
+
+
+class ExpiredReservationTests(OrderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = Order.objects.create(
+            user=self.user, order_number='ORD-1', shipping_address=self.address, shipping_method='standard',
+            subtotal=Decimal('200.00'), total=Decimal('200.00'), payment_method='stripe',
+            stripe_payment_intent='pi_expired', reservation_expires_at=timezone.now() - timedelta(minutes=1),
+        )
+        OrderItem.objects.create(
+            order=self.order, product=self.product, product_name='Phone', product_sku='PHONE-1',
+            price=Decimal('100.00'), quantity=2,
+        )
+        self.product.stock = 3
+        self.product.save()
+
+    @mock.patch('orders.reservations.stripe_client.cancel_payment_intent')
+    def test_release_cancels_payment_intent(self, cancel_payment_intent):
+        self.assertEqual(release_expired_reservations(), 1)
+
+        cancel_payment_intent.assert_called_once_with('pi_expired', idempotency_key=f'release-order:{self.order.id}')
+        self.order.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(self.order.status, 'cancelled')
+        self.assertEqual(self.product.stock, 5)
+
+    @mock.patch('payments.inbox.stripe_client.create_refund')
+    @mock.patch('orders.reservations.stripe_client.cancel_payment_intent')
+    def test_payment_after_release_is_refunded(self, cancel_payment_intent, create_refund):
+        cancel_payment_intent.side_effect = stripe.StripeError('intent already succeeded')
+        release_expired_reservations()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = apply_stripe_events([{
+                'id': 'evt_1', 'type': PAYMENT_SUCCEEDED, 'created': 1,
+                'data': {'object': {'id': 'pi_expired', 'metadata': {'order_id': str(self.order.id)}}},
+            }])
+
+        create_refund.assert_called_once_with(
+            {'payment_intent': 'pi_expired'}, idempotency_key='refund-cancelled:evt_1'
+        )
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.payment_status), ('cancelled', 'refund_pending'))
+        self.assertEqual(result['sold'], [])
+        self.assertEqual(result['needs_refund'], [self.order.id])
+
+        apply_stripe_events([{
+            'id': 'evt_2', 'type': CHARGE_REFUNDED, 'created': 2,
+            'data': {'object': {'payment_intent': 'pi_expired'}},
+        }])
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.payment_status), ('cancelled', 'expired_refunded'))
+
+    @mock.patch('payments.inbox.stripe_client.create_refund')
+    @mock.patch('orders.reservations.stripe_client.cancel_payment_intent')
+    def test_failed_refund_leaves_order_flagged(self, cancel_payment_intent, create_refund):
+        create_refund.side_effect = stripe.APIConnectionError('unreachable')
+        release_expired_reservations()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_stripe_events([{
+                'id': 'evt_1', 'type': PAYMENT_SUCCEEDED, 'created': 1,
+                'data': {'object': {'id': 'pi_expired', 'metadata': {'order_id': str(self.order.id)}}},
+            }])
+
+        self.assertTrue(Order.objects.filter(payment_status='refund_pending', id=self.order.id).exists())
+
+
+class SalesRollupTests(OrderTestCase):
+    def setUp(self):
+        super().setUp()
+        for number in (1, 2):
+            order = Order.objects.create(
+                user=self.user, order_number=f'ORD-{number}', shipping_address=self.address,
+                shipping_method='standard', subtotal=Decimal('200.00'), shipping_cost=Decimal('10.00'),
+                tax=Decimal('16.00'), total=Decimal('226.00'), payment_method='card',
+                stripe_payment_intent=f'pi_{number}',
+            )
+            OrderItem.objects.create(
+                order=order, product=self.product, product_name='Phone', product_sku='PHONE-1',
+                category_name='Phones', price=Decimal('100.00'), quantity=2,
+            )
+
+        apply_stripe_events([
+            {'id': f'evt_paid_{number}', 'type': PAYMENT_SUCCEEDED, 'created': 1,
+             'data': {'object': {'id': f'pi_{number}', 'metadata': {}}}}
+            for number in (1, 2)
+        ])
+        apply_stripe_events([{
+            'id': 'evt_refund_2', 'type': CHARGE_REFUNDED, 'created': 2,
+            'data': {'object': {'payment_intent': 'pi_2'}},
+        }])
+
+    def rollups(self):
+        return (
+            list(DailySales.objects.values('orders', 'units', 'total', 'refunded_orders', 'refunded_units',
+                                           'refunded_total')),
+            list(DailyProductSales.objects.values('product_sku', 'units', 'revenue', 'refunded_revenue')),
+            list(DailyCategorySales.objects.values('category_name', 'units', 'revenue', 'refunded_revenue')),
+        )
+
+    def test_sale_then_refund(self):
+        days, products, categories = self.rollups()
+
+        self.assertEqual(days, [{
+            'orders': 2, 'units': 4, 'total': Decimal('452.00'),
+            'refunded_orders': 1, 'refunded_units': 2, 'refunded_total': Decimal('226.00'),
+        }])
+        self.assertEqual(products, [{
+            'product_sku': 'PHONE-1', 'units': 4, 'revenue': Decimal('400.00'), 'refunded_revenue': Decimal('200.00'),
+        }])
+        self.assertEqual(categories, [{
+            'category_name': 'Phones', 'units': 4, 'revenue': Decimal('400.00'), 'refunded_revenue': Decimal('200.00'),
+        }])
+
+    def test_backfill_matches_incremental_rollups_and_can_rerun(self):
+        incremental = self.rollups()
+
+        call_command('backfill_sales_rollups', stdout=StringIO())
+        self.assertEqual(self.rollups(), incremental)
+        call_command('backfill_sales_rollups', stdout=StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_dashboard_totals(self):
+        admin = User.objects.create(username='admin', clerk_id='user_admin', is_staff=True, is_superuser=True)
+        self.client.force_login(admin)
+
+        response = self.client.get(reverse('admin:orders_dailysales_changelist'), {'days': 7})
+
+        self.assertEqual(response.status_code, 200)
+        totals = response.context['totals']
+        self.assertEqual((totals['orders'], totals['refunded_orders']), (2, 1))
+        self.assertEqual(totals['net'], Decimal('226.00'))
+        self.assertEqual(response.context['top_products'][0]['product_name'], 'Phone')
+
+
+class ExportTests(OrderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user.is_staff = True
+        self.user.save()
+        for number, (day, order_status) in enumerate([(1, 'pending'), (2, 'delivered'), (3, 'delivered')], 1):
+            order = Order.objects.create(
+                user=self.user, order_number=f'ORD-{number}', shipping_address=self.address,
+                shipping_method='standard', subtotal=Decimal('100.00'), total=Decimal('100.00'),
+                payment_method='card', status=order_status,
+            )
+            Order.objects.filter(pk=order.pk).update(created_at=timezone.make_aware(
+                datetime(2026, 3, day, 12)
+            ))
+            if number != 3:
+                OrderItem.objects.create(
+                    order=order, product=self.product, product_name='Phone', product_sku='PHONE-1',
+                    price=Decimal('50.00'), quantity=2,
+                )
+
+    def export(self, **params):
+        response = self.client.get('/api/orders/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_has_one_line_per_item(self):
+        rows = list(csv.DictReader(self.export().splitlines()))
+
+        self.assertEqual([row['order_number'] for row in rows], ['ORD-1', 'ORD-2', 'ORD-3'])
+        self.assertEqual(rows[0]['customer_email'], 'buyer@example.com')
+        self.assertEqual((rows[0]['item_product_sku'], rows[0]['item_line_total']), ('PHONE-1', '100.00'))
+        self.assertEqual(rows[2]['item_product_sku'], '')
+
+    def test_ndjson_nests_items(self):
+        orders = [json.loads(line) for line in self.export(export_format='ndjson').splitlines()]
+
+        self.assertEqual([order['order_number'] for order in orders], ['ORD-1', 'ORD-2', 'ORD-3'])
+        self.assertEqual(orders[1]['items'][0]['quantity'], 2)
+        self.assertEqual(orders[2]['items'], [])
+
+    def test_filters(self):
+        def numbers(**params):
+            return [json.loads(line)['order_number'] for line in self.export(export_format='ndjson', **params).splitlines()]
+
+        self.assertEqual(numbers(since='2026-03-02'), ['ORD-2', 'ORD-3'])
+        self.assertEqual(numbers(until='2026-03-02'), ['ORD-1', 'ORD-2'])
+        self.assertEqual(numbers(since='2026-03-02', until='2026-03-02'), ['ORD-2'])
+        self.assertEqual(numbers(status='pending'), ['ORD-1'])
+        self.assertEqual(self.client.get('/api/orders/export/', {'since': 'March'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/orders/export/', {'export_format': 'xml'}).status_code, 400)
+
+    def test_non_staff_is_refused(self):
+        self.user.is_staff = False
+        self.user.save()
+
+        self.assertEqual(self.client.get('/api/orders/export/').status_code, 403)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'server-side cursors')
+class ExportCursorTests(TransactionTestCase):
+    def test_export_outside_a_transaction_streams_every_order(self):
+        user = User.objects.create(username='buyer', clerk_id='user_buyer')
+        address = Address.objects.create(
+            user=user, full_name='Buyer', phone='555', address_line1='1 Main St',
+            city='Springfield', state='IL', postal_code='62701', country='US',
+        )
+        for number in range(5):
+            Order.objects.create(
+                user=user, order_number=f'ORD-{number}', shipping_address=address, shipping_method='standard',
+                subtotal=Decimal('100.00'), total=Decimal('100.00'), payment_method='card',
+            )
+
+        self.assertFalse(connection.in_atomic_block)
+        lines = []
+        for line in iter_export(export_queryset(since=date(2000, 1, 1)), 'ndjson', chunk_size=2):
+            self.assertTrue(connection.in_atomic_block)
+            lines.append(json.loads(line)['order_number'])
+
+        self.assertEqual(lines, [f'ORD-{number}' for number in range(5)])
+        self.assertFalse(connection.in_atomic_block)
+
+
+class WorkerIdLeaseTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_live_leases_never_share_an_id(self):
+        leases = [WorkerIdLease() for _ in range(50)]
+        self.assertEqual(len({lease.worker_id for lease in leases}), 50)
+        self.assertTrue(all(lease.renew() for lease in leases))
+
+    def test_lease_taken_over_after_expiry_is_not_renewed(self):
+        lease = WorkerIdLease()
+        cache.delete(lease_key(lease.worker_id))
+        cache.add(lease_key(lease.worker_id), 'someone-else', timeout=LEASE_TIMEOUT)
+
+        self.assertFalse(lease.renew())
+        self.assertEqual(cache.get(lease_key(lease.worker_id)), 'someone-else')
+
+    def test_stale_lease_is_renewed_before_issuing_ids(self):
+        lease = WorkerIdLease()
+        generator = OrderNumberGenerator(lease.worker_id, lease)
+        lease.renewed_at -= LEASE_TIMEOUT
+
+        with mock.patch.object(lease, 'renew', wraps=lease.renew) as renew:
+            generator.next_id()
+            generator.next_id()
+
+        renew.assert_called_once_with()
+        self.assertTrue(lease.is_fresh())
+
+    def test_lost_lease_stops_issuing_its_worker_id(self):
+        lease = WorkerIdLease()
+        generator = OrderNumberGenerator(lease.worker_id, lease)
+        lost = lease.worker_id
+        # The heartbeat stalled and another worker took the id after it expired
+        lease.renewed_at -= LEASE_TIMEOUT
+        cache.set(lease_key(lost), 'someone-else', timeout=LEASE_TIMEOUT)
+
+        worker_id = (generator.next_id() >> SEQUENCE_BITS) & MAX_WORKER_ID
+
+        self.assertNotEqual(worker_id, lost)
+        self.assertEqual(worker_id, lease.worker_id)
+        self.assertEqual(cache.get(lease_key(worker_id)), lease.token)
+
+    def test_no_ids_while_the_lease_cannot_be_renewed(self):
+        lease = WorkerIdLease()
+        generator = OrderNumberGenerator(lease.worker_id, lease)
+        lease.renewed_at -= LEASE_TIMEOUT
+
+        with mock.patch('orders.numbering.cache.get', side_effect=ConnectionError('cache down')):
+            with self.assertRaises(ConnectionError):
+                generator.next_id()
+
+
+class RateTableCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_save_invalidates_after_commit(self):
+        get_tax_rates()
+        with self.captureOnCommitCallbacks() as callbacks:
+            TaxRate.objects.create(country='us', state='il', rate=Decimal('0.0625'))
+            self.assertIsNotNone(cache.get(TaxRate.CACHE_KEY))
+
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(cache.get(TaxRate.CACHE_KEY))
+
+    def test_queryset_delete_invalidates(self):
+        ShippingRate.objects.create(method='standard', base_cost=Decimal('5.00'))
+        get_shipping_rates()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ShippingRate.objects.all().delete()
+
+        self.assertIsNone(cache.get(ShippingRate.CACHE_KEY))
+
+
+class CartTests(OrderTestCase):
+    def add(self, product_id, quantity):
+        return self.client.post('/api/cart/', {'product_id': product_id, 'quantity': quantity}, format='json')
+
+    def test_add_is_capped(self):
+        self.assertEqual(self.add(self.product.id, 600).data['quantity'], 600)
+        self.assertEqual(self.add(self.product.id, 600).data['quantity'], 999)
+        self.assertEqual(self.add(self.product.id, 1000).status_code, 400)
+
+    def test_add_unknown_product_is_rejected(self):
+        response = self.add(self.product.id + 100, 1)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/api/cart/').data['items'], [])
+
+    def test_update_validates_like_add(self):
+        url = f'/api/cart/{self.product.id + 100}/'
+        self.assertEqual(self.client.patch(url, {'quantity': 1}, format='json').status_code, 400)
+        self.assertEqual(self.client.patch(url, {'quantity': 0}, format='json').status_code, 200)
+        self.assertEqual(self.client.patch('/api/cart/abc/', {'quantity': 1}, format='json').status_code, 404)
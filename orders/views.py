@@ -2,19 +2,32 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django.db import transaction
-from django.utils.crypto import get_random_string
+from django.db.models import F, Prefetch
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from datetime import datetime, timedelta
 from .models import Order, OrderItem
-from .serializers import OrderSerializer, CreateOrderSerializer
-from products.models import Product
+from .serializers import (
+    OrderSerializer, CreateOrderSerializer, QuoteSerializer,
+    CartAddSerializer, CartLineSerializer, snapshot_product,
+)
+from .cart import Cart
+from .export import EXPORT_FORMATS, export_queryset, iter_export
+from . import pricing
+from .idempotency import idempotent
+from .numbering import generate_order_number
+from products.models import Product, ProductImage
 from users.models import Address
+from payments import client as stripe_client
+from payments.intents import remember_intent
+from backend.resilience import CircuitOpenError
 import stripe
 from django.conf import settings
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
-
 class OrderViewSet(viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
@@ -22,90 +35,265 @@ class OrderViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return Order.objects.filter(user=self.request.user).prefetch_related('items')
     
+    def load_products(self, product_ids):
+        """
+        Every product in the cart (with category and images for the item snapshot) in one go
+        """
+        return Product.objects.select_related('category').prefetch_related(
+            Prefetch('images', queryset=ProductImage.objects.order_by('order', 'id'))
+        ).in_bulk(product_ids)
+    
+    @action(detail=False, methods=['post'])
+    def quote(self, request):
+        """
+        Price a cart (subtotal, shipping, tax, total) without placing the order.
+        The returned quote_id can be passed to create to reuse these figures.
+        """
+        serializer = QuoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        from_cart = serializer.validated_data['from_cart']
+        lines = Cart(request.user.pk).order_lines() if from_cart else serializer.validated_data['items']
+        if not lines:
+            return Response({'error': 'Your cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        address = get_object_or_404(
+            Address, id=serializer.validated_data['shipping_address_id'], user=request.user
+        )
+        products = Product.objects.in_bulk([line['product_id'] for line in lines])
+        
+        try:
+            quote = pricing.price_cart(lines, products, address, serializer.validated_data['shipping_method'])
+        except pricing.PricingError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        quote['from_cart'] = from_cart
+        quote_id = pricing.save_quote(quote, request.user)
+        return Response(pricing.serialize_quote(quote, quote_id))
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def export(self, request):
+        """
+        Staff-only streaming export of all orders with their items.
+        Query params: export_format (csv|ndjson), since, until (YYYY-MM-DD), status (repeatable)
+        """
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'error': f"export_format must be one of: {', '.join(EXPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        dates = {}
+        for param in ('since', 'until'):
+            value = request.query_params.get(param)
+            if value:
+                dates[param] = parse_date(value)
+                if dates[param] is None:
+                    return Response(
+                        {'error': f'{param} must be a date (YYYY-MM-DD)'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+        
+        queryset = export_queryset(
+            dates.get('since'), dates.get('until'), request.query_params.getlist('status')
+        )
+        content_type = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+        response = StreamingHttpResponse(iter_export(queryset, export_format), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="orders.{export_format}"'
+        return response
+    
+    @idempotent('order-create')
     @transaction.atomic
     def create(self, request):
         serializer = CreateOrderSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
         
-        items_data = serializer.validated_data['items']
-        address = Address.objects.get(id=serializer.validated_data['shipping_address_id'])
+        quote_id = data.get('quote_id')
+        from_cart = data['from_cart']
+        if quote_id:
+            # Reuse the figures shown to the customer instead of repricing
+            quote = pricing.load_quote(quote_id, request.user)
+            if quote is None:
+                return Response(
+                    {'error': 'Quote has expired, please request a new one'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            lines = quote['lines']
+            from_cart = quote.get('from_cart', False)
+            address = get_object_or_404(Address, id=quote['shipping_address_id'], user=request.user)
+            products = self.load_products([line['product_id'] for line in lines])
+        else:
+            lines = Cart(request.user.pk).order_lines() if from_cart else data['items']
+            if not lines:
+                return Response({'error': 'Your cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
+            address = get_object_or_404(Address, id=data['shipping_address_id'], user=request.user)
+            products = self.load_products([line['product_id'] for line in lines])
+            try:
+                quote = pricing.price_cart(lines, products, address, data['shipping_method'])
+            except pricing.PricingError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Calculate totals
-        subtotal = 0
         order_items = []
-        
-        for item_data in items_data:
-            product = Product.objects.get(id=item_data['product_id'])
-            quantity = item_data['quantity']
+        for line in quote['lines']:
+            product = products.get(line['product_id'])
             
-            if product.stock < quantity:
+            if product is None:
+                return Response(
+                    {'error': f"Product {line['product_id']} not found"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            if product.stock < line['quantity']:
                 return Response(
                     {'error': f'{product.name} is out of stock'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            subtotal += product.price * quantity
             order_items.append({
                 'product': product,
-                'quantity': quantity,
-                'price': product.price
+                'quantity': line['quantity'],
+                'price': line['price']
             })
         
-        shipping_cost = 10.00  # Calculate based on method
-        tax = subtotal * 0.08  # 8% tax
-        total = subtotal + shipping_cost + tax
+        # Reserve stock with conditional UPDATEs: the check above read an
+        # unlocked row, so only the database decides under concurrency
+        for item in order_items:
+            reserved = Product.objects.filter(
+                pk=item['product'].pk, stock__gte=item['quantity']
+            ).update(stock=F('stock') - item['quantity'])
+            if not reserved:
+                transaction.set_rollback(True)
+                return Response(
+                    {'error': f"{item['product'].name} is out of stock"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        total = quote['total']
         
         # Create order
         order = Order.objects.create(
             user=request.user,
-            order_number=f"ORD-{get_random_string(8).upper()}",
+            order_number=generate_order_number(),
             shipping_address=address,
-            shipping_method=serializer.validated_data['shipping_method'],
-            shipping_cost=shipping_cost,
-            subtotal=subtotal,
-            tax=tax,
+            shipping_method=quote['shipping_method'],
+            shipping_cost=quote['shipping_cost'],
+            subtotal=quote['subtotal'],
+            tax=quote['tax'],
             total=total,
             payment_method='card',
-            estimated_delivery=datetime.now().date() + timedelta(days=3)
+            estimated_delivery=datetime.now().date() + timedelta(days=3),
+            reservation_expires_at=timezone.now() + timedelta(minutes=settings.ORDER_RESERVATION_TTL_MINUTES)
         )
         
-        # Create order items
-        for item in order_items:
-            OrderItem.objects.create(
+        # Create order items with a purchase-time snapshot of the product
+        OrderItem.objects.bulk_create([
+            OrderItem(
                 order=order,
                 product=item['product'],
-                product_name=item['product'].name,
-                product_sku=item['product'].sku,
                 price=item['price'],
-                quantity=item['quantity']
+                quantity=item['quantity'],
+                **snapshot_product(item['product'])
             )
-            
-            # Update stock
-            item['product'].stock -= item['quantity']
-            item['product'].save()
+            for item in order_items
+        ])
         
         # Create Stripe payment intent
+        stripe_idempotency_key = None
+        idempotency_key = getattr(request, 'idempotency_key', None)
+        if idempotency_key:
+            stripe_idempotency_key = f'order-create:{request.user.pk}:{idempotency_key}'
+        
         try:
-            intent = stripe.PaymentIntent.create(
-                amount=int(total * 100),  # Amount in cents
-                currency='usd',
-                metadata={
+            intent = stripe_client.create_payment_intent({
+                'amount': int(total * 100),  # Amount in cents
+                'currency': 'usd',
+                'metadata': {
                     'order_id': order.id,
                     'order_number': order.order_number
-                }
-            )
+                },
+            }, idempotency_key=stripe_idempotency_key)
             
             order.stripe_payment_intent = intent.id
             order.save()
+            remember_intent(order.id, intent)
+            
+            if quote_id:
+                pricing.discard_quote(quote_id)
+            if from_cart:
+                user_id = request.user.pk
+                transaction.on_commit(lambda: Cart(user_id).clear())
             
             return Response({
                 'order': OrderSerializer(order).data,
                 'client_secret': intent.client_secret
             }, status=status.HTTP_201_CREATED)
             
-        except stripe.error.StripeError as e:
-            order.delete()
+        except stripe.StripeError as e:
+            # Undo the order, its items and the stock decrement
+            transaction.set_rollback(True)
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        except CircuitOpenError as e:
+            transaction.set_rollback(True)
+            return Response(
+                {'error': 'Payments are temporarily unavailable, please try again shortly'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(int(e.retry_after))}
+            )
+
+
+
+class CartViewSet(viewsets.ViewSet):
+    """
+    Server-side cart. Every operation works on the cache only; the product
+    table is read once, when the cart is displayed.
+    
+    GET    /api/cart/             cart with product details
+    POST   /api/cart/             add {product_id, quantity} to a line
+    PATCH  /api/cart/{product}/   set a line's quantity (0 removes it)
+    DELETE /api/cart/{product}/   remove a line
+    DELETE /api/cart/clear/       empty the cart
+    """
+    permission_classes = [IsAuthenticated]
+    lookup_value_regex = r'\d+'
+    
+    def get_cart(self):
+        return Cart(self.request.user.pk)
+    
+    def list(self, request):
+        return Response(self.get_cart().hydrate())
+    
+    def create(self, request):
+        serializer = CartAddSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        quantity = self.get_cart().add(
+            serializer.validated_data['product_id'],
+            serializer.validated_data['quantity']
+        )
+        return Response(
+            {'product_id': serializer.validated_data['product_id'], 'quantity': quantity},
+            status=status.HTTP_201_CREATED
+        )
+    
+    def partial_update(self, request, pk=None):
+        serializer = CartLineSerializer(data={'product_id': pk, 'quantity': request.data.get('quantity')})
+        serializer.is_valid(raise_exception=True)
+        
+        product_id = serializer.validated_data['product_id']
+        quantity = serializer.validated_data['quantity']
+        self.get_cart().set(product_id, quantity)
+        return Response({'product_id': product_id, 'quantity': quantity})
+    
+    def destroy(self, request, pk=None):
+        self.get_cart().remove(int(pk))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    
+    @action(detail=False, methods=['delete'])
+    def clear(self, request):
+        self.get_cart().clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,16 @@
+from django.contrib import admin
+from .models import StripeEvent
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    list_display = ['event_id', 'type', 'status', 'attempts', 'created', 'processed_at']
+    list_filter = ['status', 'type']
+    search_fields = ['event_id']
+    readonly_fields = ['event_id', 'type', 'payload', 'created', 'received_at', 'processed_at', 'attempts', 'last_error']
+    actions = ['retry_events']
+    
+    @admin.action(description='Retry selected events')
+    def retry_events(self, request, queryset):
+        updated = queryset.exclude(status='pending').update(status='pending', attempts=0)
+        self.message_user(request, f'{updated} events queued for processing')
@@ -0,0 +1,145 @@
+# payments/client.py
+import logging
+import os
+import threading
+import time
+
+import requests
+import stripe
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from backend.resilience import CircuitBreaker
+from health.metrics import MeteredCallStats
+
+logger = logging.getLogger(__name__)
+
+breaker = CircuitBreaker(
+    'stripe',
+    failure_threshold=settings.STRIPE_BREAKER_FAILURES,
+    reset_timeout=settings.STRIPE_BREAKER_RESET,
+)
+stats = MeteredCallStats('stripe')
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_stripe_client():
+    """
+    Shared StripeClient for this process. Requests go through one pooled
+    keep-alive session with connect/read timeouts; the SDK retries network
+    errors, 409s and 5xx with jittered backoff (up to
+    STRIPE_MAX_NETWORK_RETRIES) and reuses the idempotency key on retries.
+    A new client is built after a fork so workers never share sockets.
+    """
+    global _client, _client_pid
+
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = _build_client()
+                _client_pid = pid
+    return _client
+
+
+def _build_client():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.STRIPE_POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    http_client = stripe.RequestsClient(
+        timeout=(settings.STRIPE_CONNECT_TIMEOUT, settings.STRIPE_TIMEOUT),
+        session=session,
+    )
+
+    base_addresses = None
+    if settings.STRIPE_API_BASE:
+        # Local stub server (e.g. stripe-mock) for tests and load runs
+        base_addresses = {'api': settings.STRIPE_API_BASE}
+
+    return stripe.StripeClient(
+        settings.STRIPE_SECRET_KEY,
+        stripe_version=settings.STRIPE_API_VERSION,
+        base_addresses=base_addresses,
+        max_network_retries=settings.STRIPE_MAX_NETWORK_RETRIES,
+        http_client=http_client,
+    )
+
+
+def _is_outage(error):
+    """Errors that say Stripe itself is unhealthy, not that our request was bad"""
+    if isinstance(error, (stripe.APIConnectionError, stripe.RateLimitError)):
+        return True
+    return (getattr(error, 'http_status', None) or 0) >= 500
+
+
+def call_stripe(operation, func, *args, **kwargs):
+    """
+    Run one Stripe API call through the circuit breaker, recording its
+    latency and outcome under `operation`. Raises CircuitOpenError without
+    calling Stripe while the circuit is open.
+    """
+    breaker.before_call()
+    started = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+    except stripe.StripeError as e:
+        stats.record(operation, time.perf_counter() - started, error=type(e).__name__)
+        if _is_outage(e):
+            breaker.record_failure()
+            logger.warning('Stripe %s failed: %s', operation, e)
+        else:
+            breaker.record_success()
+        raise
+    except Exception as e:
+        stats.record(operation, time.perf_counter() - started, error=type(e).__name__)
+        breaker.record_failure()
+        raise
+    stats.record(operation, time.perf_counter() - started)
+    breaker.record_success()
+    return result
+
+
+def _options(idempotency_key):
+    return {'idempotency_key': idempotency_key} if idempotency_key else None
+
+
+def create_payment_intent(params, idempotency_key=None):
+    client = get_stripe_client()
+    return call_stripe(
+        'payment_intents.create', client.v1.payment_intents.create, params, _options(idempotency_key)
+    )
+
+
+def retrieve_payment_intent(intent_id):
+    client = get_stripe_client()
+    return call_stripe('payment_intents.retrieve', client.v1.payment_intents.retrieve, intent_id)
+
+
+def update_payment_intent(intent_id, params, idempotency_key=None):
+    client = get_stripe_client()
+    return call_stripe(
+        'payment_intents.update', client.v1.payment_intents.update,
+        intent_id, params, _options(idempotency_key)
+    )
+
+
+def cancel_payment_intent(intent_id, idempotency_key=None):
+    client = get_stripe_client()
+    return call_stripe(
+        'payment_intents.cancel', client.v1.payment_intents.cancel,
+        intent_id, None, _options(idempotency_key)
+    )
+
+
+def create_refund(params, idempotency_key=None):
+    client = get_stripe_client()
+    return call_stripe('refunds.create', client.v1.refunds.create, params, _options(idempotency_key))
+
+
+def health():
+    return {'circuit': breaker.snapshot(), 'operations': stats.snapshot()}
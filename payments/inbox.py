@@ -0,0 +1,252 @@
+# payments/inbox.py
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from orders.models import Order
+from orders.rollups import record_refunds, record_sales
+from . import client as stripe_client
+from .models import StripeEvent
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+
+PAYMENT_SUCCEEDED = 'payment_intent.succeeded'
+PAYMENT_FAILED = 'payment_intent.payment_failed'
+CHARGE_REFUNDED = 'charge.refunded'
+HANDLED_TYPES = (PAYMENT_SUCCEEDED, PAYMENT_FAILED, CHARGE_REFUNDED)
+
+
+def event_created(event):
+    return datetime.fromtimestamp(event.get('created') or 0, tz=dt_timezone.utc)
+
+
+def store_event(event):
+    """
+    Insert an event into the inbox with a single INSERT ... ON CONFLICT DO
+    NOTHING, so a redelivered event id is a no-op
+    """
+    StripeEvent.objects.bulk_create([
+        StripeEvent(
+            event_id=event['id'],
+            type=event.get('type', ''),
+            payload=event,
+            created=event_created(event),
+        )
+    ], ignore_conflicts=True)
+
+
+def _event_target(event):
+    """
+    (order_id, payment_intent_id) the event refers to
+    """
+    obj = event.get('data', {}).get('object', {})
+    if event.get('type') == CHARGE_REFUNDED:
+        return None, obj.get('payment_intent')
+
+    order_id = (obj.get('metadata') or {}).get('order_id')
+    try:
+        order_id = int(order_id) if order_id else None
+    except (TypeError, ValueError):
+        order_id = None
+    return order_id, obj.get('id')
+
+
+def _transition(state, event_type):
+    """
+    Advance an order's (status, payment_status) through one event.
+    Payment only moves forward: pending/failed -> paid -> refunded.
+    A cancelled order (reservation expired, stock released) is never
+    reopened: a payment for it is not counted as a sale, the order stays
+    cancelled with payment_status 'refund_pending' until Stripe confirms
+    the refund, and then becomes 'expired_refunded'.
+    """
+    if event_type == PAYMENT_SUCCEEDED:
+        if state['payment_status'] in ('pending', 'failed'):
+            if state['status'] == 'cancelled':
+                state['payment_status'] = 'refund_pending'
+                state['paid_after_cancel'] = True
+            else:
+                state['payment_status'] = 'paid'
+                state['status'] = 'processing'
+                state['sold'] = True
+    elif event_type == PAYMENT_FAILED:
+        if state['payment_status'] in ('pending', 'failed'):
+            state['payment_status'] = 'failed'
+    elif event_type == CHARGE_REFUNDED:
+        if state['payment_status'] == 'refund_pending':
+            state['payment_status'] = 'expired_refunded'
+        elif state['payment_status'] not in ('refunded', 'expired_refunded'):
+            state['refunded_sale'] = state['payment_status'] == 'paid' and state['status'] != 'cancelled'
+            state['payment_status'] = 'refunded'
+            state['status'] = 'cancelled'
+
+
+def apply_stripe_events(events, dry_run=False):
+    """
+    Apply a batch of Stripe events (raw event dicts) to orders.
+
+    All affected orders are loaded and locked with one query, the events are
+    replayed against them in event-time order in memory, and the results are
+    written with one set-based UPDATE per resulting state. Newly paid and
+    newly refunded orders are added to the sales rollups, and orders paid
+    after they were cancelled are refunded once the transaction commits.
+    With dry_run the computed changes are returned without writing anything.
+    """
+    events = sorted(
+        (event for event in events if event.get('type') in HANDLED_TYPES),
+        key=lambda event: (event.get('created') or 0, event.get('id', '')),
+    )
+
+    targets = [(event, *_event_target(event)) for event in events]
+    order_ids = {order_id for _, order_id, _ in targets if order_id}
+    intent_ids = {intent_id for _, _, intent_id in targets if intent_id}
+
+    result = {
+        'events': len(events), 'unmatched': 0, 'changes': [], 'sold': [], 'refunded': [], 'needs_refund': [],
+    }
+    if not events:
+        return result
+
+    orders = Order.objects.filter(Q(id__in=order_ids) | Q(stripe_payment_intent__in=intent_ids))
+    if not dry_run:
+        orders = orders.select_for_update()
+
+    states = {}
+    by_intent = defaultdict(list)
+    for order in orders.values('id', 'order_number', 'status', 'payment_status', 'stripe_payment_intent'):
+        states[order['id']] = {**order, 'before': (order['status'], order['payment_status'])}
+        if order['stripe_payment_intent']:
+            by_intent[order['stripe_payment_intent']].append(order['id'])
+
+    for event, order_id, intent_id in targets:
+        if order_id in states:
+            matched = [order_id]
+        else:
+            matched = by_intent.get(intent_id, [])
+
+        if not matched:
+            result['unmatched'] += 1
+            logger.warning('No order found for Stripe event %s (%s)', event.get('id'), event['type'])
+            continue
+
+        for matched_id in matched:
+            state = states[matched_id]
+            _transition(state, event['type'])
+            if state.pop('paid_after_cancel', False):
+                state['refund_event'] = event['id']
+
+    updates = defaultdict(list)
+    for order_id, state in states.items():
+        after = (state['status'], state['payment_status'])
+        if after != state['before']:
+            updates[after].append(order_id)
+            result['changes'].append({
+                'order_id': order_id,
+                'order_number': state['order_number'],
+                'before': state['before'],
+                'after': after,
+            })
+        if state.get('sold'):
+            result['sold'].append(order_id)
+        if state.get('refunded_sale'):
+            result['refunded'].append(order_id)
+        if state.get('refund_event') and state['payment_status'] == 'refund_pending':
+            result['needs_refund'].append(order_id)
+
+    if dry_run:
+        return result
+
+    now = timezone.now()
+    for (order_status, payment_status), ids in updates.items():
+        Order.objects.filter(id__in=ids).update(
+            status=order_status, payment_status=payment_status, updated_at=now
+        )
+
+    record_sales(result['sold'])
+    record_refunds(result['refunded'])
+    for order_id in result['needs_refund']:
+        state = states[order_id]
+        transaction.on_commit(
+            lambda state=state: refund_cancelled_order(
+                state['order_number'], state['stripe_payment_intent'], state['refund_event']
+            ),
+            robust=True,
+        )
+    return result
+
+
+def refund_cancelled_order(order_number, intent_id, event_id):
+    """
+    Refund a payment that arrived after its order was cancelled. The
+    idempotency key is tied to the Stripe event, so a replayed event never
+    refunds twice. On failure the order stays 'refund_pending' (filterable
+    in the admin) for a manual refund.
+    """
+    logger.warning('Order %s was paid after its reservation expired; refunding %s', order_number, intent_id)
+    try:
+        stripe_client.create_refund(
+            {'payment_intent': intent_id}, idempotency_key=f'refund-cancelled:{event_id}'
+        )
+    except Exception as e:
+        logger.error('Refund for cancelled order %s failed, refund it manually: %s', order_number, e)
+
+
+def process_pending_events(batch_size=200):
+    """
+    Apply one batch of pending inbox events. Events locked by another worker
+    are skipped. If the batch fails as a whole, its events are retried one
+    by one so a single bad event cannot block the rest; events that keep
+    failing are parked as 'failed' after MAX_ATTEMPTS.
+    Returns the number of events taken from the inbox.
+    """
+    with transaction.atomic():
+        batch = list(
+            StripeEvent.objects.select_for_update(skip_locked=True)
+            .filter(status='pending')
+            .order_by('created', 'id')[:batch_size]
+        )
+        if not batch:
+            return 0
+
+        try:
+            with transaction.atomic():
+                result = apply_stripe_events([event.payload for event in batch])
+        except Exception as e:
+            logger.error('Stripe event batch failed, retrying events one by one: %s', e, exc_info=True)
+            for event in batch:
+                _process_single(event)
+            return len(batch)
+
+        StripeEvent.objects.filter(id__in=[event.id for event in batch]).update(
+            status='processed', processed_at=timezone.now(), attempts=F('attempts') + 1, last_error=''
+        )
+
+    logger.info(
+        'Processed %s Stripe events: %s orders updated, %s paid, %s refunded, %s unmatched',
+        len(batch), len(result['changes']), len(result['sold']), len(result['refunded']), result['unmatched'],
+    )
+    return len(batch)
+
+
+def _process_single(event):
+    try:
+        with transaction.atomic():
+            apply_stripe_events([event.payload])
+    except Exception as e:
+        attempts = event.attempts + 1
+        StripeEvent.objects.filter(id=event.id).update(
+            attempts=attempts,
+            last_error=str(e)[:2000],
+            status='failed' if attempts >= MAX_ATTEMPTS else 'pending',
+        )
+        logger.error('Stripe event %s failed (attempt %s): %s', event.event_id, attempts, e)
+    else:
+        StripeEvent.objects.filter(id=event.id).update(
+            status='processed', processed_at=timezone.now(), attempts=F('attempts') + 1, last_error=''
+        )
@@ -0,0 +1,82 @@
+# payments/intents.py
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from orders.models import Order
+from . import client as stripe_client
+
+logger = logging.getLogger(__name__)
+
+# PaymentIntent states in which the amount can still be changed
+UPDATABLE_STATUSES = ('requires_payment_method', 'requires_confirmation', 'requires_action')
+
+
+def intent_cache_key(order_id):
+    return f'payment_intent:{order_id}'
+
+
+def order_amount(order):
+    """Order total in cents"""
+    return int(order.total * 100)
+
+
+def remember_intent(order_id, intent):
+    """
+    Cache an intent's client secret once the surrounding transaction commits
+    """
+    record = {'id': intent.id, 'client_secret': intent.client_secret, 'amount': intent.amount}
+    transaction.on_commit(
+        lambda: cache.set(intent_cache_key(order_id), record, timeout=settings.PAYMENT_INTENT_CACHE_TTL)
+    )
+    return record
+
+
+def ensure_payment_intent(order):
+    """
+    Return {id, client_secret, amount} for the order's PaymentIntent.
+
+    The cached client secret is returned without calling Stripe while the
+    amount matches the order total. Otherwise the existing intent is fetched
+    and updated to the new amount, and a new intent is only created when the
+    order has none (or its old one was canceled). `order` must be locked with
+    select_for_update so concurrent calls cannot create two intents.
+    """
+    amount = order_amount(order)
+    record = cache.get(intent_cache_key(order.id))
+    if record and record['id'] == order.stripe_payment_intent and record['amount'] == amount:
+        return record
+
+    intent = None
+    if order.stripe_payment_intent:
+        if record and record['id'] == order.stripe_payment_intent:
+            # Cached but stale amount: we know the intent, skip the retrieve
+            intent = _update_amount(order.stripe_payment_intent, amount)
+        else:
+            intent = stripe_client.retrieve_payment_intent(order.stripe_payment_intent)
+            if intent.status == 'canceled':
+                intent = None
+            elif intent.amount != amount and intent.status in UPDATABLE_STATUSES:
+                intent = _update_amount(intent.id, amount)
+
+    if intent is None:
+        intent = stripe_client.create_payment_intent({
+            'amount': amount,
+            'currency': 'usd',
+            'metadata': {'order_id': order.id, 'order_number': order.order_number},
+            'automatic_payment_methods': {'enabled': True},
+        }, idempotency_key=f'payment-intent:{order.id}:{order.stripe_payment_intent or "new"}:{amount}')
+        Order.objects.filter(id=order.id).update(stripe_payment_intent=intent.id)
+        order.stripe_payment_intent = intent.id
+        logger.info('Payment intent created: %s for order %s', intent.id, order.order_number)
+
+    return remember_intent(order.id, intent)
+
+
+def _update_amount(intent_id, amount):
+    logger.info('Updating payment intent %s amount to %s', intent_id, amount)
+    return stripe_client.update_payment_intent(
+        intent_id, {'amount': amount}, idempotency_key=f'payment-intent-update:{intent_id}:{amount}'
+    )
@@ -0,0 +1,44 @@
+# payments/management/commands/process_stripe_events.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.inbox import process_pending_events
+
+
+class Command(BaseCommand):
+    help = 'Apply pending Stripe webhook events from the inbox to orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Events applied per transaction (default: 200)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling the inbox instead of exiting once it is empty',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait when the inbox is empty in --loop mode (default: 1)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = 0
+
+        while True:
+            processed = process_pending_events(batch_size=batch_size)
+            total += processed
+
+            if processed < batch_size:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Processed {total} Stripe events'))
@@ -0,0 +1,129 @@
+# payments/management/commands/replay_stripe_events.py
+import json
+import sys
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from payments.inbox import HANDLED_TYPES, apply_stripe_events, event_created
+from payments.models import StripeEvent
+
+
+class Command(BaseCommand):
+    help = 'Replay exported Stripe events (one JSON event per line) against orders in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="JSONL file of Stripe events, or '-' for stdin")
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Events applied per transaction (default: 500)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show the order changes the replay would make without writing anything',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        events = self.read_events(options['path'])
+        events.sort(key=lambda event: (event.get('created') or 0, event['id']))
+
+        by_type = Counter(event['type'] for event in events)
+        self.stdout.write(f'\n📥 Read {len(events):,} events')
+        for event_type, count in by_type.most_common():
+            marker = '' if event_type in HANDLED_TYPES else ' (ignored)'
+            self.stdout.write(f'   {event_type}: {count:,}{marker}')
+
+        if options['dry_run']:
+            # One pass so later events see the state earlier ones would leave
+            results = [apply_stripe_events(events, dry_run=True)]
+        else:
+            results = []
+            batch_size = options['batch_size']
+            for start in range(0, len(events), batch_size):
+                results.append(self.apply_batch(events[start:start + batch_size]))
+
+        changes = [change for result in results for change in result['changes']]
+        sold = sum(len(result['sold']) for result in results)
+        refunded = sum(len(result['refunded']) for result in results)
+        unmatched = sum(result['unmatched'] for result in results)
+        needs_refund = sum(len(result['needs_refund']) for result in results)
+
+        if options['dry_run']:
+            self.stdout.write(f'\n🔍 Dry run: {len(changes):,} orders would change')
+            for change in changes:
+                before = '/'.join(change['before'])
+                after = '/'.join(change['after'])
+                self.stdout.write(f"   {change['order_number']}: {before} → {after}")
+
+        elapsed = time.perf_counter() - started
+        rate = len(events) / elapsed if elapsed else 0
+        self.stdout.write(
+            f'\n📊 {len(changes):,} orders changed, {sold:,} paid, {refunded:,} refunded, '
+            f'{unmatched:,} events without a matching order'
+        )
+        if needs_refund:
+            self.stdout.write(self.style.WARNING(
+                f'⚠️  {needs_refund:,} cancelled orders were paid and '
+                f'{"would be" if options["dry_run"] else "are being"} refunded (payment_status refund_pending)'
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {"Checked" if options["dry_run"] else "Replayed"} {len(events):,} events '
+            f'in {elapsed:.2f}s ({rate:,.0f} events/s)'
+        ))
+
+    def read_events(self, path):
+        stream = sys.stdin if path == '-' else None
+        try:
+            stream = stream or open(path, encoding='utf-8')
+        except OSError as e:
+            raise CommandError(f'Cannot read {path}: {e}')
+
+        events = {}
+        with stream:
+            for line_number, line in enumerate(stream, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise CommandError(f'Line {line_number}: invalid JSON ({e})')
+                if not isinstance(event, dict) or 'id' not in event or 'type' not in event:
+                    raise CommandError(f'Line {line_number}: not a Stripe event')
+                # Exports can overlap; keep one copy per event id
+                events[event['id']] = event
+
+        return list(events.values())
+
+    @transaction.atomic
+    def apply_batch(self, events):
+        """
+        Record the events in the inbox and apply them. Events the inbox
+        already holds as pending are marked processed so the worker skips them.
+        """
+        now = timezone.now()
+        StripeEvent.objects.bulk_create([
+            StripeEvent(
+                event_id=event['id'],
+                type=event['type'],
+                payload=event,
+                created=event_created(event),
+                status='processed',
+                processed_at=now,
+            )
+            for event in events
+        ], ignore_conflicts=True)
+
+        result = apply_stripe_events(events)
+
+        StripeEvent.objects.filter(
+            event_id__in=[event['id'] for event in events]
+        ).exclude(status='processed').update(status='processed', processed_at=now, last_error='')
+        return result
@@ -0,0 +1,38 @@
+# payments/models.py
+from django.db import models
+
+
+class StripeEvent(models.Model):
+    """
+    Inbox of received Stripe webhook events. The webhook only verifies and
+    stores events (deduplicated by Stripe's event id); the
+    process_stripe_events worker applies them to orders in batches.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('failed', 'Failed'),
+    ]
+
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    created = models.DateTimeField(help_text='When Stripe created the event')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created', 'id']
+        indexes = [
+            models.Index(
+                fields=['created', 'id'],
+                condition=models.Q(status='pending'),
+                name='stripe_event_pending_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.type} ({self.event_id})"
@@ -0,0 +1,133 @@
+# payments/tests.py
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from orders.models import Order
+from users.models import Address, User
+
+from .intents import ensure_payment_intent, intent_cache_key
+
+
+def stripe_intent(intent_id='pi_1', amount=20000, status='requires_payment_method'):
+    return mock.Mock(id=intent_id, client_secret=f'{intent_id}_secret', amount=amount, status=status)
+
+
+class PaymentTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='buyer', clerk_id='user_buyer')
+        address = Address.objects.create(
+            user=self.user, full_name='Buyer', phone='555', address_line1='1 Main St',
+            city='Springfield', state='IL', postal_code='62701', country='US',
+        )
+        self.order = Order.objects.create(
+            user=self.user, order_number='ORD-1', shipping_address=address, shipping_method='standard',
+            subtotal=Decimal('200.00'), total=Decimal('200.00'), payment_method='card',
+        )
+
+
+@mock.patch('payments.intents.stripe_client')
+class EnsurePaymentIntentTests(PaymentTestCase):
+    def ensure(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return ensure_payment_intent(self.order)
+
+    def test_order_without_intent_gets_a_new_one(self, stripe_client):
+        stripe_client.create_payment_intent.return_value = stripe_intent()
+
+        record = self.ensure()
+
+        self.assertEqual(record, {'id': 'pi_1', 'client_secret': 'pi_1_secret', 'amount': 20000})
+        self.assertEqual(stripe_client.create_payment_intent.call_args.args[0]['amount'], 20000)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.stripe_payment_intent, 'pi_1')
+        self.assertEqual(cache.get(intent_cache_key(self.order.id)), record)
+
+    def test_cached_intent_is_reused_without_calling_stripe(self, stripe_client):
+        stripe_client.create_payment_intent.return_value = stripe_intent()
+        self.ensure()
+        stripe_client.reset_mock()
+
+        record = self.ensure()
+
+        self.assertEqual(record['id'], 'pi_1')
+        self.assertEqual(stripe_client.mock_calls, [])
+
+    def test_changed_amount_updates_the_intent(self, stripe_client):
+        stripe_client.create_payment_intent.return_value = stripe_intent()
+        self.ensure()
+        stripe_client.update_payment_intent.return_value = stripe_intent(amount=25000)
+        self.order.total = Decimal('250.00')
+
+        record = self.ensure()
+
+        stripe_client.update_payment_intent.assert_called_once_with(
+            'pi_1', {'amount': 25000}, idempotency_key='payment-intent-update:pi_1:25000'
+        )
+        stripe_client.retrieve_payment_intent.assert_not_called()
+        self.assertEqual(record['amount'], 25000)
+        self.assertEqual(stripe_client.create_payment_intent.call_count, 1)
+
+    def test_uncached_intent_is_retrieved_and_updated(self, stripe_client):
+        Order.objects.filter(id=self.order.id).update(stripe_payment_intent='pi_1')
+        self.order.refresh_from_db()
+        stripe_client.retrieve_payment_intent.return_value = stripe_intent(amount=15000)
+        stripe_client.update_payment_intent.return_value = stripe_intent(amount=20000)
+
+        record = self.ensure()
+
+        stripe_client.retrieve_payment_intent.assert_called_once_with('pi_1')
+        stripe_client.update_payment_intent.assert_called_once()
+        stripe_client.create_payment_intent.assert_not_called()
+        self.assertEqual(record['amount'], 20000)
+
+    def test_canceled_intent_is_replaced(self, stripe_client):
+        Order.objects.filter(id=self.order.id).update(stripe_payment_intent='pi_old')
+        self.order.refresh_from_db()
+        stripe_client.retrieve_payment_intent.return_value = stripe_intent('pi_old', status='canceled')
+        stripe_client.create_payment_intent.return_value = stripe_intent('pi_new')
+
+        record = self.ensure()
+
+        self.assertEqual(record['id'], 'pi_new')
+        self.assertEqual(
+            stripe_client.create_payment_intent.call_args.kwargs['idempotency_key'],
+            f'payment-intent:{self.order.id}:pi_old:20000',
+        )
+
+
+class CreatePaymentIntentViewTests(PaymentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def request_intent(self, order_id):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/payments/intent/', {'order_id': order_id}, format='json')
+
+    @mock.patch('payments.intents.stripe_client.create_payment_intent', return_value=stripe_intent())
+    def test_locks_the_order_before_ensuring_its_intent(self, create_payment_intent):
+        with mock.patch.object(Order.objects, 'select_for_update', wraps=Order.objects.select_for_update) as lock:
+            response = self.request_intent(self.order.id)
+
+        lock.assert_called_once_with()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'client_secret': 'pi_1_secret', 'payment_intent_id': 'pi_1', 'amount': 20000})
+
+        self.assertEqual(self.request_intent(self.order.id).data['payment_intent_id'], 'pi_1')
+        create_payment_intent.assert_called_once()
+
+    @mock.patch('payments.intents.stripe_client.create_payment_intent')
+    def test_cancelled_or_foreign_orders_are_refused(self, create_payment_intent):
+        other = User.objects.create(username='other', clerk_id='user_other')
+        Order.objects.filter(id=self.order.id).update(status='cancelled')
+
+        self.assertEqual(self.request_intent(self.order.id).status_code, 400)
+        self.client.force_authenticate(other)
+        self.assertEqual(self.request_intent(self.order.id).status_code, 404)
+        create_payment_intent.assert_not_called()
@@ -4,19 +4,26 @@ from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.conf import settings
+from django.shortcuts import get_object_or_404
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+import json
 import stripe
+from backend.resilience import CircuitOpenError
+from orders.idempotency import idempotent
 from orders.models import Order
+from .inbox import store_event
+from .intents import ensure_payment_intent
 
 logger = logging.getLogger(__name__)
 
-# Configure Stripe
-stripe.api_key = settings.STRIPE_SECRET_KEY
-
 @csrf_exempt
 @require_POST
 def stripe_webhook(request):
     """
-    Handle Stripe webhook events
+    Verify Stripe webhook events and store them in the inbox
     """
     payload = request.body
     sig_header = request.META.get('HTTP_STRIPE_SIGNATURE')
@@ -31,109 +38,61 @@ def stripe_webhook(request):
             payload, sig_header, settings.STRIPE_WEBHOOK_SECRET
         )
     except ValueError as e:
-        logger.error(f'Invalid Stripe webhook payload: {str(e)}')
+        logger.error('Invalid Stripe webhook payload: %s', e)
         return JsonResponse({'error': 'Invalid payload'}, status=400)
-    except stripe.error.SignatureVerificationError as e:
-        logger.error(f'Invalid Stripe webhook signature: {str(e)}')
+    except stripe.SignatureVerificationError as e:
+        logger.error('Invalid Stripe webhook signature: %s', e)
         return JsonResponse({'error': 'Invalid signature'}, status=400)
     
-    # Handle the event
-    event_type = event.get('type')
-    logger.info(f'Received Stripe webhook event: {event_type}')
-    
+    # Store the event and acknowledge straight away; the process_stripe_events
+    # worker applies it to orders
     try:
-        if event_type == 'payment_intent.succeeded':
-            payment_intent = event['data']['object']
-            order_id = payment_intent.get('metadata', {}).get('order_id')
-            
-            if order_id:
-                try:
-                    order = Order.objects.get(id=order_id)
-                    order.payment_status = 'paid'
-                    order.status = 'processing'
-                    order.save()
-                    
-                    logger.info(f'Payment succeeded for order {order.order_number}')
-                except Order.DoesNotExist:
-                    logger.error(f'Order {order_id} not found for payment_intent.succeeded')
-            else:
-                logger.warning('No order_id in payment_intent metadata')
-        
-        elif event_type == 'payment_intent.payment_failed':
-            payment_intent = event['data']['object']
-            order_id = payment_intent.get('metadata', {}).get('order_id')
-            
-            if order_id:
-                try:
-                    order = Order.objects.get(id=order_id)
-                    order.payment_status = 'failed'
-                    order.save()
-                    
-                    logger.warning(f'Payment failed for order {order.order_number}')
-                except Order.DoesNotExist:
-                    logger.error(f'Order {order_id} not found for payment_intent.payment_failed')
-        
-        elif event_type == 'charge.refunded':
-            charge = event['data']['object']
-            payment_intent_id = charge.get('payment_intent')
-            
-            if payment_intent_id:
-                try:
-                    order = Order.objects.get(stripe_payment_intent=payment_intent_id)
-                    order.payment_status = 'refunded'
-                    order.status = 'cancelled'
-                    order.save()
-                    
-                    logger.info(f'Refund processed for order {order.order_number}')
-                except Order.DoesNotExist:
-                    logger.error(f'Order not found for refunded charge')
-        
-        else:
-            logger.info(f'Unhandled Stripe event type: {event_type}')
-    
+        store_event(json.loads(payload))
     except Exception as e:
-        logger.error(f'Error processing Stripe webhook: {str(e)}', exc_info=True)
+        logger.error('Error storing Stripe webhook event: %s', e, exc_info=True)
         return JsonResponse({'error': 'Processing failed'}, status=500)
     
+    logger.info('Queued Stripe webhook event %s: %s', event.get('id'), event.get('type'))
     return HttpResponse(status=200)
 
 
-@csrf_exempt
-@require_POST
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@idempotent('payment-intent')
 def create_payment_intent(request):
     """
-    Create a Stripe payment intent for an order
+    Return the Stripe payment intent for one of the user's orders.
+    The amount always comes from the order; an existing intent is reused
+    (from cache when unchanged) or updated instead of creating a new one.
     """
+    order_id = request.data.get('order_id')
+    if not str(order_id or '').isdigit():
+        return Response({'error': 'A numeric order_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    order = get_object_or_404(
+        Order.objects.select_for_update(), id=order_id, user=request.user
+    )
+    
+    if order.payment_status in ('paid', 'refunded') or order.status == 'cancelled':
+        return Response(
+            {'error': f'Order {order.order_number} can no longer be paid'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
     try:
-        import json
-        data = json.loads(request.body)
-        
-        amount = data.get('amount')
-        currency = data.get('currency', 'usd')
-        order_id = data.get('order_id')
-        
-        if not amount or not order_id:
-            return JsonResponse({
-                'error': 'Amount and order_id are required'
-            }, status=400)
-        
-        # Create payment intent
-        intent = stripe.PaymentIntent.create(
-            amount=int(amount * 100),  # Convert to cents
-            currency=currency,
-            metadata={'order_id': order_id},
-            automatic_payment_methods={'enabled': True},
+        intent = ensure_payment_intent(order)
+    except CircuitOpenError as e:
+        return Response(
+            {'error': 'Payments are temporarily unavailable, please try again shortly'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={'Retry-After': str(int(e.retry_after))}
         )
-        
-        logger.info(f'Payment intent created: {intent.id} for order {order_id}')
-        
-        return JsonResponse({
-            'client_secret': intent.client_secret,
-            'payment_intent_id': intent.id
-        })
-        
-    except Exception as e:
-        logger.error(f'Error creating payment intent: {str(e)}', exc_info=True)
-        return JsonResponse({
-            'error': str(e)
-        }, status=500)
\ No newline at end of file
+    except stripe.StripeError as e:
+        logger.error('Error preparing payment intent for order %s: %s', order.order_number, e)
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'client_secret': intent['client_secret'],
+        'payment_intent_id': intent['id'],
+        'amount': intent['amount'],
+    })
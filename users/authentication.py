@@ -1,14 +1,49 @@
 # users/authentication.py
+import hashlib
 import logging
+import time
 import requests
 from django.conf import settings
 from django.core.cache import cache
 from rest_framework import authentication
 from rest_framework.exceptions import AuthenticationFailed
-from .models import User
+from backend.resilience import CircuitOpenError, SingleFlight
+from . import clerk_client
+from .clerk_jwt import InvalidToken, VerificationUnavailable, token_expiry, verify_session_token
+from .identity import cache_identity, get_identity
+from .profile_sync import mark_profile_synced, schedule_profile_sync
+from .provisioning import provision_user
 
 logger = logging.getLogger(__name__)
 
+# Cached in place of a clerk_id for tokens that failed verification
+REJECTED_TOKEN = '!rejected'
+
+
+class TokenRejected(AuthenticationFailed):
+    """The token itself is invalid (as opposed to Clerk being unreachable)"""
+    default_detail = 'Invalid or expired token'
+
+
+class ClerkUnavailable(AuthenticationFailed):
+    """Clerk could not answer; says nothing about the token"""
+    default_detail = 'Authentication service unavailable'
+
+
+_verifications = SingleFlight()
+
+
+def token_cache_key(token):
+    return f'clerk_token:{hashlib.sha256(token.encode()).hexdigest()}'
+
+
+def token_cache_ttl(expires_at):
+    """Seconds until the token expires, capped at CLERK_TOKEN_CACHE_MAX_TTL"""
+    if expires_at is None:
+        return settings.CLERK_TOKEN_CACHE_MAX_TTL
+    return min(int(expires_at - time.time()), settings.CLERK_TOKEN_CACHE_MAX_TTL)
+
+
 class ClerkAuthentication(authentication.BaseAuthentication):
     """
     Custom authentication backend for Clerk
@@ -32,179 +67,164 @@ class ClerkAuthentication(authentication.BaseAuthentication):
             raise AuthenticationFailed('Invalid token header format')
         
         # Check cache first to reduce API calls
-        cache_key = f'clerk_token:{token[:20]}'  # Use part of token as key
-        cached_user_id = cache.get(cache_key)
+        cache_key = token_cache_key(token)
+        clerk_user_id = cache.get(cache_key)
         
-        if cached_user_id:
-            try:
-                user = User.objects.get(clerk_id=cached_user_id)
-                return (user, None)
-            except User.DoesNotExist:
-                cache.delete(cache_key)
+        if clerk_user_id == REJECTED_TOKEN:
+            raise TokenRejected()
         
-        # Verify token with Clerk
         try:
-            clerk_user_id = self.verify_clerk_token(token)
-            clerk_user_data = self.fetch_clerk_user(clerk_user_id)
+            verified_now = not clerk_user_id
+            if verified_now:
+                # Parallel requests with the same fresh token share one verification
+                clerk_user_id = _verifications.do(
+                    cache_key, lambda: self.verify_and_cache(token, cache_key)
+                )
+            
+            # Identity cache: no query unless the view reads profile fields
+            user = get_identity(clerk_user_id)
             
-            # Get or create user
-            user = self.get_or_create_user(clerk_user_id, clerk_user_data)
+            if user is None:
+                # First sign-in: the Clerk profile is needed to create the account
+                clerk_user_data = _verifications.do(
+                    f'profile:{clerk_user_id}', lambda: self.fetch_clerk_user(clerk_user_id)
+                )
+                user, created = provision_user(clerk_user_id, clerk_user_data)
+                if created:
+                    logger.info('New user created: %s (clerk_id: %s)', user.username, clerk_user_id)
+                cache_identity(user)
+                mark_profile_synced(clerk_user_id)
+            elif verified_now:
+                # Profiles follow webhooks; refresh from Clerk now and then off the request path
+                schedule_profile_sync(clerk_user_id)
             
-            # Cache the user ID for 5 minutes
-            cache.set(cache_key, clerk_user_id, timeout=300)
+            if not user.is_active:
+                raise AuthenticationFailed('User account is disabled')
             
             return (user, None)
             
-        except requests.RequestException as e:
-            logger.error(f'Clerk API request failed: {str(e)}')
+        except AuthenticationFailed:
+            raise
+        except (requests.RequestException, CircuitOpenError) as e:
+            logger.error('Clerk API request failed: %s', e)
             raise AuthenticationFailed('Authentication service unavailable')
         except Exception as e:
-            logger.error(f'Authentication error: {str(e)}', exc_info=True)
+            logger.error('Authentication error: %s', e, exc_info=True)
             raise AuthenticationFailed('Authentication failed')
     
-    def verify_clerk_token(self, token):
+    def verify_and_cache(self, token, cache_key):
         """
-        Verify token with Clerk API
-        Returns clerk_user_id if valid
+        Verify a token once across all workers and cache the outcome.
+        If another worker is already verifying it, wait briefly for its
+        result instead. While Clerk is unavailable, a token verified within
+        CLERK_STALE_IDENTITY_TTL keeps its identity, but never past its own
+        exp (plus CLERK_JWT_LEEWAY).
         """
+        lock_key = f'{cache_key}:verifying'
+        if not cache.add(lock_key, 1, timeout=settings.CLERK_VERIFY_LOCK_TIMEOUT):
+            clerk_user_id = self.wait_for_verification(cache_key)
+            if clerk_user_id:
+                return clerk_user_id
+        
+        stale_key = f'{cache_key}:stale'
         try:
-            response = requests.post(
-                f'{settings.CLERK_API_URL}/tokens/verify',
-                headers={
-                    'Authorization': f'Bearer {settings.CLERK_SECRET_KEY}',
-                    'Content-Type': 'application/json'
-                },
-                json={'token': token},
-                timeout=5  # 5 second timeout
-            )
-            
-            if response.status_code == 200:
-                token_data = response.json()
-                clerk_user_id = token_data.get('sub') or token_data.get('user_id')
-                
-                if not clerk_user_id:
-                    raise AuthenticationFailed('User ID not found in token')
-                
+            clerk_user_id, expires_at = self.verify_token(token)
+        except TokenRejected:
+            # Short negative cache so replayed bad tokens never reach Clerk
+            cache.set(cache_key, REJECTED_TOKEN, timeout=settings.CLERK_TOKEN_REJECT_TTL)
+            raise
+        except (ClerkUnavailable, requests.RequestException, CircuitOpenError):
+            stale = cache.get(stale_key)
+            if not stale or time.time() > stale[1] + settings.CLERK_JWT_LEEWAY:
+                raise
+            logger.warning('Clerk unavailable, serving recently verified identity %s', stale[0])
+            return stale[0]
+        finally:
+            cache.delete(lock_key)
+        
+        # Cache the user ID until the token expires
+        ttl = token_cache_ttl(expires_at)
+        if ttl > 0:
+            cache.set(cache_key, clerk_user_id, timeout=ttl)
+        if expires_at is not None:
+            # A token whose exp cannot be read is never served stale
+            stale_ttl = min(settings.CLERK_STALE_IDENTITY_TTL, int(expires_at - time.time()) + settings.CLERK_JWT_LEEWAY)
+            if stale_ttl > 0:
+                cache.set(stale_key, (clerk_user_id, expires_at), timeout=stale_ttl)
+        return clerk_user_id
+    
+    def wait_for_verification(self, cache_key):
+        deadline = time.monotonic() + settings.CLERK_VERIFY_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            clerk_user_id = cache.get(cache_key)
+            if clerk_user_id == REJECTED_TOKEN:
+                raise TokenRejected()
+            if clerk_user_id:
                 return clerk_user_id
-            elif response.status_code == 401:
-                raise AuthenticationFailed('Invalid or expired token')
-            else:
-                logger.error(f'Clerk token verification failed: {response.status_code}')
-                raise AuthenticationFailed('Token verification failed')
-                
-        except requests.Timeout:
-            logger.error('Clerk API timeout during token verification')
-            raise AuthenticationFailed('Authentication service timeout')
+            if cache.get(f'{cache_key}:verifying') is None:
+                break
+        return None
     
-    def fetch_clerk_user(self, clerk_user_id):
+    def verify_token(self, token):
         """
-        Fetch full user details from Clerk
+        Verify a session token without a network call when possible.
+        Only tokens that cannot be checked locally because Clerk's JWKS is
+        unreachable go to Clerk's verify API; a signing key missing from
+        freshly fetched keys rejects the token.
+        Returns (clerk_user_id, exp)
         """
         try:
-            response = requests.get(
-                f'{settings.CLERK_API_URL}/users/{clerk_user_id}',
-                headers={
-                    'Authorization': f'Bearer {settings.CLERK_SECRET_KEY}',
-                    'Content-Type': 'application/json'
-                },
-                timeout=5
-            )
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                logger.error(f'Failed to fetch Clerk user: {response.status_code}')
-                raise AuthenticationFailed('Could not fetch user details')
-                
-        except requests.Timeout:
-            logger.error('Clerk API timeout during user fetch')
-            raise AuthenticationFailed('Authentication service timeout')
+            claims = verify_session_token(token)
+        except InvalidToken as e:
+            logger.info('Rejected Clerk token: %s', e)
+            raise TokenRejected()
+        except VerificationUnavailable as e:
+            logger.warning('Local token verification unavailable, asking Clerk: %s', e)
+            return self.verify_clerk_token(token), token_expiry(token)
+        
+        return claims['sub'], claims['exp']
     
-    def get_or_create_user(self, clerk_user_id, clerk_user_data):
+    def verify_clerk_token(self, token):
         """
-        Get or create Django user from Clerk data
+        Verify token with Clerk API
+        Returns clerk_user_id if valid
         """
         try:
-            # Try to get existing user
-            user = User.objects.get(clerk_id=clerk_user_id)
-            
-            # Update user info if needed
-            self.update_user_info(user, clerk_user_data)
+            response = clerk_client.verify_token(token)
+        except requests.Timeout:
+            logger.error('Clerk API timeout during token verification')
+            raise ClerkUnavailable('Authentication service timeout')
+        
+        if response.status_code == 200:
+            token_data = response.json()
+            clerk_user_id = token_data.get('sub') or token_data.get('user_id')
             
-            return user
+            if not clerk_user_id:
+                raise TokenRejected('User ID not found in token')
             
-        except User.DoesNotExist:
-            # Create new user
-            return self.create_user(clerk_user_id, clerk_user_data)
-    
-    def create_user(self, clerk_user_id, clerk_user_data):
-        """
-        Create a new Django user from Clerk data
-        """
-        email_addresses = clerk_user_data.get('email_addresses', [])
-        email = email_addresses[0].get('email_address', '') if email_addresses else ''
-        
-        # Generate unique username
-        base_username = clerk_user_data.get('username')
-        if not base_username:
-            base_username = email.split('@')[0] if email else f'user_{clerk_user_id[:8]}'
-        
-        username = self.generate_unique_username(base_username)
-        
-        user = User.objects.create(
-            clerk_id=clerk_user_id,
-            username=username,
-            email=email,
-            first_name=clerk_user_data.get('first_name', ''),
-            last_name=clerk_user_data.get('last_name', ''),
-            avatar=clerk_user_data.get('image_url', ''),
-        )
-        
-        logger.info(f'New user created: {user.username} (clerk_id: {clerk_user_id})')
-        return user
-    
-    def update_user_info(self, user, clerk_user_data):
-        """
-        Update user information from Clerk data
-        """
-        email_addresses = clerk_user_data.get('email_addresses', [])
-        
-        updated = False
-        
-        if email_addresses:
-            new_email = email_addresses[0].get('email_address', user.email)
-            if new_email != user.email:
-                user.email = new_email
-                updated = True
-        
-        if clerk_user_data.get('first_name') and clerk_user_data['first_name'] != user.first_name:
-            user.first_name = clerk_user_data['first_name']
-            updated = True
-        
-        if clerk_user_data.get('last_name') and clerk_user_data['last_name'] != user.last_name:
-            user.last_name = clerk_user_data['last_name']
-            updated = True
-        
-        if clerk_user_data.get('image_url') and clerk_user_data['image_url'] != user.avatar:
-            user.avatar = clerk_user_data['image_url']
-            updated = True
-        
-        if updated:
-            user.save()
-            logger.info(f'User updated: {user.username}')
+            return clerk_user_id
+        elif response.status_code == 401:
+            raise TokenRejected()
+        else:
+            logger.error('Clerk token verification failed: %s', response.status_code)
+            raise ClerkUnavailable('Token verification failed')
     
-    def generate_unique_username(self, base_username):
+    def fetch_clerk_user(self, clerk_user_id):
         """
-        Generate a unique username by appending numbers if needed
+        Fetch full user details from Clerk
         """
-        username = base_username
-        counter = 1
-        
-        while User.objects.filter(username=username).exists():
-            username = f'{base_username}{counter}'
-            counter += 1
+        try:
+            response = clerk_client.get_user(clerk_user_id)
+        except requests.Timeout:
+            logger.error('Clerk API timeout during user fetch')
+            raise ClerkUnavailable('Authentication service timeout')
         
-        return username
+        if response.status_code == 200:
+            return response.json()
+        else:
+            logger.error('Failed to fetch Clerk user: %s', response.status_code)
+            raise AuthenticationFailed('Could not fetch user details')
     
     def authenticate_header(self, request):
         """
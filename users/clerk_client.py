@@ -0,0 +1,96 @@
+# users/clerk_client.py
+import logging
+import os
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from backend.resilience import CircuitBreaker
+from health.metrics import MeteredCallStats
+
+logger = logging.getLogger(__name__)
+
+breaker = CircuitBreaker(
+    'clerk',
+    failure_threshold=settings.CLERK_BREAKER_FAILURES,
+    reset_timeout=settings.CLERK_BREAKER_RESET,
+)
+stats = MeteredCallStats('clerk')
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Keep-alive session shared by every Clerk call in this process, so
+    requests reuse pooled TLS connections instead of a handshake each.
+    Rebuilt after a fork so workers never share sockets.
+    """
+    global _session, _session_pid
+
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.CLERK_POOL_SIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update({
+                    'Authorization': f'Bearer {settings.CLERK_SECRET_KEY}',
+                    'Content-Type': 'application/json',
+                })
+                _session = session
+                _session_pid = pid
+    return _session
+
+
+def clerk_request(operation, method, url, **kwargs):
+    """
+    Call the Clerk API through the pooled session and the circuit breaker.
+    Connection errors, timeouts, 429s and 5xx count against the breaker;
+    while it is open CircuitOpenError is raised without calling Clerk.
+    """
+    if not url.startswith('http'):
+        url = f'{settings.CLERK_API_URL}{url}'
+    kwargs.setdefault('timeout', settings.CLERK_TIMEOUT)
+
+    breaker.before_call()
+    started = time.perf_counter()
+    try:
+        response = get_session().request(method, url, **kwargs)
+    except requests.RequestException as e:
+        stats.record(operation, time.perf_counter() - started, error=type(e).__name__)
+        breaker.record_failure()
+        raise
+
+    elapsed = time.perf_counter() - started
+    if response.status_code == 429 or response.status_code >= 500:
+        stats.record(operation, elapsed, error=str(response.status_code))
+        breaker.record_failure()
+        logger.warning('Clerk %s returned %s', operation, response.status_code)
+    else:
+        stats.record(operation, elapsed)
+        breaker.record_success()
+    return response
+
+
+def verify_token(token):
+    return clerk_request('tokens.verify', 'POST', '/tokens/verify', json={'token': token})
+
+
+def get_user(clerk_id):
+    return clerk_request('users.get', 'GET', f'/users/{clerk_id}')
+
+
+def get_jwks():
+    return clerk_request('jwks.get', 'GET', settings.CLERK_JWKS_URL)
+
+
+def health():
+    return {'circuit': breaker.snapshot(), 'operations': stats.snapshot()}
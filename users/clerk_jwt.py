@@ -0,0 +1,170 @@
+# users/clerk_jwt.py
+import logging
+import threading
+import time
+
+import jwt
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+from backend.resilience import CircuitOpenError
+from . import clerk_client
+
+logger = logging.getLogger(__name__)
+
+JWKS_CACHE_KEY = 'clerk:jwks'
+ALGORITHMS = ['RS256']
+
+
+class InvalidToken(Exception):
+    """The token was checked locally and is not valid (expired, bad signature, wrong azp...)"""
+
+
+class VerificationUnavailable(Exception):
+    """The token could not be checked locally; fall back to Clerk's verify API"""
+
+
+class ClerkJWKS:
+    """
+    Clerk's signing keys, kept in process memory and shared through the
+    Django cache. Keys are fetched once per CLERK_JWKS_TTL; a token signed
+    with an unknown key id triggers a refetch (key rotation), at most once
+    per CLERK_JWKS_MIN_REFRESH seconds so bogus kids cannot hammer Clerk.
+    A kid missing from freshly fetched keys is invalid; only while Clerk is
+    unreachable is the token left to Clerk's verify API, and the last
+    fetched keys stay in use.
+    """
+
+    def __init__(self):
+        self._keys = {}
+        self._loaded_at = 0.0
+        self._fetched_at = 0.0
+        self._last_fetch = 0.0
+        self._lock = threading.Lock()
+
+    def load(self, jwks, fetched_at=None):
+        """
+        Replace the key set with a JWKS document ({'keys': [...]}) downloaded
+        at fetched_at (epoch seconds, default now)
+        """
+        keys = {}
+        for data in jwks.get('keys', []):
+            if data.get('kty') != 'RSA' or not data.get('kid'):
+                continue
+            try:
+                keys[data['kid']] = jwt.PyJWK(data, algorithm='RS256')
+            except jwt.PyJWTError as e:
+                logger.warning('Skipping unusable Clerk JWK %s: %s', data.get('kid'), e)
+        with self._lock:
+            self._keys = keys
+            self._loaded_at = time.monotonic()
+            self._fetched_at = time.time() if fetched_at is None else fetched_at
+
+    def get_key(self, kid):
+        if not self._keys or time.monotonic() - self._loaded_at > settings.CLERK_JWKS_TTL:
+            self._refresh(force=False)
+
+        key = self._keys.get(kid)
+        if key is None:
+            # Unknown kid: Clerk may have rotated its keys since we loaded them
+            self._refresh(force=True)
+            key = self._keys.get(kid)
+        if key is None:
+            if time.time() - self._fetched_at < settings.CLERK_JWKS_MIN_REFRESH:
+                # The keys were just fetched from Clerk: the kid really is unknown
+                raise InvalidToken(f'No Clerk signing key with kid {kid}')
+            raise VerificationUnavailable(f'Clerk signing keys are stale, cannot check kid {kid}')
+        return key
+
+    def _refresh(self, force):
+        cached = cache.get(JWKS_CACHE_KEY)
+        if cached and not force and time.time() - cached['fetched_at'] < settings.CLERK_JWKS_TTL:
+            self.load(cached['jwks'], cached['fetched_at'])
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            throttled = now - self._last_fetch < settings.CLERK_JWKS_MIN_REFRESH
+            if not throttled:
+                self._last_fetch = now
+
+        document = None if throttled else fetch_jwks()
+        if document is not None:
+            fetched_at = time.time()
+            cache.set(JWKS_CACHE_KEY, {'jwks': document, 'fetched_at': fetched_at}, timeout=None)
+            self.load(document, fetched_at)
+        elif cached and (not force or not self._keys or cached['fetched_at'] > self._fetched_at):
+            # Clerk unreachable (or asked too recently): use the newest keys any worker fetched
+            self.load(cached['jwks'], cached['fetched_at'])
+
+
+def fetch_jwks():
+    """Download Clerk's JWKS; returns None when Clerk cannot be reached"""
+    try:
+        response = clerk_client.get_jwks()
+        response.raise_for_status()
+        return response.json()
+    except (requests.RequestException, CircuitOpenError, ValueError) as e:
+        logger.error('Could not fetch Clerk JWKS: %s', e)
+        return None
+
+
+jwks = ClerkJWKS()
+
+
+def signing_key(token):
+    if settings.CLERK_JWT_KEY:
+        # PEM public key from the Clerk dashboard: no network at all
+        return settings.CLERK_JWT_KEY
+
+    try:
+        header = jwt.get_unverified_header(token)
+    except jwt.PyJWTError:
+        raise InvalidToken('Malformed token')
+    if header.get('alg') not in ALGORITHMS:
+        raise InvalidToken(f"Unsupported token algorithm {header.get('alg')}")
+    return jwks.get_key(header.get('kid')).key
+
+
+def verify_session_token(token):
+    """
+    Verify a Clerk session token without calling Clerk and return its claims.
+    Checks the RS256 signature against the cached JWKS, exp/nbf/iat with
+    CLERK_JWT_LEEWAY seconds of clock skew, and azp against
+    CLERK_AUTHORIZED_PARTIES when that list is configured.
+    """
+    key = signing_key(token)
+
+    try:
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=ALGORITHMS,
+            leeway=settings.CLERK_JWT_LEEWAY,
+            options={'require': ['exp', 'iat', 'sub'], 'verify_aud': False},
+        )
+    except jwt.ExpiredSignatureError:
+        raise InvalidToken('Token has expired')
+    except jwt.ImmatureSignatureError:
+        raise InvalidToken('Token is not valid yet')
+    except jwt.PyJWTError as e:
+        raise InvalidToken(f'Invalid token: {str(e)}')
+
+    authorized_parties = settings.CLERK_AUTHORIZED_PARTIES
+    if authorized_parties and claims.get('azp') and claims['azp'] not in authorized_parties:
+        raise InvalidToken(f"Token issued for unauthorized party {claims['azp']}")
+
+    return claims
+
+
+def token_expiry(token):
+    """
+    exp claim of a token that has already been verified elsewhere (e.g. by
+    Clerk's verify API), or None if it cannot be read
+    """
+    try:
+        exp = jwt.decode(token, options={'verify_signature': False}).get('exp')
+    except jwt.PyJWTError:
+        return None
+    return exp if isinstance(exp, (int, float)) else None
@@ -31,24 +31,27 @@ def custom_exception_handler(exc, context):
         # Log the error
         if response.status_code >= 500:
             logger.error(
-                f'Server Error: {exc.__class__.__name__} - {str(exc)} | '
-                f'Path: {request.path if request else "N/A"} | '
-                f'View: {view.__class__.__name__ if view else "N/A"}',
+                'Server Error: %s - %s | Path: %s | View: %s',
+                exc.__class__.__name__, exc,
+                request.path if request else 'N/A',
+                view.__class__.__name__ if view else 'N/A',
                 exc_info=True
             )
         elif response.status_code >= 400:
             logger.warning(
-                f'Client Error: {exc.__class__.__name__} - {str(exc)} | '
-                f'Path: {request.path if request else "N/A"} | '
-                f'User: {request.user if request and hasattr(request, "user") else "Anonymous"}'
+                'Client Error: %s - %s | Path: %s | User: %s',
+                exc.__class__.__name__, exc,
+                request.path if request else 'N/A',
+                request.user if request and hasattr(request, 'user') else 'Anonymous',
             )
         
         response.data = custom_response_data
     else:
         # Handle non-DRF exceptions
         logger.error(
-            f'Unhandled Exception: {exc.__class__.__name__} - {str(exc)} | '
-            f'Path: {request.path if request else "N/A"}',
+            'Unhandled Exception: %s - %s | Path: %s',
+            exc.__class__.__name__, exc,
+            request.path if request else 'N/A',
             exc_info=True
         )
         
@@ -0,0 +1,52 @@
+# users/identity.py
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import DEFERRED
+
+from .models import User
+
+# Enough of the user for authentication, permission checks and ownership
+# filters; everything else is loaded on first access (see User.refresh_from_db)
+IDENTITY_FIELDS = ('id', 'clerk_id', 'username', 'email', 'is_active', 'is_staff', 'is_superuser')
+
+
+def identity_cache_key(clerk_id):
+    return f'clerk_identity:{clerk_id}'
+
+
+def cache_identity(user):
+    """
+    Store the identity fields of a (fully or partially) loaded user once
+    the current transaction commits, so a rolled-back signup is never cached
+    """
+    record = {field: getattr(user, field) for field in IDENTITY_FIELDS}
+    transaction.on_commit(
+        lambda: cache.set(identity_cache_key(user.clerk_id), record, timeout=settings.USER_IDENTITY_CACHE_TTL)
+    )
+
+
+def invalidate_identity(clerk_id):
+    """Drop a cached identity once the change to the user row is committed"""
+    if clerk_id:
+        transaction.on_commit(lambda: cache.delete(identity_cache_key(clerk_id)))
+
+
+def get_identity(clerk_id):
+    """
+    User for a Clerk id with only IDENTITY_FIELDS loaded, served from the
+    cache when possible (no query). Returns None for unknown users.
+    """
+    record = cache.get(identity_cache_key(clerk_id))
+    if record is not None:
+        fields = User._meta.concrete_fields
+        return User.from_db(
+            'default',
+            [field.attname for field in fields],
+            [record.get(field.attname, DEFERRED) for field in fields],
+        )
+
+    user = User.objects.only(*IDENTITY_FIELDS).filter(clerk_id=clerk_id).first()
+    if user is not None:
+        cache_identity(user)
+    return user
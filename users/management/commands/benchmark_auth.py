@@ -0,0 +1,83 @@
+# users/management/commands/benchmark_auth.py
+import json
+import time
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from users import clerk_jwt
+from users.authentication import ClerkAuthentication
+
+
+def make_jwks(kid):
+    """Throwaway RSA key pair and the JWKS document publishing it"""
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    public_jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    public_jwk.update({'kid': kid, 'use': 'sig', 'alg': 'RS256'})
+    return private_key, {'keys': [public_jwk]}
+
+
+class Command(BaseCommand):
+    help = 'Measure the per-request cost of verifying Clerk session tokens'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000, help='Local verifications per case (default: 2000)')
+        parser.add_argument('--token', help='A real Clerk session token, to also time the network verify path')
+        parser.add_argument('--network-iterations', type=int, default=10, help='Calls to Clerk with --token (default: 10)')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        kid = 'benchmark'
+        private_key, document = make_jwks(kid)
+        now = int(time.time())
+        tokens = [
+            jwt.encode(
+                {'sub': f'user_{i}', 'iat': now, 'nbf': now, 'exp': now + 60, 'sid': f'sess_{i}'},
+                private_key, algorithm='RS256', headers={'kid': kid},
+            )
+            for i in range(iterations)
+        ]
+
+        self.stdout.write(f'\n📊 Clerk session token verification ({iterations:,} tokens)\n')
+        self.stdout.write(f"{'path':<34}{'per token':>14}{'tokens/s':>12}")
+
+        original_jwks = clerk_jwt.jwks
+        try:
+            with override_settings(CLERK_JWT_KEY='', CLERK_AUTHORIZED_PARTIES=[]):
+                clerk_jwt.jwks = clerk_jwt.ClerkJWKS()
+                clerk_jwt.jwks.load(document)
+                self.report('local, JWKS in memory', iterations, lambda i: clerk_jwt.verify_session_token(tokens[i]))
+
+                cache.set(clerk_jwt.JWKS_CACHE_KEY, {'jwks': document, 'fetched_at': time.time()}, timeout=60)
+
+                def cold_verify(i):
+                    # New process: keys come from the shared cache, not Clerk
+                    clerk_jwt.jwks = clerk_jwt.ClerkJWKS()
+                    clerk_jwt.verify_session_token(tokens[i])
+
+                self.report('local, JWKS from cache', iterations, cold_verify)
+                cache.delete(clerk_jwt.JWKS_CACHE_KEY)
+        finally:
+            clerk_jwt.jwks = original_jwks
+
+        if options['token']:
+            token = options['token']
+            auth = ClerkAuthentication()
+            self.report('local, live Clerk JWKS', min(iterations, 100), lambda i: clerk_jwt.verify_session_token(token))
+            self.report('network /tokens/verify', options['network_iterations'], lambda i: auth.verify_clerk_token(token))
+        else:
+            self.stdout.write('\nPass --token <session token> to compare with the network verify path.')
+
+        self.stdout.write('')
+
+    def report(self, label, iterations, func):
+        started = time.perf_counter()
+        for i in range(iterations):
+            func(i)
+        elapsed = time.perf_counter() - started
+        per_call = elapsed / iterations
+        unit = f'{per_call * 1000:.2f} ms' if per_call >= 0.001 else f'{per_call * 1e6:.0f} µs'
+        self.stdout.write(f'{label:<34}{unit:>14}{iterations / elapsed:>12,.0f}')
@@ -0,0 +1,98 @@
+# users/management/commands/benchmark_logging.py
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from backend.log_handlers import BackgroundHandler, JsonFormatter, SampleFilter
+
+
+class SlowHandler(logging.Handler):
+    """Stand-in for a remote sink (syslog, log shipper, SMTP) that takes a while per record"""
+
+    def __init__(self, seconds):
+        super().__init__()
+        self.seconds = seconds
+
+    def emit(self, record):
+        self.format(record)
+        time.sleep(self.seconds)
+
+
+class Command(BaseCommand):
+    help = 'Measure request latency through the Clerk webhook with synchronous vs queued logging'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per case (default: 1000)')
+        parser.add_argument('--sink-ms', type=float, default=1.0, help='Simulated remote log sink latency per record (default: 1)')
+        parser.add_argument('--sample-rate', type=float, default=0.1, help='INFO sample rate for the sampled case (default: 0.1)')
+
+    def handle(self, *args, **options):
+        total = options['requests']
+        logger = logging.getLogger('users')
+        original = (logger.handlers[:], logger.level, logger.propagate)
+
+        self.stdout.write(f'\n📝 Clerk webhook latency with logging ({total:,} requests per case, '
+                          f'{options["sink_ms"]:g} ms sink)\n')
+        self.stdout.write(f"{'logging':<30}{'mean':>10}{'p50':>10}{'p95':>10}{'req/s':>10}")
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_handler = logging.FileHandler(os.path.join(directory, 'benchmark.log'))
+            file_handler.setFormatter(JsonFormatter())
+            sink = SlowHandler(options['sink_ms'] / 1000)
+            sink.setFormatter(JsonFormatter())
+            queued = BackgroundHandler([file_handler, sink], maxsize=total * 4)
+            sampled = BackgroundHandler([file_handler, sink], maxsize=total * 4)
+            sampled.addFilter(SampleFilter(rate=options['sample_rate']))
+
+            cases = [
+                ('off', [], logging.CRITICAL),
+                ('synchronous file + sink', [file_handler, sink], logging.INFO),
+                ('queued', [queued], logging.INFO),
+                (f'queued, INFO sampled {options["sample_rate"]:g}', [sampled], logging.INFO),
+            ]
+            try:
+                logger.propagate = False
+                for label, handlers, level in cases:
+                    logger.handlers = handlers
+                    logger.setLevel(level)
+                    self.run(label, total)
+                    for handler in handlers:
+                        if isinstance(handler, BackgroundHandler):
+                            # Drain the backlog so it doesn't slow the next case
+                            handler.close()
+            finally:
+                logger.handlers, logger.level, logger.propagate = original
+                for handler in (queued, sampled, file_handler, sink):
+                    handler.close()
+
+        self.stdout.write('')
+
+    def run(self, label, total):
+        client = Client()
+        latencies = []
+        for i in range(total):
+            # user.deleted for an unknown user: two log lines and one query
+            body = json.dumps({
+                'type': 'user.deleted',
+                'data': {'id': f'user_benchmark_{i}', 'email_addresses': [{'email_address': f'user{i}@example.com'}]},
+            })
+            started = time.perf_counter()
+            client.post(
+                '/api/webhooks/clerk/', body, content_type='application/json',
+                # A fresh client IP per request keeps RateLimitMiddleware out of the way
+                REMOTE_ADDR=f'10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}',
+            )
+            latencies.append(time.perf_counter() - started)
+
+        latencies.sort()
+        mean = statistics.fmean(latencies)
+        self.stdout.write(
+            f'{label:<30}{mean * 1000:>8.2f}ms{latencies[len(latencies) // 2] * 1000:>8.2f}ms'
+            f'{latencies[int(len(latencies) * 0.95)] * 1000:>8.2f}ms{1 / mean:>10,.0f}'
+        )
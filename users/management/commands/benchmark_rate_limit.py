@@ -0,0 +1,79 @@
+# users/management/commands/benchmark_rate_limit.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from backend.redis_client import get_redis_connection
+from users.middleware import RateLimitMiddleware
+from users.ratelimit import RateLimiter, TwoTierRateLimiter
+
+
+class CountingLimiter:
+    """Shared limiter wrapper that counts the calls reaching the cache"""
+
+    def __init__(self, shared):
+        self.shared = shared
+        self.calls = 0
+
+    def hit(self, key, limit, period, cost=1):
+        self.calls += 1
+        return self.shared.hit(key, limit, period, cost=cost)
+
+
+class Command(BaseCommand):
+    help = 'Measure RateLimitMiddleware overhead with and without the in-process pre-filter'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rate', type=int, default=5000, help='Requests per second to replay (default: 5000)')
+        parser.add_argument('--seconds', type=float, default=3.0, help='Duration of each run (default: 3)')
+        parser.add_argument('--clients', type=int, default=200, help='Distinct client IPs (default: 200)')
+        parser.add_argument('--batch', type=int, default=10, help='Pre-filter lease size to compare (default: 10)')
+        parser.add_argument('--max-age', type=float, default=1.0, help='Pre-filter lease lifetime in seconds (default: 1)')
+
+    def handle(self, *args, **options):
+        rate = options['rate']
+        total = int(rate * options['seconds'])
+        factory = RequestFactory()
+        requests = [
+            factory.get('/api/orders/', REMOTE_ADDR=f'10.0.{i // 250}.{i % 250}')
+            for i in (n % options['clients'] for n in range(total))
+        ]
+
+        self.stdout.write(f'\n🚦 RateLimitMiddleware at {rate:,} req/s ({total:,} requests, {options["clients"]} clients)\n')
+        self.stdout.write(f"{'limiter':<26}{'per request':>14}{'cache calls':>13}{'refused':>10}{'core at rate':>14}")
+
+        runs = [
+            ('shared only', 1),
+            (f'pre-filter, batch {options["batch"]}', options['batch']),
+        ]
+        for label, batch in runs:
+            shared = CountingLimiter(RateLimiter(prefix=f'rate_limit_benchmark:{time.time_ns()}'))
+            middleware = RateLimitMiddleware(lambda request: HttpResponse())
+            middleware.limiter = TwoTierRateLimiter(shared, batch=batch, max_age=options['max_age'])
+            self.run(label, middleware, requests, rate, shared)
+
+        if get_redis_connection() is None:
+            self.stdout.write('\n⚠️  No REDIS_URL: the shared store is the local-memory cache, so round-trips cost nothing here.')
+        self.stdout.write('')
+
+    def run(self, label, middleware, requests, rate, shared):
+        """Replay requests paced at `rate`, timing only the middleware calls"""
+        busy = 0.0
+        refused = 0
+        started = time.perf_counter()
+        for i, request in enumerate(requests):
+            delay = started + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            call_started = time.perf_counter()
+            response = middleware(request)
+            busy += time.perf_counter() - call_started
+            refused += response.status_code == 429
+
+        per_request = busy / len(requests)
+        self.stdout.write(
+            f'{label:<26}{per_request * 1e6:>11.1f} µs{shared.calls:>13,}{refused:>10,}'
+            f'{per_request * rate:>13.1%}'
+        )
@@ -0,0 +1,44 @@
+# users/management/commands/flush_clerk_updates.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.webhook_updates import flush_due_updates
+
+
+class Command(BaseCommand):
+    help = 'Apply buffered Clerk user.updated events that are due (e.g. whose timer died with a worker)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Users flushed per pass (default: 100)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep sweeping instead of exiting once nothing is due',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Seconds to wait when nothing is due in --loop mode (default: 5)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = 0
+
+        while True:
+            flushed = flush_due_updates(limit=batch_size)
+            total += flushed
+
+            if flushed < batch_size:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Flushed {total} buffered Clerk updates'))
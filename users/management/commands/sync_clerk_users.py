@@ -0,0 +1,158 @@
+# users/management/commands/sync_clerk_users.py
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from users import clerk_client
+from users.identity import invalidate_identity
+from users.models import User
+from users.profile_sync import profile_fields
+from users.provisioning import base_username, new_user, provision_user, resolve_usernames
+
+PROFILE_FIELDS = ['email', 'first_name', 'last_name', 'avatar']
+
+
+class Command(BaseCommand):
+    help = "Page through Clerk's user list and upsert local users in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Users per Clerk page and per transaction (max 500)')
+        parser.add_argument(
+            '--state-file',
+            default='.clerk_user_sync.json',
+            help='Where progress is saved so an interrupted run can resume (default: .clerk_user_sync.json)',
+        )
+        parser.add_argument('--restart', action='store_true', help='Ignore saved progress and start from the first user')
+        parser.add_argument('--api-url', help='Clerk API base URL, e.g. a local stub (default: CLERK_API_URL)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if not 1 <= batch_size <= 500:
+            raise CommandError('--batch-size must be between 1 and 500')
+
+        api_url = (options['api_url'] or settings.CLERK_API_URL).rstrip('/')
+        state_file = options['state_file']
+        offset = 0 if options['restart'] else self.load_offset(state_file)
+        if offset:
+            self.stdout.write(f'↩️  Resuming after {offset:,} users')
+
+        totals = {'created': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0}
+        started = time.perf_counter()
+
+        while True:
+            response = clerk_client.clerk_request(
+                'users.list', 'GET', f'{api_url}/users',
+                params={'limit': batch_size, 'offset': offset, 'order_by': '+created_at'},
+            )
+            if response.status_code != 200:
+                raise CommandError(f'Clerk returned {response.status_code} at offset {offset}: {response.text[:200]}')
+
+            page = response.json()
+            if isinstance(page, dict):
+                page = page.get('data', [])
+            if not page:
+                break
+
+            counts = self.upsert(page)
+            for name, count in counts.items():
+                totals[name] += count
+
+            offset += len(page)
+            self.save_offset(state_file, offset)
+
+            elapsed = time.perf_counter() - started
+            rate = sum(totals.values()) / elapsed if elapsed else 0
+            self.stdout.write(
+                f"   offset {offset:,}: +{counts['created']} new, {counts['updated']} updated, "
+                f"{counts['skipped']} skipped ({rate:,.0f} users/s)"
+            )
+
+            if len(page) < batch_size:
+                break
+
+        if os.path.exists(state_file):
+            os.remove(state_file)
+
+        elapsed = time.perf_counter() - started
+        processed = sum(totals.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Synced {processed:,} Clerk users in {elapsed:.1f}s "
+            f"({processed / elapsed if elapsed else 0:,.0f} users/s): {totals['created']:,} created, "
+            f"{totals['updated']:,} updated, {totals['unchanged']:,} unchanged, "
+            f"{totals['skipped']:,} skipped (created meanwhile by sign-in)"
+        ))
+
+    @transaction.atomic
+    def upsert(self, clerk_users):
+        """
+        Create missing users and update changed profiles for one page:
+        one read, one username prefix query, one bulk insert, one bulk update.
+        Rows the insert skipped are checked: a user provisioned meanwhile by
+        sign-in counts as skipped, one that lost its username to a
+        concurrent insert is provisioned on its own.
+        """
+        clerk_users = [data for data in clerk_users if data.get('id')]
+        existing = {
+            user.clerk_id: user
+            for user in User.objects.filter(clerk_id__in=[data['id'] for data in clerk_users]).only('id', 'clerk_id', *PROFILE_FIELDS)
+        }
+
+        to_create = [data for data in clerk_users if data['id'] not in existing]
+        to_update = []
+        for data in clerk_users:
+            user = existing.get(data['id'])
+            if user is None:
+                continue
+            changed = False
+            for name, value in profile_fields(data).items():
+                if getattr(user, name) != value:
+                    setattr(user, name, value)
+                    changed = True
+            if changed:
+                to_update.append(user)
+
+        usernames = resolve_usernames([base_username(data['id'], data) for data in to_create])
+        attempted = [new_user(data['id'], data, username) for data, username in zip(to_create, usernames)]
+        User.objects.bulk_create(attempted, ignore_conflicts=True)  # users signing in meanwhile are provisioned by auth
+        User.objects.bulk_update(to_update, PROFILE_FIELDS)
+        for user in to_update:
+            invalidate_identity(user.clerk_id)
+
+        # ignore_conflicts doesn't say which rows went in: ours are the ones with our username
+        rows = dict(User.objects.filter(clerk_id__in=[user.clerk_id for user in attempted]).values_list('clerk_id', 'username'))
+        created = skipped = 0
+        for data, user in zip(to_create, attempted):
+            if rows.get(user.clerk_id) == user.username:
+                created += 1
+            elif user.clerk_id in rows:
+                skipped += 1
+            elif provision_user(data['id'], data)[1]:
+                created += 1
+            else:
+                skipped += 1
+
+        return {
+            'created': created,
+            'updated': len(to_update),
+            'unchanged': len(clerk_users) - len(to_create) - len(to_update),
+            'skipped': skipped,
+        }
+
+    def load_offset(self, state_file):
+        try:
+            with open(state_file) as f:
+                return int(json.load(f).get('offset', 0))
+        except FileNotFoundError:
+            return 0
+        except (ValueError, OSError) as e:
+            raise CommandError(f'Unreadable state file {state_file}: {e} (use --restart)')
+
+    def save_offset(self, state_file, offset):
+        tmp = f'{state_file}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'offset': offset}, f)
+        os.replace(tmp, state_file)
@@ -1,13 +1,21 @@
 # users/middleware.py
-import time
-from django.core.cache import cache
+import logging
+import re
 from django.http import JsonResponse
 from django.conf import settings
+from .ratelimit import local_limiter, retry_after_header
+
+security_logger = logging.getLogger('django.security')
+
+SUSPICIOUS_PATTERNS = [
+    'admin', 'login', 'password', 'root', 'api/auth',
+    '../', '..\\', '<script', 'SELECT', 'UNION', 'DROP'
+]
 
 class RateLimitMiddleware:
     """
     Simple rate limiting middleware to prevent brute force attacks
-    Uses Django's cache backend (configure Redis for production)
+    Uses the shared atomic limiter (configure Redis for production)
     """
     
     def __init__(self, get_response):
@@ -20,6 +28,7 @@ class RateLimitMiddleware:
         ]
         self.max_requests = 100  # requests per window
         self.window_seconds = 60  # 1 minute window
+        self.limiter = local_limiter
         
     def __call__(self, request):
         # Get client IP
@@ -28,11 +37,16 @@ class RateLimitMiddleware:
         # Check if path should be rate limited
         should_limit = any(request.path.startswith(path) for path in self.rate_limit_paths)
         
-        if should_limit and not self.check_rate_limit(ip, request.path):
-            return JsonResponse({
-                'error': 'Rate limit exceeded. Please try again later.',
-                'retry_after': self.window_seconds
-            }, status=429)
+        if should_limit:
+            result = self.check_rate_limit(ip, request.path)
+            if not result.allowed:
+                retry_after = retry_after_header(result)
+                response = JsonResponse({
+                    'error': 'Rate limit exceeded. Please try again later.',
+                    'retry_after': int(retry_after)
+                }, status=429)
+                response['Retry-After'] = retry_after
+                return response
         
         response = self.get_response(request)
         return response
@@ -47,18 +61,8 @@ class RateLimitMiddleware:
         return ip
     
     def check_rate_limit(self, ip, path):
-        """Check if request should be rate limited"""
-        cache_key = f'rate_limit:{ip}:{path}'
-        
-        # Get current request count
-        request_count = cache.get(cache_key, 0)
-        
-        if request_count >= self.max_requests:
-            return False
-        
-        # Increment counter
-        cache.set(cache_key, request_count + 1, self.window_seconds)
-        return True
+        """Count this request; returns a RateLimitResult"""
+        return self.limiter.hit(f'{ip}:{path}', self.max_requests, self.window_seconds)
 
 
 class SecurityHeadersMiddleware:
@@ -101,27 +105,21 @@ class RequestLoggingMiddleware:
     
     def __init__(self, get_response):
         self.get_response = get_response
-        self.suspicious_patterns = [
-            'admin', 'login', 'password', 'root', 'api/auth',
-            '../', '..\\', '<script', 'SELECT', 'UNION', 'DROP'
-        ]
+        # One case-insensitive pass over the path instead of a scan per pattern
+        self.suspicious_re = re.compile(
+            '|'.join(re.escape(pattern) for pattern in SUSPICIOUS_PATTERNS), re.IGNORECASE
+        )
     
     def __call__(self, request):
         # Check for suspicious patterns
-        full_path = request.get_full_path().lower()
-        user_agent = request.META.get('HTTP_USER_AGENT', '').lower()
-        
-        is_suspicious = any(pattern.lower() in full_path for pattern in self.suspicious_patterns)
-        
-        if is_suspicious:
-            import logging
-            logger = logging.getLogger('django.security')
-            logger.warning(
-                f'Suspicious request detected: '
-                f'IP={self.get_client_ip(request)}, '
-                f'Path={request.path}, '
-                f'Method={request.method}, '
-                f'UserAgent={user_agent}'
+        if self.suspicious_re.search(request.get_full_path()):
+            # Queued to a background thread (see LOGGING), never written here
+            security_logger.warning(
+                'Suspicious request detected: IP=%s, Path=%s, Method=%s, UserAgent=%s',
+                self.get_client_ip(request),
+                request.path,
+                request.method,
+                request.META.get('HTTP_USER_AGENT', '').lower(),
             )
         
         response = self.get_response(request)
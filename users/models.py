@@ -1,6 +1,8 @@
 # users/models.py
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 
 class User(AbstractUser):
     clerk_id = models.CharField(max_length=255, unique=True, null=True, blank=True)
@@ -25,6 +27,21 @@ class User(AbstractUser):
     
     def __str__(self):
         return self.email or self.username
+    
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # Users from the identity cache have most fields deferred; the first
+        # access to any of them loads all of them in one query, not one each
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            fields = list(deferred)
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_identity(sender, instance, **kwargs):
+    # Any saved or deleted user row (admin, API, webhooks) drops its cached
+    # identity once committed; queryset updates call invalidate_identity
+    from .identity import invalidate_identity
+    invalidate_identity(instance.clerk_id)
 
 class Address(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='addresses')
@@ -0,0 +1,93 @@
+# users/profile_sync.py
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from . import clerk_client
+from .identity import invalidate_identity
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='clerk-profile-sync')
+
+
+# local field -> Clerk user object key
+CLERK_PROFILE_KEYS = {'first_name': 'first_name', 'last_name': 'last_name', 'avatar': 'image_url'}
+
+
+def profile_fields(clerk_user_data):
+    """
+    Local user fields mirrored from a Clerk user object. A field Clerk sends
+    empty (a removed name or avatar) is cleared; one missing from the payload
+    is left alone.
+    """
+    fields = {}
+    if 'email_addresses' in clerk_user_data:
+        email_addresses = clerk_user_data['email_addresses'] or []
+        fields['email'] = (email_addresses[0].get('email_address') or '') if email_addresses else ''
+    for name, key in CLERK_PROFILE_KEYS.items():
+        if key in clerk_user_data:
+            fields[name] = clerk_user_data[key] or ''
+    return fields
+
+
+def apply_profile(clerk_id, clerk_user_data, include_username=False):
+    """
+    Write changed profile fields with a single UPDATE; no write when nothing
+    changed. Returns the names of the fields that were updated.
+    """
+    fields = profile_fields(clerk_user_data)
+    if include_username and clerk_user_data.get('username'):
+        fields['username'] = clerk_user_data['username']
+    current = User.objects.filter(clerk_id=clerk_id).values(*fields).first()
+    if current is None:
+        return []
+
+    changed = {name: value for name, value in fields.items() if current[name] != value}
+    if changed:
+        User.objects.filter(clerk_id=clerk_id).update(**changed)
+        invalidate_identity(clerk_id)
+        logger.info('Synced Clerk profile for %s: %s', clerk_id, ', '.join(changed))
+    return list(changed)
+
+
+def sync_profile(clerk_id):
+    """Fetch one user from Clerk and apply any profile changes"""
+    try:
+        response = clerk_client.get_user(clerk_id)
+        if response.status_code != 200:
+            logger.warning('Clerk profile sync for %s failed: %s', clerk_id, response.status_code)
+            return
+        apply_profile(clerk_id, response.json())
+    except Exception as e:
+        logger.error('Clerk profile sync for %s failed: %s', clerk_id, e)
+    finally:
+        # Runs on a pool thread: don't leave its DB connection open
+        connections.close_all()
+
+
+def sync_key(clerk_id):
+    return f'clerk_profile_sync:{clerk_id}'
+
+
+def mark_profile_synced(clerk_id):
+    """Record that the profile was just refreshed (new user, webhook update)"""
+    if settings.CLERK_PROFILE_SYNC_INTERVAL > 0:
+        cache.set(sync_key(clerk_id), 1, timeout=settings.CLERK_PROFILE_SYNC_INTERVAL)
+
+
+def schedule_profile_sync(clerk_id):
+    """
+    Refresh a user's profile from Clerk in the background, at most once per
+    CLERK_PROFILE_SYNC_INTERVAL per user across all workers. Webhooks keep
+    profiles current in between; this only catches missed events.
+    """
+    interval = settings.CLERK_PROFILE_SYNC_INTERVAL
+    if interval <= 0:
+        return
+    if cache.add(sync_key(clerk_id), 1, timeout=interval):
+        _executor.submit(sync_profile, clerk_id)
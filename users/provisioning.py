@@ -0,0 +1,109 @@
+# users/provisioning.py
+from functools import reduce
+from operator import or_
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+
+from .models import User
+from .profile_sync import profile_fields
+
+USERNAME_MAX_LENGTH = User._meta.get_field('username').max_length
+PROVISION_ATTEMPTS = 3
+
+
+def base_username(clerk_id, clerk_user_data):
+    """Preferred username: Clerk username, else email local part, else user_<id>"""
+    username = clerk_user_data.get('username')
+    if not username:
+        email = profile_fields(clerk_user_data).get('email', '')
+        username = email.split('@')[0] if email else f'user_{clerk_id[:8]}'
+    # Leave room for a numeric suffix
+    return username[:USERNAME_MAX_LENGTH - 6]
+
+
+def resolve_usernames(bases):
+    """
+    Unique usernames for a list of preferred bases, in order. Taken names
+    are read with one prefix query for the whole list; duplicates within
+    the list get numeric suffixes just like existing users do.
+    """
+    if not bases:
+        return []
+
+    prefixes = set(bases)
+    taken = set(
+        User.objects.filter(reduce(or_, (Q(username__startswith=prefix) for prefix in prefixes)))
+        .values_list('username', flat=True)
+    )
+
+    usernames = []
+    for base in bases:
+        username = base
+        counter = 1
+        while username in taken:
+            username = f'{base}{counter}'
+            counter += 1
+        taken.add(username)
+        usernames.append(username)
+    return usernames
+
+
+def new_user(clerk_id, clerk_user_data, username):
+    """Unsaved User for a Clerk user object"""
+    fields = {'email': '', 'first_name': '', 'last_name': '', 'avatar': ''}
+    fields.update(profile_fields(clerk_user_data))
+    return User(clerk_id=clerk_id, username=username, **fields)
+
+
+def _insert_unless_exists(user):
+    """
+    INSERT ... ON CONFLICT (clerk_id) DO NOTHING RETURNING id.
+    Returns the new id, or None when a row for this clerk_id already exists
+    (or was just inserted by a concurrent transaction, which we wait for).
+    """
+    fields = [field for field in User._meta.concrete_fields if not field.primary_key]
+    quote = connection.ops.quote_name
+    values = [field.get_db_prep_save(field.pre_save(user, True), connection) for field in fields]
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote(User._meta.db_table)} ({', '.join(quote(field.column) for field in fields)}) "
+            f"VALUES ({', '.join(['%s'] * len(fields))}) "
+            f"ON CONFLICT ({quote('clerk_id')}) DO NOTHING RETURNING {quote(User._meta.pk.column)}",
+            values,
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def provision_user(clerk_id, clerk_user_data):
+    """
+    Get or create the local user for a Clerk user. Safe to call from any
+    number of concurrent first logins, webhooks and syncs: exactly one
+    insert wins and everyone else gets that row without an error.
+    Returns (user, created).
+    """
+    user = User.objects.filter(clerk_id=clerk_id).first()
+    if user is not None:
+        return user, False
+
+    for attempt in range(PROVISION_ATTEMPTS):
+        username = resolve_usernames([base_username(clerk_id, clerk_user_data)])[0]
+        user = new_user(clerk_id, clerk_user_data, username)
+        try:
+            with transaction.atomic():
+                pk = _insert_unless_exists(user)
+        except IntegrityError:
+            # Username taken since it was resolved; pick another
+            continue
+
+        if pk is None:
+            return User.objects.get(clerk_id=clerk_id), False
+
+        user.pk = pk
+        user._state.adding = False
+        user._state.db = connection.alias
+        return user, True
+
+    raise IntegrityError(f'Could not allocate a unique username for {clerk_id}')
@@ -0,0 +1,224 @@
+# users/ratelimit.py
+import math
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from backend.redis_client import get_redis_connection
+
+RateLimitResult = namedtuple('RateLimitResult', 'allowed limit remaining retry_after')
+
+# GCRA (a token bucket stored as one timestamp): each request of `cost`
+# pushes the key's theoretical arrival time (TAT) forward by cost * period /
+# limit, and is refused while that would put the TAT more than `period`
+# ahead of now. Redis' own clock is used so every worker agrees on "now".
+# Floats go back as strings because Redis truncates Lua numbers to integers.
+GCRA_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local interval = period / limit
+
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+
+local new_tat = tat + cost * interval
+local allow_at = new_tat - period
+if allow_at > now then
+    local remaining = math.floor((period - (tat - now)) / interval)
+    return {0, remaining, tostring(allow_at - now)}
+end
+
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+return {1, math.floor((period - (new_tat - now)) / interval), '0'}
+"""
+
+
+def gcra(tat, now, limit, period, cost):
+    """Python twin of GCRA_SCRIPT: (new_tat or None when refused, remaining, retry_after)"""
+    interval = period / limit
+    tat = max(tat or now, now)
+    new_tat = tat + cost * interval
+    allow_at = new_tat - period
+    if allow_at > now:
+        return None, math.floor((period - (tat - now)) / interval), allow_at - now
+    return new_tat, math.floor((period - (new_tat - now)) / interval), 0.0
+
+
+class RateLimiter:
+    """
+    Atomic rate limiter shared by RateLimitMiddleware and the DRF throttles.
+
+    On Redis every check is one EVALSHA of GCRA_SCRIPT, so concurrent
+    requests from all workers are counted exactly with a single round-trip.
+    On the local-memory cache (development, tests) the same algorithm runs
+    under a process lock, which is atomic because that cache is per process.
+    """
+
+    def __init__(self, prefix='rate_limit'):
+        self.prefix = prefix
+        self._script = None
+        self._script_client = None
+        self._lock = threading.Lock()
+
+    def _redis_script(self, redis):
+        # Script objects are bound to a client; rebuilt if the client changes
+        if self._script_client is not redis:
+            self._script = redis.register_script(GCRA_SCRIPT)
+            self._script_client = redis
+        return self._script
+
+    def hit(self, key, limit, period, cost=1):
+        """
+        Count `cost` requests against `limit` per `period` seconds for key.
+        Refused requests are not counted.
+        """
+        key = f'{self.prefix}:{key}'
+        redis = get_redis_connection()
+        if redis is not None:
+            allowed, remaining, retry_after = self._redis_script(redis)(
+                keys=[key], args=[limit, period, cost]
+            )
+            return RateLimitResult(bool(allowed), limit, max(int(remaining), 0), float(retry_after))
+
+        with self._lock:
+            now = time.time()
+            new_tat, remaining, retry_after = gcra(cache.get(key), now, limit, period, cost)
+            if new_tat is not None:
+                cache.set(key, new_tat, timeout=math.ceil(new_tat - now))
+        return RateLimitResult(new_tat is not None, limit, max(remaining, 0), retry_after)
+
+    def reset(self, key):
+        key = f'{self.prefix}:{key}'
+        redis = get_redis_connection()
+        if redis is not None:
+            redis.delete(key)
+        else:
+            cache.delete(key)
+
+
+class LocalLease:
+    __slots__ = ('tokens', 'expires_at', 'blocked_until', 'remaining', 'last_seen', 'gap')
+
+    def __init__(self):
+        self.tokens = 0
+        self.expires_at = 0.0
+        self.blocked_until = 0.0
+        self.remaining = None
+        self.last_seen = None
+        self.gap = None
+
+    def observe(self, now):
+        """Track the client's smoothed time between requests on this worker"""
+        if self.last_seen is not None:
+            gap = now - self.last_seen
+            self.gap = gap if self.gap is None else (self.gap + gap) / 2
+        self.last_seen = now
+
+
+class TwoTierRateLimiter:
+    """
+    In-process pre-filter in front of the shared RateLimiter.
+
+    Instead of one shared-store call per request, a worker leases up to
+    `batch` requests at once (a single hit with that cost) and spends them
+    locally for at most `max_age` seconds. A lease is only as large as the
+    number of requests the client is expected to send on this worker within
+    `max_age`, judged from its recent spacing, so a client that is slower
+    than one request per `max_age` (or new) goes to the shared store every
+    time and never pays for tokens it will not use. Once the shared store
+    reports the client close to its quota, leases shrink to one request, so
+    accounting near the limit is exact. Refusals are remembered locally
+    until their Retry-After, so a client hammering a limit costs no
+    round-trips at all.
+
+    Leases are paid for up front, so clients are never let past the limit;
+    only a client that stops mid-burst loses what is left of its last lease.
+    batch=1 turns the pre-filter off and sends every request to the shared
+    store.
+    """
+    MAX_KEYS = 10000
+
+    def __init__(self, shared, batch=10, max_age=1.0):
+        self.shared = shared
+        self.batch = batch
+        self.max_age = max_age
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def lease_size(self, lease, limit, cost):
+        if lease is None or not lease.gap:
+            return cost
+        # Requests expected before the lease expires; slow clients get exactly one
+        expected = int(self.max_age / lease.gap)
+        known = lease.remaining if lease.remaining is not None else limit
+        # Leave headroom for other workers; exact once the client nears its quota
+        return max(min(self.batch, expected, known // 4, limit // 10), 1) * cost
+
+    def hit(self, key, limit, period, cost=1):
+        if self.batch <= 1:
+            return self.shared.hit(key, limit, period, cost=cost)
+
+        now = time.monotonic()
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is not None:
+                lease.observe(now)
+                if lease.blocked_until > now:
+                    return RateLimitResult(False, limit, 0, lease.blocked_until - now)
+                if lease.tokens >= cost and lease.expires_at > now:
+                    lease.tokens -= cost
+                    return RateLimitResult(True, limit, lease.remaining + lease.tokens, 0.0)
+            size = self.lease_size(lease, limit, cost)
+
+        result = self.shared.hit(key, limit, period, cost=size)
+        if not result.allowed and size > cost:
+            # Not enough left for a whole lease; try for just this request
+            size = cost
+            result = self.shared.hit(key, limit, period, cost=size)
+
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is None:
+                if len(self._leases) >= self.MAX_KEYS:
+                    self._prune(now)
+                lease = self._leases[key] = LocalLease()
+                lease.last_seen = now
+            lease.remaining = result.remaining
+            if result.allowed:
+                lease.tokens = size - cost
+                lease.expires_at = now + min(self.max_age, period)
+                lease.blocked_until = 0.0
+            else:
+                lease.tokens = 0
+                lease.blocked_until = now + result.retry_after
+        if result.allowed:
+            result = result._replace(remaining=result.remaining + size - cost)
+        return result
+
+    def _prune(self, now):
+        for key in [key for key, lease in self._leases.items()
+                    if lease.expires_at <= now and lease.blocked_until <= now]:
+            del self._leases[key]
+        if len(self._leases) >= self.MAX_KEYS:
+            self._leases.clear()
+
+
+limiter = RateLimiter()
+local_limiter = TwoTierRateLimiter(
+    limiter,
+    batch=settings.RATE_LIMIT_LOCAL_BATCH,
+    max_age=settings.RATE_LIMIT_LOCAL_MAX_AGE,
+)
+
+
+def retry_after_header(result):
+    """Whole seconds for a Retry-After header; never 0 for a refused request"""
+    return str(max(math.ceil(result.retry_after), 1))
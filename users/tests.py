@@ -0,0 +1,484 @@
+# users/tests.py
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from urllib.parse import parse_qs, urlparse
+from unittest import mock, skipUnless
+
+import fakeredis
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+
+from .authentication import ClerkAuthentication, ClerkUnavailable, token_cache_key
+from .clerk_jwt import ClerkJWKS, InvalidToken, VerificationUnavailable, verify_session_token
+from .identity import get_identity, identity_cache_key
+from .models import User
+from .provisioning import _insert_unless_exists, new_user, provision_user
+from .middleware import RateLimitMiddleware
+from .ratelimit import RateLimiter, TwoTierRateLimiter
+from .webhook_updates import DUE_KEY, flush_due_updates, queue_user_update
+
+
+def make_jwks(kid):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    return {'keys': [{**jwk, 'kid': kid, 'use': 'sig'}]}
+
+
+@override_settings(CLERK_JWT_KEY='', CLERK_JWKS_TTL=3600, CLERK_JWKS_MIN_REFRESH=30)
+class ClerkJWKSTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.jwks = ClerkJWKS()
+
+    @mock.patch('users.clerk_jwt.fetch_jwks')
+    def test_unknown_kid_after_refresh_is_invalid(self, fetch_jwks):
+        fetch_jwks.return_value = make_jwks('kid_current')
+
+        self.assertIsNotNone(self.jwks.get_key('kid_current'))
+        with self.assertRaises(InvalidToken):
+            self.jwks.get_key('kid_bogus')
+
+    @mock.patch('users.clerk_jwt.fetch_jwks')
+    def test_unknown_kid_while_clerk_unreachable_falls_back(self, fetch_jwks):
+        fetch_jwks.return_value = None
+        self.jwks.load(make_jwks('kid_current'), fetched_at=time.time() - 600)
+
+        with self.assertRaises(VerificationUnavailable):
+            self.jwks.get_key('kid_rotated')
+
+
+SIGNING_KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+PUBLIC_PEM = SIGNING_KEY.public_key().public_bytes(
+    serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+).decode()
+
+
+def session_token(**claims):
+    now = int(time.time())
+    claims = {'sub': 'user_1', 'iat': now, 'nbf': now, 'exp': now + 60, 'azp': 'https://shop.example.com', **claims}
+    return jwt.encode(claims, SIGNING_KEY, algorithm='RS256')
+
+
+@override_settings(CLERK_JWT_KEY=PUBLIC_PEM, CLERK_JWT_LEEWAY=5, CLERK_AUTHORIZED_PARTIES=['https://shop.example.com'])
+class SessionTokenTests(TestCase):
+    def test_valid_token(self):
+        self.assertEqual(verify_session_token(session_token())['sub'], 'user_1')
+
+    def test_expired_token_is_rejected(self):
+        with self.assertRaisesMessage(InvalidToken, 'expired'):
+            verify_session_token(session_token(exp=int(time.time()) - 10))
+
+    def test_token_just_inside_leeway_is_accepted(self):
+        claims = verify_session_token(session_token(exp=int(time.time()) - 3, nbf=int(time.time()) + 3))
+        self.assertEqual(claims['sub'], 'user_1')
+
+    def test_token_not_valid_yet_is_rejected(self):
+        with self.assertRaisesMessage(InvalidToken, 'not valid yet'):
+            verify_session_token(session_token(nbf=int(time.time()) + 30))
+
+    def test_unauthorized_party_is_rejected(self):
+        with self.assertRaisesMessage(InvalidToken, 'unauthorized party'):
+            verify_session_token(session_token(azp='https://evil.example.com'))
+
+    def test_token_signed_with_another_key_is_rejected(self):
+        other_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        token = jwt.encode({'sub': 'user_1', 'iat': int(time.time()), 'exp': int(time.time()) + 60}, other_key,
+                           algorithm='RS256')
+        with self.assertRaises(InvalidToken):
+            verify_session_token(token)
+
+
+class IdentityCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = User.objects.create(username='member', clerk_id='user_member')
+        with self.captureOnCommitCallbacks(execute=True):
+            get_identity('user_member')
+
+    def test_save_drops_cached_identity(self):
+        self.assertIsNotNone(cache.get(identity_cache_key('user_member')))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+
+        self.assertIsNone(cache.get(identity_cache_key('user_member')))
+        self.assertFalse(get_identity('user_member').is_active)
+
+    def test_delete_drops_cached_identity(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+
+        self.assertIsNone(cache.get(identity_cache_key('user_member')))
+        self.assertIsNone(get_identity('user_member'))
+
+
+CLERK_USER = {
+    'id': 'user_new',
+    'username': 'newcomer',
+    'email_addresses': [{'email_address': 'newcomer@example.com'}],
+    'first_name': 'New',
+}
+
+
+class ProvisioningTests(TestCase):
+    def test_provision_creates_once(self):
+        user, created = provision_user('user_new', CLERK_USER)
+        again, created_again = provision_user('user_new', CLERK_USER)
+
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(again.pk, user.pk)
+        self.assertEqual((user.username, user.email), ('newcomer', 'newcomer@example.com'))
+
+    def test_insert_on_conflict_does_nothing(self):
+        existing = User.objects.create(username='someone', clerk_id='user_new')
+
+        pk = _insert_unless_exists(new_user('user_new', CLERK_USER, 'newcomer'))
+
+        self.assertIsNone(pk)
+        self.assertEqual(list(User.objects.filter(clerk_id='user_new').values_list('pk', flat=True)), [existing.pk])
+
+    def test_lost_race_returns_winning_row(self):
+        # The existence check misses, as it does for a concurrent first login
+        winner = User.objects.create(username='winner', clerk_id='user_new')
+        with mock.patch('users.provisioning.User.objects.filter') as lookup:
+            lookup.return_value.first.return_value = None
+            user, created = provision_user('user_new', CLERK_USER)
+
+        self.assertFalse(created)
+        self.assertEqual(user.pk, winner.pk)
+
+
+@override_settings(CLERK_WEBHOOK_COALESCE_WINDOW=0.01)
+class CoalescedUpdateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create(username='member1', clerk_id='user_1', first_name='Old')
+
+    def test_without_redis_updates_apply_inline(self):
+        with mock.patch('users.webhook_updates.get_redis_connection', return_value=None):
+            queue_user_update('user_1', clerk_user(1))
+
+        self.assertEqual(User.objects.get(clerk_id='user_1').first_name, 'First1')
+
+    def test_update_whose_timer_was_lost_is_flushed_by_the_next_sweep(self):
+        redis = fakeredis.FakeRedis()
+        with mock.patch('users.webhook_updates.get_redis_connection', return_value=redis), \
+                mock.patch('users.webhook_updates.threading.Timer'):
+            queue_user_update('user_1', clerk_user(1, updated_at=1))
+            queue_user_update('user_1', clerk_user(1, first_name='Newest', updated_at=2))
+            self.assertEqual(User.objects.get(clerk_id='user_1').first_name, 'Old')
+
+            time.sleep(0.02)
+            out = StringIO()
+            call_command('flush_clerk_updates', stdout=out)
+            self.assertIn('Flushed 1 ', out.getvalue())
+            self.assertEqual(flush_due_updates(), 0)
+
+        self.assertEqual(User.objects.get(clerk_id='user_1').first_name, 'Newest')
+
+    def test_older_event_never_replaces_a_newer_one(self):
+        redis = fakeredis.FakeRedis()
+        with mock.patch('users.webhook_updates.get_redis_connection', return_value=redis), \
+                mock.patch('users.webhook_updates.threading.Timer') as timer:
+            queue_user_update('user_1', clerk_user(1, first_name='Newest', updated_at=2))
+            queue_user_update('user_1', clerk_user(1, first_name='Stale', updated_at=1))
+            queue_user_update('user_1', clerk_user(1, first_name='Newest', updated_at=2))
+
+            self.assertEqual(timer.call_count, 1)
+            time.sleep(0.02)
+            flush_due_updates()
+
+        self.assertEqual(User.objects.get(clerk_id='user_1').first_name, 'Newest')
+
+    def test_webhook_leaves_overdue_updates_to_the_sweeper(self):
+        User.objects.create(username='member2', clerk_id='user_2')
+        redis = fakeredis.FakeRedis()
+        with mock.patch('users.webhook_updates.get_redis_connection', return_value=redis), \
+                mock.patch('users.webhook_updates.threading.Timer'):
+            queue_user_update('user_1', clerk_user(1, updated_at=1))
+            time.sleep(0.02)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/webhooks/clerk/', {
+                    'type': 'user.updated', 'data': clerk_user(2, updated_at=1),
+                }, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(User.objects.get(clerk_id='user_1').first_name, 'Old')
+        self.assertEqual(redis.zcard(DUE_KEY), 2)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class GCRATests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.clock = FakeClock()
+        patcher = mock.patch('users.ratelimit.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.limiter = RateLimiter(prefix='test_gcra')
+
+    def test_burst_up_to_limit_then_refused(self):
+        # 10 per minute: a full burst is allowed, then one request per 6 s
+        results = [self.limiter.hit('client', 10, 60) for _ in range(11)]
+
+        self.assertTrue(all(result.allowed for result in results[:10]))
+        self.assertEqual(results[9].remaining, 0)
+        refused = results[10]
+        self.assertFalse(refused.allowed)
+        self.assertAlmostEqual(refused.retry_after, 6.0)
+
+        self.clock.now += 5.9
+        self.assertFalse(self.limiter.hit('client', 10, 60).allowed)
+        self.clock.now += 0.1
+        self.assertTrue(self.limiter.hit('client', 10, 60).allowed)
+
+    def test_refused_requests_are_not_counted(self):
+        for _ in range(20):
+            self.limiter.hit('client', 10, 60)
+
+        self.clock.now += 6
+        self.assertTrue(self.limiter.hit('client', 10, 60).allowed)
+
+
+class RateLimitMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.middleware = RateLimitMiddleware(lambda request: HttpResponse('ok'))
+        self.middleware.max_requests = 2
+        self.middleware.limiter = RateLimiter(prefix='test_middleware')
+
+    def get(self, path='/api/orders/'):
+        return self.middleware(RequestFactory().get(path, REMOTE_ADDR='203.0.113.7'))
+
+    def test_over_limit_gets_429_with_retry_after(self):
+        self.assertEqual(self.get().status_code, 200)
+        self.assertEqual(self.get().status_code, 200)
+
+        response = self.get()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(json.loads(response.content)['retry_after'], 30)
+
+    def test_other_paths_are_not_limited(self):
+        for _ in range(5):
+            self.assertEqual(self.get('/api/products/').status_code, 200)
+
+
+class RequestLoggingMiddlewareTests(TestCase):
+    def test_suspicious_request_is_logged(self):
+        with self.assertLogs('django.security', 'WARNING') as logs:
+            self.client.get('/api/products/', {'search': '1 UNION select'}, HTTP_X_FORWARDED_FOR='203.0.113.7')
+
+        self.assertIn('IP=203.0.113.7, Path=/api/products/', logs.output[0])
+
+    def test_ordinary_request_is_not_logged(self):
+        with self.assertNoLogs('django.security', 'WARNING'):
+            self.client.get('/api/products/', {'search': 'phone'})
+
+
+class TwoTierRateLimiterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.clock = FakeClock()
+        patcher = mock.patch('users.ratelimit.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.shared = RateLimiter(prefix='test_rate_limit')
+        self.limiter = TwoTierRateLimiter(self.shared, batch=10, max_age=1.0)
+
+    def test_slow_client_under_limit_is_never_refused(self):
+        # 1000/day, one request every 10 s: 500 requests stay well under the limit
+        for _ in range(500):
+            self.assertTrue(self.limiter.hit('client', 1000, 86400).allowed)
+            self.clock.now += 10
+
+    def test_fast_client_is_served_from_leases(self):
+        with mock.patch.object(self.shared, 'hit', wraps=self.shared.hit) as shared_hit:
+            for _ in range(100):
+                self.assertTrue(self.limiter.hit('client', 1000, 86400).allowed)
+                self.clock.now += 0.01
+
+        self.assertLess(shared_hit.call_count, 30)
+
+
+@override_settings(CLERK_JWT_LEEWAY=5, CLERK_STALE_IDENTITY_TTL=900)
+class StaleIdentityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.clock = FakeClock()
+        patcher = mock.patch('users.authentication.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.auth = ClerkAuthentication()
+        self.cache_key = token_cache_key('token')
+
+    def verify(self, verify_token):
+        with mock.patch.object(self.auth, 'verify_token', verify_token):
+            return self.auth.verify_and_cache('token', self.cache_key)
+
+    def verify_then_lose_clerk(self, expires_in):
+        self.verify(mock.Mock(return_value=('user_1', self.clock.now + expires_in)))
+        cache.delete(self.cache_key)
+        return mock.Mock(side_effect=ClerkUnavailable())
+
+    def test_recently_verified_token_is_served_while_clerk_is_down(self):
+        unavailable = self.verify_then_lose_clerk(expires_in=60)
+
+        self.clock.now += 60 + 5
+        self.assertEqual(self.verify(unavailable), 'user_1')
+
+    def test_expired_token_is_not_served_stale(self):
+        unavailable = self.verify_then_lose_clerk(expires_in=60)
+
+        self.clock.now += 60 + 5 + 1
+        with self.assertRaises(ClerkUnavailable):
+            self.verify(unavailable)
+
+    def test_waits_for_verification_running_in_another_worker(self):
+        cache.add(f'{self.cache_key}:verifying', 1)
+        verify_token = mock.Mock()
+
+        def other_worker_finishes(seconds):
+            cache.set(self.cache_key, 'user_1')
+            cache.delete(f'{self.cache_key}:verifying')
+
+        with mock.patch.object(self.clock, 'sleep', side_effect=other_worker_finishes):
+            self.assertEqual(self.verify(verify_token), 'user_1')
+        verify_token.assert_not_called()
+
+    def test_token_without_exp_is_not_served_stale(self):
+        self.verify(mock.Mock(return_value=('user_1', None)))
+        cache.delete(self.cache_key)
+
+        with self.assertRaises(ClerkUnavailable):
+            self.verify(mock.Mock(side_effect=ClerkUnavailable()))
+
+
+class ClerkStub(ThreadingHTTPServer):
+    """Local stand-in for Clerk's GET /users (limit/offset paging)"""
+
+    def __init__(self, users):
+        self.users = users
+        super().__init__(('127.0.0.1', 0), ClerkStubHandler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+class ClerkStubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        offset, limit = int(query['offset'][0]), int(query['limit'][0])
+        body = json.dumps(self.server.users[offset:offset + limit]).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def clerk_user(n, **overrides):
+    return {
+        'id': f'user_{n}', 'username': f'member{n}', 'first_name': f'First{n}', 'last_name': f'Last{n}',
+        'image_url': '', 'email_addresses': [{'email_address': f'member{n}@example.com'}], **overrides,
+    }
+
+
+class SyncClerkUsersTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.state_file = os.path.join(directory.name, 'sync.json')
+
+    def sync(self, users):
+        stub = ClerkStub(users)
+        self.addCleanup(stub.server_close)
+        self.addCleanup(stub.shutdown)
+        out = StringIO()
+        call_command('sync_clerk_users', api_url=stub.url, batch_size=2, state_file=self.state_file, stdout=out)
+        return out.getvalue()
+
+    def test_creates_updates_and_clears_fields(self):
+        User.objects.create(username='member1', clerk_id='user_1', first_name='Old', last_name='Last1',
+                            email='member1@example.com')
+        User.objects.create(username='member2', clerk_id='user_2', first_name='First2', last_name='Gone',
+                            email='member2@example.com')
+
+        output = self.sync([clerk_user(1), clerk_user(2, last_name=None), clerk_user(3), clerk_user(4), clerk_user(5)])
+
+        self.assertIn('3 created, 2 updated, 0 unchanged, 0 skipped', output)
+        self.assertEqual(User.objects.get(clerk_id='user_1').first_name, 'First1')
+        self.assertEqual(User.objects.get(clerk_id='user_2').last_name, '')
+        self.assertEqual(User.objects.filter(clerk_id__startswith='user_').count(), 5)
+        self.assertFalse(os.path.exists(self.state_file))
+
+    def test_user_provisioned_meanwhile_is_reported_as_skipped(self):
+        bulk_create = User.objects.bulk_create
+
+        def sign_in_first(users, **kwargs):
+            # user_2 signs in between the page read and the bulk insert
+            User.objects.create(username='signed_in', clerk_id='user_2')
+            return bulk_create(users, **kwargs)
+
+        with mock.patch.object(User.objects, 'bulk_create', side_effect=sign_in_first):
+            output = self.sync([clerk_user(1), clerk_user(2)])
+
+        self.assertIn('1 created, 0 updated, 0 unchanged, 1 skipped', output)
+        self.assertEqual(User.objects.get(clerk_id='user_2').username, 'signed_in')
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs concurrent transactions')
+class ConcurrentProvisioningTests(TransactionTestCase):
+    def test_concurrent_first_logins_create_one_user(self):
+        workers = 8
+        barrier = threading.Barrier(workers)
+        results = []
+
+        def login():
+            try:
+                barrier.wait()
+                results.append(provision_user('user_new', CLERK_USER)[1])
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=login) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(results), [False] * (workers - 1) + [True])
+        self.assertEqual(User.objects.filter(clerk_id='user_new').count(), 1)
@@ -0,0 +1,37 @@
+# users/throttling.py
+from rest_framework import throttling
+
+from .ratelimit import local_limiter
+
+
+class LimiterThrottleMixin:
+    """
+    Run a DRF SimpleRateThrottle through the shared rate limiter (behind
+    the in-process pre-filter) instead of its request-history list, and
+    wait() (DRF's Retry-After) comes from the limiter's real window.
+    """
+    cost = 1
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.result = local_limiter.hit(self.key, self.num_requests, self.duration, cost=self.cost)
+        return self.result.allowed
+
+    def wait(self):
+        result = getattr(self, 'result', None)
+        return result.retry_after if result is not None else None
+
+
+class AnonRateThrottle(LimiterThrottleMixin, throttling.AnonRateThrottle):
+    pass
+
+
+class UserRateThrottle(LimiterThrottleMixin, throttling.UserRateThrottle):
+    pass
+
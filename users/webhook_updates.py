@@ -0,0 +1,141 @@
+# users/webhook_updates.py
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+
+from backend.redis_client import get_redis_connection
+from .profile_sync import apply_profile, mark_profile_synced
+
+logger = logging.getLogger(__name__)
+
+# Sorted set of clerk_id -> time its buffered update is due. It outlives the
+# process that scheduled the flush, so any worker can apply an update whose
+# timer died with a restart.
+DUE_KEY = 'clerk_webhook_updates:due'
+
+
+# Merge an event into the buffered state and schedule its flush in one
+# step, so concurrent events for a user can neither overwrite a newer state
+# with an older one nor both start a timer. The buffer is a hash of the
+# event's version (updated_at) and its JSON payload.
+# Returns 1 if this event scheduled the flush, 0 if one was already due,
+# -1 if a newer event is already buffered.
+QUEUE_SCRIPT = """
+local buffered = tonumber(redis.call('HGET', KEYS[1], 'version'))
+if buffered and buffered > tonumber(ARGV[1]) then
+    return -1
+end
+redis.call('HSET', KEYS[1], 'version', ARGV[1], 'data', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return redis.call('ZADD', KEYS[2], 'NX', ARGV[4], ARGV[5])
+"""
+
+
+def pending_key(clerk_id):
+    return f'clerk_webhook_update:{clerk_id}'
+
+
+def event_version(clerk_user_data):
+    """Clerk's updated_at (ms) orders events that arrive out of order"""
+    return clerk_user_data.get('updated_at') or 0
+
+
+def apply_user_update(clerk_id, clerk_user_data):
+    """
+    Apply the latest Clerk state of a user with a field-diff UPDATE.
+    A username already taken locally is skipped rather than failing the
+    rest of the profile. Returns the names of the updated fields.
+    """
+    try:
+        with transaction.atomic():
+            changed = apply_profile(clerk_id, clerk_user_data, include_username=True)
+    except IntegrityError:
+        logger.warning('Username %s is taken, keeping the local one for %s', clerk_user_data.get('username'), clerk_id)
+        changed = apply_profile(clerk_id, clerk_user_data)
+
+    mark_profile_synced(clerk_id)
+    if not changed:
+        logger.info('No profile changes for %s', clerk_id)
+    return changed
+
+
+def flush_user_update(clerk_id, redis=None):
+    """
+    Apply whatever state was buffered last for this user, if this caller
+    is the one that takes it off the due set
+    """
+    redis = redis or get_redis_connection()
+    # Claim first, so an event arriving now schedules a new flush
+    if not redis.zrem(DUE_KEY, clerk_id):
+        return
+    try:
+        payload = redis.hget(pending_key(clerk_id), 'data')
+        if payload is not None:
+            apply_user_update(clerk_id, json.loads(payload))
+    except Exception as e:
+        logger.error('Applying buffered Clerk update for %s failed: %s', clerk_id, e, exc_info=True)
+
+
+def flush_due_updates(redis=None, limit=100):
+    """
+    Apply every buffered update that is due, whoever scheduled it. Run by
+    each timer and by the flush_clerk_updates sweeper, so updates whose
+    timer was lost to a restart are still applied. Returns how many were due.
+    """
+    redis = redis or get_redis_connection()
+    if redis is None:
+        return 0
+    due = redis.zrangebyscore(DUE_KEY, '-inf', time.time(), start=0, num=limit)
+    for member in due:
+        flush_user_update(member.decode() if isinstance(member, bytes) else member, redis)
+    return len(due)
+
+
+def _flush_timer(clerk_id):
+    """Timer callback: flush this user, then anything else that is overdue"""
+    try:
+        redis = get_redis_connection()
+        flush_user_update(clerk_id, redis)
+        flush_due_updates(redis)
+    except Exception as e:
+        logger.error('Flushing buffered Clerk updates failed: %s', e, exc_info=True)
+    finally:
+        # Runs on a timer thread: don't leave its DB connection open
+        connections.close_all()
+
+
+def queue_user_update(clerk_id, clerk_user_data):
+    """
+    Buffer a user.updated event for CLERK_WEBHOOK_COALESCE_WINDOW seconds.
+    Every event in the window replaces the buffered state (older ones by
+    updated_at are dropped) and one flush writes only the latest.
+
+    The flush is due in DUE_KEY in Redis; the worker that saw the first
+    event also starts a timer for it. If that worker restarts first, the
+    flush_clerk_updates sweeper or a timer on any worker applies it. Without
+    Redis the buffer would die with the process, so updates are applied inline.
+    """
+    window = settings.CLERK_WEBHOOK_COALESCE_WINDOW
+    redis = get_redis_connection() if window > 0 else None
+    if redis is None:
+        apply_user_update(clerk_id, clerk_user_data)
+        return
+
+    scheduled = redis.register_script(QUEUE_SCRIPT)(
+        keys=[pending_key(clerk_id), DUE_KEY],
+        args=[
+            event_version(clerk_user_data), json.dumps(clerk_user_data),
+            # Kept long enough for a sweep after a restart to still find it
+            int(window) + 3600, repr(time.time() + window), clerk_id,
+        ],
+    )
+    if scheduled == -1:
+        logger.info('Ignoring out-of-order user.updated for %s', clerk_id)
+    elif scheduled:
+        timer = threading.Timer(window, _flush_timer, args=(clerk_id,))
+        timer.daemon = True
+        timer.start()
@@ -4,24 +4,60 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 import json
 import logging
+from django.conf import settings
 from .models import User
+from .profile_sync import mark_profile_synced
+from .provisioning import provision_user
+from .webhook_updates import queue_user_update
 
 logger = logging.getLogger(__name__)
 
+# Personal data in Clerk user objects; replaced before payloads are logged
+REDACTED_KEYS = {
+    'email_address', 'phone_number', 'first_name', 'last_name', 'username',
+    'image_url', 'profile_image_url', 'web3_wallet', 'ip_address', 'user_agent',
+    'private_metadata', 'unsafe_metadata', 'public_metadata', 'external_accounts',
+    'password_enabled', 'backup_codes', 'totp_enabled',
+}
+
+
+def redact(value):
+    if isinstance(value, dict):
+        return {
+            key: '[redacted]' if key in REDACTED_KEYS and item else redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(item) for item in value]
+    return value
+
+
+class LoggablePayload:
+    """
+    Redacted payload as JSON, cut to CLERK_WEBHOOK_LOG_MAX_CHARS. Rendered
+    only if the log record is actually emitted.
+    """
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def __str__(self):
+        text = json.dumps(redact(self.payload), separators=(',', ':'))
+        limit = settings.CLERK_WEBHOOK_LOG_MAX_CHARS
+        if len(text) > limit:
+            text = f'{text[:limit]}... ({len(text)} chars)'
+        return text
+
+
 @csrf_exempt
 @require_POST
 def clerk_webhook(request):
     try:
-        # Log the raw payload for debugging
-        raw_body = request.body.decode('utf-8')
-        logger.info(f"Received webhook payload: {raw_body}")
-        
-        payload = json.loads(raw_body)
+        payload = json.loads(request.body.decode('utf-8'))
         event_type = payload.get('type')
         data = payload.get('data')
         
-        logger.info(f"Event type: {event_type}")
-        logger.info(f"Data: {data}")
+        logger.info('Received webhook %s: %s', event_type, LoggablePayload(payload))
         
         if not event_type:
             logger.error("No event type found in payload")
@@ -39,40 +75,18 @@ def clerk_webhook(request):
                 logger.error("No clerk_id found in user.created event")
                 return JsonResponse({'error': 'No user id found'}, status=400)
             
-            # Check if user already exists
-            if User.objects.filter(clerk_id=clerk_id).exists():
-                logger.info(f"User with clerk_id {clerk_id} already exists, skipping creation")
-                return JsonResponse({'status': 'success', 'message': 'User already exists'})
-            
-            email_addresses = data.get('email_addresses', [])
-            email = email_addresses[0].get('email_address') if email_addresses else ''
-            
-            # Generate unique username
-            base_username = data.get('username')
-            if not base_username:
-                base_username = email.split('@')[0] if email else f"user_{clerk_id[:8]}"
-            
-            # Ensure username is unique
-            username = base_username
-            counter = 1
-            while User.objects.filter(username=username).exists():
-                username = f"{base_username}{counter}"
-                counter += 1
-            
             try:
-                user = User.objects.create(
-                    clerk_id=clerk_id,
-                    username=username,
-                    email=email,
-                    first_name=data.get('first_name', ''),
-                    last_name=data.get('last_name', ''),
-                    avatar=data.get('image_url', ''),
-                )
-                logger.info(f"User created: {user.username} (clerk_id: {clerk_id})")
+                user, created = provision_user(clerk_id, data)
             except Exception as e:
-                logger.error(f"Error creating user: {str(e)}")
+                logger.error('Error creating user: %s', e)
                 return JsonResponse({'error': f'Failed to create user: {str(e)}'}, status=400)
             
+            mark_profile_synced(clerk_id)
+            if not created:
+                logger.info('User with clerk_id %s already exists, skipping creation', clerk_id)
+                return JsonResponse({'status': 'success', 'message': 'User already exists'})
+            logger.info('User created: %s (clerk_id: %s)', user.username, clerk_id)
+            
         elif event_type == 'user.updated':
             # Update existing user
             clerk_id = data.get('id')
@@ -81,25 +95,8 @@ def clerk_webhook(request):
                 logger.error("No clerk_id found in user.updated event")
                 return JsonResponse({'error': 'No user id found'}, status=400)
             
-            try:
-                user = User.objects.get(clerk_id=clerk_id)
-                email_addresses = data.get('email_addresses', [])
-                
-                if data.get('username'):
-                    user.username = data.get('username')
-                if email_addresses:
-                    user.email = email_addresses[0].get('email_address', user.email)
-                if data.get('first_name'):
-                    user.first_name = data.get('first_name')
-                if data.get('last_name'):
-                    user.last_name = data.get('last_name')
-                if data.get('image_url'):
-                    user.avatar = data.get('image_url')
-                
-                user.save()
-                logger.info(f"User updated: {user.username}")
-            except User.DoesNotExist:
-                logger.warning(f"User with clerk_id {clerk_id} not found for update")
+            # Bursts of updates for one user are applied once, latest state only
+            queue_user_update(clerk_id, data)
                 
         elif event_type == 'user.deleted':
             # Handle user deletion
@@ -113,18 +110,18 @@ def clerk_webhook(request):
                 user = User.objects.get(clerk_id=clerk_id)
                 user.is_active = False
                 user.save()
-                logger.info(f"User deactivated: {user.username}")
+                logger.info('User deactivated: %s', user.username)
             except User.DoesNotExist:
-                logger.warning(f"User with clerk_id {clerk_id} not found for deletion")
+                logger.warning('User with clerk_id %s not found for deletion', clerk_id)
         
         else:
-            logger.warning(f"Unhandled event type: {event_type}")
+            logger.warning('Unhandled event type: %s', event_type)
         
         return JsonResponse({'status': 'success'})
         
     except json.JSONDecodeError as e:
-        logger.error(f"JSON decode error: {str(e)}")
+        logger.error('JSON decode error: %s', e)
         return JsonResponse({'error': 'Invalid JSON payload'}, status=400)
     except Exception as e:
-        logger.error(f"Webhook error: {str(e)}", exc_info=True)
+        logger.error('Webhook error: %s', e, exc_info=True)
         return JsonResponse({'error': str(e)}, status=400)
\ No newline at end of file